@@ -0,0 +1,160 @@
+import calendar
+import hashlib
+from datetime import date
+
+from django.db.models import F, Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition, require_GET
+
+from .calendars import month_counts
+from .decorators import api_role_required
+from .models import Appointment
+from .pagination import paginate
+from .schedule_cache import schedule_version
+
+# JSON read endpoints for kiosk/mobile clients that poll. Every response
+# carries a strong ETag built from the user's schedule version, a database
+# row changed with each change to one of their appointments (see
+# accounts.schedule_cache). Every worker computes the same ETag, and an
+# unchanged poll is answered with 304 after that one row is read.
+
+FIELDS = ("id", "date", "start_time", "end_time", "status", "reason")
+
+SECTIONS = {
+    # section: (cursor order descending, is the upcoming side)
+    "upcoming": (False, True),
+    "past": (True, False),
+    "completed": (True, False),
+}
+PATIENT_SECTIONS = ("upcoming", "past")
+PROVIDER_SECTIONS = ("upcoming", "completed")
+
+
+def _now(request):
+    # Minute resolution, shared by the ETag and the view of one request
+    if not hasattr(request, "_api_now"):
+        request._api_now = timezone.localtime().replace(second=0, microsecond=0)
+    return request._api_now
+
+
+def _etag(request, *parts):
+    raw = ":".join(str(part) for part in (request.user.id, schedule_version(request.user.id), *parts))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _list_etag(sections):
+    def etag(request, *args, **kwargs):
+        if request.GET.get("section", "upcoming") not in sections:
+            return None
+        # Upcoming/past move with the clock as well as with the schedule
+        return _etag(request, request.get_full_path(), _now(request).isoformat())
+    return etag
+
+
+def _valid_month(year, month):
+    return 1 <= year <= 9999 and 1 <= month <= 12
+
+
+def _month_etag(request, year, month):
+    if not _valid_month(year, month):
+        return None
+    return _etag(request, "month", year, month)
+
+
+def _json(data, status=200):
+    response = JsonResponse(data, status=status, json_dumps_params={"separators": (",", ":")})
+    # Clients may keep it, but must revalidate with If-None-Match
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def patient_rows(user_id):
+    return Appointment.objects.filter(patient_id=user_id).values(
+        *FIELDS,
+        provider_first_name=F("provider__first_name"),
+        provider_last_name=F("provider__last_name"),
+        designation=F("provider__designation"),
+    )
+
+
+def provider_rows(user_id):
+    return Appointment.objects.filter(provider_id=user_id).values(
+        *FIELDS,
+        patient_first_name=F("patient__first_name"),
+        patient_last_name=F("patient__last_name"),
+    )
+
+
+def section_rows(appointments, section, now):
+    """The section's rows and whether its cursor order is descending."""
+    upcoming = Q(date__gt=now.date()) | Q(date=now.date(), end_time__gte=now.time())
+    descending, is_upcoming = SECTIONS[section]
+    return appointments.filter(upcoming if is_upcoming else ~upcoming), descending
+
+
+def _section_page(request, appointments, sections):
+    section = request.GET.get("section", "upcoming")
+    if section not in sections:
+        return None
+
+    appointments, descending = section_rows(appointments, section, _now(request))
+    return paginate(appointments, request.GET, "cursor", descending=descending)
+
+
+def _page_json(page):
+    return _json({
+        "results": page.items,
+        "next": page.next_cursor,
+        "prev": page.prev_cursor,
+    })
+
+
+# ---------------------------
+# Patient
+# ---------------------------
+
+@require_GET
+@api_role_required("patient")
+@condition(etag_func=_list_etag(PATIENT_SECTIONS))
+def patient_appointments(request):
+    page = _section_page(request, patient_rows(request.user.id), PATIENT_SECTIONS)
+    if page is None:
+        return _json({"error": "section must be upcoming or past."}, status=400)
+    return _page_json(page)
+
+
+# ---------------------------
+# Provider
+# ---------------------------
+
+@require_GET
+@api_role_required("provider")
+@condition(etag_func=_list_etag(PROVIDER_SECTIONS))
+def provider_appointments(request):
+    page = _section_page(request, provider_rows(request.user.id), PROVIDER_SECTIONS)
+    if page is None:
+        return _json({"error": "section must be upcoming or completed."}, status=400)
+    return _page_json(page)
+
+
+@require_GET
+@api_role_required("provider")
+@condition(etag_func=_month_etag)
+def provider_month(request, year, month):
+    if not _valid_month(year, month):
+        return _json({"error": "Invalid month."}, status=400)
+
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+    counts = month_counts(request.user, first, last)
+
+    return _json({
+        "year": year,
+        "month": month,
+        "days": [
+            {"date": day, "total": sum(by_status.values()), "statuses": by_status}
+            for day, by_status in sorted(counts.items())
+        ],
+    })
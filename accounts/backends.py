@@ -0,0 +1,54 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import router
+
+from .models import User
+
+# AuthenticationMiddleware loads request.user on every page just so
+# role_required() can read user.role. This backend keeps a slim record per
+# user in the shared cache (settings.CACHES) instead of reading the row:
+#
+#   id, username, names, role and flags, plus the session auth hash, so
+#   django.contrib.auth can still log out sessions after a password change
+#   without the password hash itself ever being cached.
+#
+# The user is rebuilt with every other field deferred; reading one loads
+# it on demand. Records are dropped from accounts.signals whenever a User
+# is saved or deleted, and expire after USER_CACHE_TTL as a backstop for
+# queryset update()s.
+
+USER_CACHE_TTL = 600
+
+# In model field order, as Model.from_db() expects
+SLIM_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {
+        "id", "username", "first_name", "last_name", "role",
+        "is_active", "is_staff", "is_superuser",
+    }
+]
+
+
+def _key(user_id):
+    return f"auth-user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+
+    def get_user(self, user_id):
+        record = cache.get(_key(user_id))
+        if record is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                values = [getattr(user, name) for name in SLIM_FIELDS]
+                cache.set(_key(user_id), (values, user.get_session_auth_hash()), USER_CACHE_TTL)
+            return user
+
+        values, session_auth_hash = record
+        user = User.from_db(router.db_for_read(User), SLIM_FIELDS, values)
+        user._session_auth_hash = session_auth_hash
+        return user if self.user_can_authenticate(user) else None
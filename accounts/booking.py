@@ -0,0 +1,231 @@
+from django.db import IntegrityError, connection, transaction
+
+from . import occupancy
+from .models import Appointment, User
+from .schedule_cache import bump_schedule_version
+
+# Exclusion constraints added by migration 0003 (Postgres only)
+PROVIDER_OVERLAP = "appointment_provider_no_overlap"
+PATIENT_OVERLAP = "appointment_patient_no_overlap"
+
+
+class BookingConflict(Exception):
+    def __init__(self, constraint):
+        super().__init__(constraint)
+        self.constraint = constraint
+
+
+def has_exclusion_constraints():
+    return connection.vendor == "postgresql"
+
+
+def _violated_constraint(error):
+    diag = getattr(error.__cause__, "diag", None)
+    return getattr(diag, "constraint_name", None)
+
+
+def _lock(user_id):
+    # Serialises the writes to one user's schedule (and bitmaps), bulk
+    # decisions included
+    list(User.objects.select_for_update().filter(id=user_id).values_list("id"))
+
+
+def _write(save, user_id, constraint, conflicts):
+    # Both backends lock the user row first. Postgres: the database rejects
+    # overlaps. Other backends: check the occupancy bitmap, then write.
+    if has_exclusion_constraints():
+        try:
+            with transaction.atomic():
+                _lock(user_id)
+                save()
+        except IntegrityError as e:
+            if _violated_constraint(e) in (PROVIDER_OVERLAP, PATIENT_OVERLAP):
+                raise BookingConflict(_violated_constraint(e)) from e
+            raise
+        return
+
+    with transaction.atomic():
+        _lock(user_id)
+        if conflicts():
+            raise BookingConflict(constraint)
+        save()
+
+
+def _save_fields(appointment, **changes):
+    # Apply changes and save only those columns; undo them on conflict
+    original = {field: getattr(appointment, field) for field in changes}
+    for field, value in changes.items():
+        setattr(appointment, field, value)
+
+    def save():
+        appointment.save(update_fields=list(changes))
+
+    return save, original
+
+
+def _restore(appointment, original):
+    for field, value in original.items():
+        setattr(appointment, field, value)
+
+
+# ---------------------------
+# Booking operations
+# ---------------------------
+
+def book_appointment(patient, provider, day, start_time, end_time, reason):
+    appointment = Appointment(
+        patient=patient,
+        provider=provider,
+        date=day,
+        start_time=start_time,
+        end_time=end_time,
+        reason=reason,
+        status='pending'
+    )
+
+    def patient_conflict():
+        return not occupancy.is_free(patient.id, "patient", day, start_time, end_time)
+
+    _write(appointment.save, patient.id, PATIENT_OVERLAP, patient_conflict)
+    return appointment
+
+
+def reschedule_appointment(appointment, day, start_time, end_time):
+    current_slot = (appointment.date, appointment.start_time, appointment.end_time)
+
+    def patient_conflict():
+        return not occupancy.is_free(
+            appointment.patient_id, "patient", day, start_time, end_time, ignore=current_slot
+        )
+
+    save, original = _save_fields(
+        appointment,
+        date=day,
+        start_time=start_time,
+        end_time=end_time,
+        status="reschedule_requested"
+    )
+    try:
+        _write(save, appointment.patient_id, PATIENT_OVERLAP, patient_conflict)
+    except BookingConflict:
+        _restore(appointment, original)
+        raise
+    return appointment
+
+
+def approve_appointment(appointment):
+    current_slot = None
+    if appointment.status == "approved":
+        current_slot = (appointment.date, appointment.start_time, appointment.end_time)
+
+    def provider_conflict():
+        return not occupancy.is_free(
+            appointment.provider_id, "provider",
+            appointment.date, appointment.start_time, appointment.end_time,
+            ignore=current_slot
+        )
+
+    save, original = _save_fields(appointment, status="approved")
+    try:
+        _write(save, appointment.provider_id, PROVIDER_OVERLAP, provider_conflict)
+    except BookingConflict:
+        _restore(appointment, original)
+        raise
+    return appointment
+
+
+# ---------------------------
+# Bulk decisions
+# ---------------------------
+
+DECIDABLE_STATUSES = ("pending", "reschedule_requested")
+
+
+def decide_appointments(provider, action, ids=None, date_from=None, date_to=None):
+    """
+    Approve or reject many of ``provider``'s appointments in one transaction:
+    the given ``ids``, or everything still pending in [date_from, date_to].
+    Returns (appointment, outcome) pairs in schedule order; outcome is
+    "approved", "rejected", "clash" or "skipped" (already decided). Ids that
+    don't belong to the provider come back as (id, "not_found").
+
+    Approvals are settled in memory against the approved schedule of the
+    affected days, loaded once: earliest-created wins, later overlapping
+    requests are reported as clashes.
+    """
+    rows = Appointment.objects.filter(provider=provider)
+    if ids is not None:
+        rows = rows.filter(id__in=ids)
+    else:
+        rows = rows.filter(date__gte=date_from, date__lte=date_to, status__in=DECIDABLE_STATUSES)
+
+    try:
+        outcomes, appointments = _decide(provider, action, rows)
+    except IntegrityError as e:
+        # Postgres: a concurrent single approval won the slot first
+        if _violated_constraint(e) == PROVIDER_OVERLAP:
+            raise BookingConflict(PROVIDER_OVERLAP) from e
+        raise
+
+    results = sorted(
+        ((appointment, outcomes[appointment.id]) for appointment in appointments),
+        key=lambda result: (result[0].date, result[0].start_time, result[0].id)
+    )
+    found = {appointment.id for appointment in appointments}
+    results.extend((pk, "not_found") for pk in sorted(set(ids or ()) - found))
+    return results
+
+
+def _decide(provider, action, rows):
+    with transaction.atomic():
+        # Same lock as single approvals, plus the rows themselves
+        _lock(provider.id)
+        appointments = list(rows.select_for_update(of=("self",)).select_related("patient").only(
+            "patient_id", "provider_id", "date", "start_time", "end_time", "status", "created_at",
+            "patient__first_name", "patient__last_name"
+        ).order_by("created_at", "id"))
+
+        outcomes = {}
+        pending = []
+        for appointment in appointments:
+            if appointment.status in DECIDABLE_STATUSES:
+                pending.append(appointment)
+            else:
+                outcomes[appointment.id] = "skipped"
+
+        if action == "approve":
+            keys = {(provider.id, "provider", appointment.date) for appointment in pending}
+            masks = occupancy.load_masks(keys)
+            for appointment in pending:
+                key = (provider.id, "provider", appointment.date)
+                slot = occupancy.slot_mask(appointment.start_time, appointment.end_time)
+                if masks[key] & slot:
+                    outcomes[appointment.id] = "clash"
+                else:
+                    masks[key] |= slot
+                    outcomes[appointment.id] = "approved"
+            new_status = "approved"
+        else:
+            outcomes.update((appointment.id, "rejected") for appointment in pending)
+            new_status = "rejected"
+
+        decided = [appointment for appointment in pending if outcomes[appointment.id] == new_status]
+        Appointment.objects.filter(id__in=[a.id for a in decided]).update(status=new_status)
+        for appointment in decided:
+            appointment.status = new_status
+
+        # update() skips the signals: approvals add their bits to the provider
+        # bitmaps, rejections take theirs out of the patients' ones
+        changes = {}
+        for appointment in decided:
+            slot = occupancy.slot_mask(appointment.start_time, appointment.end_time)
+            if action == "approve":
+                key = (provider.id, "provider", appointment.date)
+                changes[key] = (0, changes.get(key, (0, 0))[1] | slot)
+            else:
+                key = (appointment.patient_id, "patient", appointment.date)
+                changes[key] = (changes.get(key, (0, 0))[0] | slot, 0)
+        occupancy.update_masks(changes)
+        bump_schedule_version(provider.id, *(a.patient_id for a in decided))
+
+    return outcomes, appointments
@@ -0,0 +1,92 @@
+import calendar
+from datetime import date
+
+from django.db.models import Count
+from django.urls import reverse
+
+from .models import Appointment
+
+STATUS_LABELS = dict(Appointment.STATUS_CHOICES)
+
+
+def shift_month(year, month, offset):
+    # (year, month) moved by ``offset`` months, either direction
+    index = year * 12 + (month - 1) + offset
+    return index // 12, index % 12 + 1
+
+
+def status_counts(provider, first, last):
+    # One GROUP BY (date, status) query over the date range
+    return Appointment.objects.filter(
+        provider=provider,
+        date__gte=first,
+        date__lte=last
+    ).values("date", "status").annotate(total=Count("id")).order_by()
+
+
+def month_counts(provider, first, last):
+    # {date: {status: count}}
+    counts = {}
+    for row in status_counts(provider, first, last):
+        counts.setdefault(row["date"], {})[row["status"]] = row["total"]
+    return counts
+
+
+async def amonth_counts(provider, first, last):
+    counts = {}
+    async for row in status_counts(provider, first, last):
+        counts.setdefault(row["date"], {})[row["status"]] = row["total"]
+    return counts
+
+
+def _cell(day, counts, today):
+    by_status = counts.get(day, {})
+    return {
+        "day": day.day,
+        "total": sum(by_status.values()),
+        "statuses": [
+            {"status": status, "label": label, "count": by_status[status]}
+            for status, label in STATUS_LABELS.items()
+            if by_status.get(status)
+        ],
+        "is_today": day == today,
+        "url": reverse("provider_calendar_day", args=[day.year, day.month, day.day]),
+    }
+
+
+def _month_range(year, month, count):
+    first = date(year, month, 1)
+    last_year, last_month = shift_month(year, month, count - 1)
+    last = date(last_year, last_month, calendar.monthrange(last_year, last_month)[1])
+    return first, last
+
+
+def _grids(year, month, count, today, counts):
+    cal = calendar.Calendar()
+    months = []
+    for offset in range(count):
+        y, m = shift_month(year, month, offset)
+        months.append({
+            "year": y,
+            "month": m,
+            "name": calendar.month_name[m],
+            "weeks": [
+                [_cell(day, counts, today) if day.month == m else None for day in week]
+                for week in cal.monthdatescalendar(y, m)
+            ],
+        })
+    return months
+
+
+def build_months(provider, year, month, count, today):
+    """
+    Month grids for ``count`` months starting at (year, month). Each grid is
+    a list of weeks (Monday first) of cell dicts, None for padding days.
+    """
+    counts = month_counts(provider, *_month_range(year, month, count))
+    return _grids(year, month, count, today, counts)
+
+
+async def abuild_months(provider, year, month, count, today):
+    counts = await amonth_counts(provider, *_month_range(year, month, count))
+    return _grids(year, month, count, today, counts)
@@ -1,20 +1,70 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.contrib.auth.views import redirect_to_login
+from django.http import JsonResponse
 from django.shortcuts import redirect
-from django.contrib.auth.decorators import login_required
+
+from .tracing import span
+
+
+def _role_redirect(user, required_role):
+    # Redirect to user's correct dashboard
+    if user.role != required_role:
+        if user.role == 'admin':
+            return redirect('admin_dashboard')
+        elif user.role == 'patient':
+            return redirect('patient_dashboard')
+        elif user.role == 'provider':
+            return redirect('provider_dashboard')
+    return None
+
 
 def role_required(required_role):
     def decorator(view_func):
-        @login_required
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            with span("role_required", role=required_role):
+                user = request.user
+                if not user.is_authenticated:
+                    return redirect_to_login(request.get_full_path())
+                denied = _role_redirect(user, required_role)
+            return denied or view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def async_role_required(required_role):
+    # role_required() for async views. The session and user are loaded in a
+    # worker thread once, so the view and its templates never touch the
+    # database lazily from the event loop.
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            with span("role_required", role=required_role):
+                user = await sync_to_async(get_user)(request)
+                request.user = user
+
+                if not user.is_authenticated:
+                    return redirect_to_login(request.get_full_path())
+                denied = _role_redirect(user, required_role)
+            return denied or await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def api_role_required(required_role):
+    # JSON endpoints answer 401/403 instead of redirecting to a page
+    def decorator(view_func):
+        @functools.wraps(view_func)
         def wrapper(request, *args, **kwargs):
             user = request.user
 
+            if not user.is_authenticated:
+                return JsonResponse({"error": "Authentication required."}, status=401)
             if user.role != required_role:
-                # Redirect to user's correct dashboard
-                if user.role == 'admin':
-                    return redirect('admin_dashboard')
-                elif user.role == 'patient':
-                    return redirect('patient_dashboard')
-                elif user.role == 'provider':
-                    return redirect('provider_dashboard')
+                return JsonResponse({"error": "Not allowed for this role."}, status=403)
             return view_func(request, *args, **kwargs)
         return wrapper
     return decorator
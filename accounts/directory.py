@@ -0,0 +1,13 @@
+from .models import User
+from .tiered_cache import cached
+
+
+# Provider directory shared by provider_list and the appointment_add
+# dropdown; invalidated from accounts.signals when a provider changes.
+@cached("providers", ttl=300, stale_ttl=60)
+def provider_directory():
+    return list(
+        User.objects.filter(role='provider').order_by("id").values(
+            "id", "username", "first_name", "last_name", "designation"
+        )
+    )
@@ -0,0 +1,207 @@
+import csv
+import re
+import zipfile
+from datetime import datetime
+from xml.sax.saxutils import escape
+
+from django.http import StreamingHttpResponse
+
+from .models import Appointment
+
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    ("ID", "id"),
+    ("Date", "date"),
+    ("Start", "start_time"),
+    ("End", "end_time"),
+    ("Status", "status"),
+    ("Patient First Name", "patient__first_name"),
+    ("Patient Last Name", "patient__last_name"),
+    ("Patient Username", "patient__username"),
+    ("Provider First Name", "provider__first_name"),
+    ("Provider Last Name", "provider__last_name"),
+    ("Designation", "provider__designation"),
+    ("Reason", "reason"),
+    ("Created At", "created_at"),
+]
+
+
+# ---------------------------
+# Rows
+# ---------------------------
+
+def parse_filters(params):
+    # provider, date_from, date_to (YYYY-MM-DD) and status; ValueError if malformed
+    filters = {}
+    if params.get("provider"):
+        filters["provider_id"] = int(params["provider"])
+    if params.get("date_from"):
+        filters["date__gte"] = datetime.strptime(params["date_from"], "%Y-%m-%d").date()
+    if params.get("date_to"):
+        filters["date__lte"] = datetime.strptime(params["date_to"], "%Y-%m-%d").date()
+    if params.get("status"):
+        if params["status"] not in dict(Appointment.STATUS_CHOICES):
+            raise ValueError("Unknown status")
+        filters["status"] = params["status"]
+    return filters
+
+
+def export_queryset(filters):
+    # Names come from the join
+    return Appointment.objects.filter(**filters).order_by(
+        "date", "start_time", "id"
+    ).values_list(*(field for _, field in COLUMNS))
+
+
+def export_rows(filters):
+    # From a server-side cursor in chunks
+    return export_queryset(filters).iterator(chunk_size=CHUNK_SIZE)
+
+
+def _text(value):
+    if value is None:
+        return ""
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+# Spreadsheets read a cell starting with one of these as a formula
+_FORMULA_START = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _cell(value):
+    # Names and reasons are typed by patients: a leading ' keeps them text
+    text = _text(value)
+    if isinstance(value, str) and text.startswith(_FORMULA_START):
+        return "'" + text
+    return text
+
+
+# ---------------------------
+# CSV
+# ---------------------------
+
+class _Echo:
+    # csv.writer target that hands each line straight back
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for header, _ in COLUMNS])
+    for row in rows:
+        yield writer.writerow([_cell(value) for value in row])
+
+
+def csv_response(rows, filename):
+    response = StreamingHttpResponse(_csv_lines(rows), content_type="text/csv")
+    response["Content-Disposition"] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+# ---------------------------
+# XLSX
+# ---------------------------
+# Written as a zip stream: the package parts are tiny and fixed, the sheet
+# is produced row by row with inline strings, and compressed bytes are
+# yielded as they accumulate. No workbook is ever held in memory.
+
+_ILLEGAL_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Appointments" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _Sink:
+    # Unseekable file object; zipfile switches to streaming mode for it
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def _xlsx_row(values):
+    # Inline strings are text cells, never formulas; the ' is still added
+    # so a copy pasted or saved as CSV stays inert
+    cells = "".join(
+        f'<c t="inlineStr"><is><t xml:space="preserve">{escape(_ILLEGAL_XML.sub("", _cell(v)))}</t></is></c>'
+        for v in values
+    )
+    return f"<row>{cells}</row>".encode()
+
+
+def _xlsx_chunks(rows):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as book:
+        for name, content in _PARTS.items():
+            book.writestr(name, content)
+        yield sink.drain()
+
+        with book.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_xlsx_row(header for header, _ in COLUMNS))
+            for count, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row))
+                if count % CHUNK_SIZE == 0:
+                    yield sink.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield sink.drain()
+
+
+def xlsx_response(rows, filename):
+    response = StreamingHttpResponse(
+        _xlsx_chunks(rows),
+        content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}.xlsx"'
+    return response
@@ -0,0 +1,30 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+
+# Process pool for password hashing. Workers are spawned rather than
+# forked (the web process is threaded) and import this module before
+# django.setup() has run, so it must not import models.
+
+
+def _init_worker():
+    django.setup()
+
+
+def hashing_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+    )
+
+
+def hash_passwords(passwords, executor=None, workers=1):
+    """make_password() for each password, in order, across the pool if given."""
+    if executor is None:
+        return list(map(make_password, passwords))
+    # A few chunks per worker: fewer round trips, still evenly spread
+    chunksize = max(1, len(passwords) // (workers * 4))
+    return list(executor.map(make_password, passwords, chunksize=chunksize))
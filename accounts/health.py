@@ -0,0 +1,35 @@
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError
+from django.http import JsonResponse
+from django.utils.cache import add_never_cache_headers
+
+from . import warmup
+
+# Probes for the load balancer / orchestrator. Liveness only says the
+# process answers; readiness says this worker is warmed up and can reach
+# the database, so traffic is only sent to workers that can serve it.
+
+
+def _probe(data, status=200):
+    response = JsonResponse(data, status=status)
+    add_never_cache_headers(response)
+    return response
+
+
+async def liveness(request):
+    return _probe({"status": "alive"})
+
+
+def _ready():
+    if not warmup.is_warm():
+        warmup.warm_up()
+    else:
+        warmup.ping_database()
+
+
+async def readiness(request):
+    try:
+        await sync_to_async(_ready)()
+    except DatabaseError as e:
+        return _probe({"status": "unavailable", "error": str(e)}, status=503)
+    return _probe({"status": "ready"})
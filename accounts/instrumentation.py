@@ -0,0 +1,121 @@
+import glob
+import logging
+import os
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+# Execute wrappers that must see every query, on every connection and in
+# every thread (metrics, slow-query log). connection.execute_wrapper() only
+# covers one connection for one block; these are attached to each
+# connection when it opens, and to the ones already open.
+
+_wrappers = []
+
+
+def _attach(connection):
+    for wrapper in _wrappers:
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+
+def _on_connection_created(sender, connection, **kwargs):
+    _attach(connection)
+
+
+def add_query_wrapper(wrapper):
+    if wrapper in _wrappers:
+        return
+    if not _wrappers:
+        connection_created.connect(_on_connection_created)
+    _wrappers.append(wrapper)
+    for connection in connections.all(initialized_only=True):
+        _attach(connection)
+
+
+# ---------------------------
+# Per-process log files
+# ---------------------------
+
+# RotatingFileHandler can't share a file between processes: each one
+# rotates on its own and renames the file from under the others. Every
+# process (gunicorn worker) writes its own file instead, its pid before the
+# extension (slow.jsonl -> slow.1234.jsonl), and readers merge them.
+# Files of exited processes are kept for reading, the newest few of them.
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def process_path(path, pid=None):
+    stem, suffix = os.path.splitext(path)
+    return f"{stem}.{os.getpid() if pid is None else pid}{suffix}"
+
+
+def _process_files(path):
+    # {pid: [file, backups...]} of the per-process files for ``path``
+    stem, suffix = os.path.splitext(path)
+    pattern = re.compile(rf"{re.escape(stem)}\.(\d+){re.escape(suffix)}(\.\d+)?")
+    files = {}
+    for name in glob.glob(f"{glob.escape(stem)}.*"):
+        match = pattern.fullmatch(name)
+        if match:
+            files.setdefault(int(match.group(1)), []).append(name)
+    return files
+
+
+def log_files(path):
+    """Every file written for ``path``: each process's file and its backups."""
+    names = [name for group in _process_files(path).values() for name in group]
+    # A single-file log from before per-process files, or one named directly
+    names += [name for name in glob.glob(f"{glob.escape(path)}*") if re.fullmatch(rf"{re.escape(path)}(\.\d+)?", name)]
+    return sorted(names)
+
+
+def _prune(path, keep):
+    # Drop the files of all but the ``keep`` most recently written exited
+    # processes; workers are recycled, so their pids pile up
+    exited = [group for pid, group in _process_files(path).items() if not pid_alive(pid)]
+    exited.sort(key=lambda group: max(os.path.getmtime(name) for name in group), reverse=True)
+    for group in exited[keep:]:
+        for name in group:
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+
+class ProcessLog:
+    """JSON lines to this process's file for ``path``, rotated at max_bytes."""
+
+    def __init__(self, name):
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self._opened = None  # (path, pid) of the current handler
+        self._lock = threading.Lock()
+
+    def write(self, line, path, max_bytes, backup_count):
+        opened = (path, os.getpid())
+        with self._lock:
+            if opened != self._opened:
+                # Also after a fork: the parent's handler is for its own file
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                for handler in list(self.logger.handlers):
+                    self.logger.removeHandler(handler)
+                    handler.close()
+                _prune(path, keep=backup_count + 1)
+                self.logger.addHandler(RotatingFileHandler(
+                    process_path(path), maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8",
+                ))
+                self._opened = opened
+        self.logger.info(line)
@@ -0,0 +1,461 @@
+import io
+import json
+import math
+import os
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, RequestFactory, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from accounts.models import Appointment, User
+from accounts.onboarding import FIELDS
+from accounts.throttle import login_throttle
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class QueryTimer:
+    # execute_wrapper counting queries and their wall time
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.elapsed += time.perf_counter() - started
+
+
+class Scenario:
+    """
+    One benchmarked request. ``prepare(ctx, i)`` runs untimed before each
+    iteration and returns (method, path, data) or (method, path, data,
+    headers); use it to create throwaway rows for destructive endpoints.
+    """
+
+    def __init__(self, name, role, prepare):
+        self.name = name
+        self.role = role
+        self.prepare = prepare
+
+
+ROLES = {
+    "api_patient_appointments": "patient",
+    "api_provider_appointments": "provider",
+    "api_provider_month": "provider",
+}
+API_KWARGS = {
+    "api_provider_month": {"year": date.today().year, "month": date.today().month},
+}
+
+
+def get(path_fn):
+    return lambda ctx, i: ("get", path_fn(ctx, i), None)
+
+
+def throwaway_appointment(ctx, i, status="pending", patient=None):
+    day = date.today() + timedelta(days=400 + i)
+    return Appointment.objects.create(
+        patient=patient or ctx["spare_patient"],
+        provider=ctx["provider"],
+        date=day,
+        start_time="23:00",
+        end_time="23:30",
+        reason="Benchmark",
+        status=status,
+    )
+
+
+def throwaway_provider(ctx, i):
+    return User.objects.create(username=f"bench_tmp_provider_{time.time_ns()}", role="provider")
+
+
+def scenarios():
+    today = date.today()
+
+    def conflict_post(ctx, i):
+        appt = ctx["patient_upcoming"]
+        return ("post", reverse("appointment_add"), {
+            "provider": ctx["provider"].id,
+            "date": appt.date.isoformat(),
+            "start_time": appt.start_time.strftime("%H:%M"),
+            "end_time": appt.end_time.strftime("%H:%M"),
+            "reason": "Benchmark",
+        })
+
+    def booking_post(ctx, i):
+        return ("post", reverse("appointment_add"), {
+            "provider": ctx["provider"].id,
+            "date": (today + timedelta(days=500 + i)).isoformat(),
+            "start_time": "22:00",
+            "end_time": "22:30",
+            "reason": "Benchmark",
+        })
+
+    def reschedule_conflict(ctx, i):
+        appt = ctx["patient_upcoming"]
+        other = ctx["patient_other"]
+        return ("post", reverse("appointment_reschedule", args=[appt.id]), {
+            "date": other.date.isoformat(),
+            "start_time": other.start_time.strftime("%H:%M"),
+            "end_time": other.end_time.strftime("%H:%M"),
+        })
+
+    def approve_clash(ctx, i):
+        throwaway_appointment(ctx, i, status="approved")
+        clash = throwaway_appointment(ctx, i, patient=ctx["spare_patient_2"])
+        return ("get", reverse("approve_appointment", args=[clash.id]), None)
+
+    def approve_ok(ctx, i):
+        appt = throwaway_appointment(ctx, i)
+        return ("get", reverse("approve_appointment", args=[appt.id]), None)
+
+    def reject(ctx, i):
+        appt = throwaway_appointment(ctx, i)
+        return ("get", reverse("reject_appointment", args=[appt.id]), None)
+
+    def bulk_approve(ctx, i):
+        appts = [throwaway_appointment(ctx, i * 20 + n) for n in range(20)]
+        return ("post", reverse("provider_bulk_decide"), {"action": "approve", "ids": [a.id for a in appts]})
+
+    def delete_appointment(ctx, i):
+        appt = throwaway_appointment(ctx, i, patient=ctx["patient"])
+        return ("get", reverse("appointment_delete", args=[appt.id]), None)
+
+    def delete_provider(ctx, i):
+        return ("get", reverse("provider_delete", args=[throwaway_provider(ctx, i).id]), None)
+
+    def scrape_metrics(ctx, i):
+        return ("get", reverse("metrics"), None, {"authorization": f"Bearer {settings.METRICS['TOKEN']}"})
+
+    def bulk_add_providers(ctx, i):
+        # 5 new providers: validation, pooled hashing and one bulk insert
+        stamp = time.time_ns()
+        rows = [",".join(FIELDS)] + [
+            f"bench_up_{stamp}_{n},Bench,Provider,bench_up_{stamp}_{n}@example.com,GP,Secret-{n}"
+            for n in range(5)
+        ]
+        upload = SimpleUploadedFile("providers.csv", "\n".join(rows).encode(), content_type="text/csv")
+        return ("post", reverse("provider_bulk_add"), {"file": upload})
+
+    def revalidate(name):
+        # Poll that already holds the current ETag
+        def prepare(ctx, i):
+            client = Client()
+            client.force_login(ctx[ROLES[name]])
+            etag = client.get(reverse(name, kwargs=API_KWARGS.get(name)))["ETag"]
+            return ("get", reverse(name, kwargs=API_KWARGS.get(name)), None, {"if-none-match": etag})
+        return prepare
+
+    def login_post(ctx, i):
+        # Under the throttle limits, so the password is hashed every time
+        login_throttle.reset()
+        return ("post", reverse("login"), {"username": ctx["patient"].username, "password": "wrong"})
+
+    def login_throttled(ctx, i):
+        # Username bucket already empty: answered before any hashing
+        request = RequestFactory().post("/")
+        for _ in range(settings.LOGIN_THROTTLE["USERNAME"]["BURST"] + 1):
+            if not login_throttle.check(request, ctx["patient"].username):
+                login_throttle.failed(request, ctx["patient"].username)
+        return ("post", reverse("login"), {"username": ctx["patient"].username, "password": "wrong"})
+
+    return [
+        Scenario("liveness", None, get(lambda ctx, i: reverse("liveness"))),
+        Scenario("readiness", None, get(lambda ctx, i: reverse("readiness"))),
+        Scenario("metrics", None, scrape_metrics),
+        Scenario("signup", None, get(lambda ctx, i: reverse("signup"))),
+        Scenario("login", None, get(lambda ctx, i: reverse("login"))),
+        Scenario("login (POST, bad password)", None, login_post),
+        Scenario("login (POST, throttled)", None, login_throttled),
+        Scenario("logout", "logout", get(lambda ctx, i: reverse("logout"))),
+
+        Scenario("admin_dashboard", "admin", get(lambda ctx, i: reverse("admin_dashboard"))),
+        Scenario("provider_list", "admin", get(lambda ctx, i: reverse("provider_list"))),
+        Scenario("provider_add", "admin", get(lambda ctx, i: reverse("provider_add"))),
+        Scenario("provider_bulk_add", "admin", get(lambda ctx, i: reverse("provider_bulk_add"))),
+        Scenario("provider_bulk_add (POST, 5 rows)", "admin", bulk_add_providers),
+        Scenario("provider_update", "admin", get(lambda ctx, i: reverse("provider_update", args=[ctx["provider"].id]))),
+        Scenario("provider_delete", "admin", delete_provider),
+        Scenario("admin_profile", "admin", get(lambda ctx, i: reverse("admin_profile"))),
+        Scenario("admin_db_pool", "admin", get(lambda ctx, i: reverse("admin_db_pool"))),
+        Scenario("admin_login_throttle", "admin", get(lambda ctx, i: reverse("admin_login_throttle"))),
+        Scenario("admin_slow_queries", "admin", get(lambda ctx, i: reverse("admin_slow_queries"))),
+        Scenario("admin_change_password", "admin", get(lambda ctx, i: reverse("admin_change_password"))),
+        Scenario("admin_export_appointments (csv)", "admin", get(lambda ctx, i: reverse("admin_export_appointments"))),
+        Scenario("admin_export_appointments (xlsx)", "admin", get(
+            lambda ctx, i: reverse("admin_export_appointments") + "?format=xlsx"
+        )),
+
+        Scenario("patient_dashboard", "patient", get(lambda ctx, i: reverse("patient_dashboard"))),
+        Scenario("appointment_list", "patient", get(lambda ctx, i: reverse("appointment_list"))),
+        Scenario("appointment_add", "patient", get(lambda ctx, i: reverse("appointment_add"))),
+        Scenario("appointment_add (POST, conflict)", "patient", conflict_post),
+        Scenario("appointment_add (POST, booked)", "patient", booking_post),
+        Scenario("appointment_slots", "patient", get(lambda ctx, i: reverse("appointment_slots") + "?duration=30")),
+        Scenario("appointment_reschedule", "patient", get(
+            lambda ctx, i: reverse("appointment_reschedule", args=[ctx["patient_upcoming"].id])
+        )),
+        Scenario("appointment_reschedule (POST, conflict)", "patient", reschedule_conflict),
+        Scenario("appointment_delete", "patient", delete_appointment),
+        Scenario("patient_profile", "patient", get(lambda ctx, i: reverse("patient_profile"))),
+        Scenario("patient_change_password", "patient", get(lambda ctx, i: reverse("patient_change_password"))),
+
+        Scenario("provider_dashboard", "provider", get(lambda ctx, i: reverse("provider_dashboard"))),
+        Scenario("provider_appointments", "provider", get(lambda ctx, i: reverse("provider_appointments"))),
+        Scenario("provider_export_appointments", "provider", get(
+            lambda ctx, i: reverse("provider_export_appointments") + "?format=xlsx"
+        )),
+        Scenario("approve_appointment (clash)", "provider", approve_clash),
+        Scenario("approve_appointment (approved)", "provider", approve_ok),
+        Scenario("reject_appointment", "provider", reject),
+        Scenario("provider_bulk_decide (approve 20)", "provider", bulk_approve),
+        Scenario("provider_profile", "provider", get(lambda ctx, i: reverse("provider_profile"))),
+        Scenario("provider_change_password", "provider", get(lambda ctx, i: reverse("provider_change_password"))),
+        Scenario("provider_calendar", "provider", get(lambda ctx, i: reverse("provider_calendar"))),
+        Scenario("provider_calendar (12 months)", "provider", get(lambda ctx, i: reverse("provider_calendar") + "?months=12")),
+        Scenario("provider_calendar_day", "provider", get(
+            lambda ctx, i: reverse("provider_calendar_day", args=[today.year, today.month, today.day])
+        )),
+
+        Scenario("api_patient_appointments", "patient", get(lambda ctx, i: reverse("api_patient_appointments"))),
+        Scenario("api_patient_appointments (304)", "patient", revalidate("api_patient_appointments")),
+        Scenario("api_provider_appointments", "provider", get(lambda ctx, i: reverse("api_provider_appointments"))),
+        Scenario("api_provider_appointments (304)", "provider", revalidate("api_provider_appointments")),
+        Scenario("api_provider_month", "provider", get(
+            lambda ctx, i: reverse("api_provider_month", kwargs=API_KWARGS["api_provider_month"])
+        )),
+        Scenario("api_provider_month (304)", "provider", revalidate("api_provider_month")),
+    ]
+
+
+def missing_scenarios():
+    """Named accounts URLs without a scenario (a scenario is named after its URL)."""
+    from accounts.urls import urlpatterns
+    covered = {scenario.name.split(" ")[0] for scenario in scenarios()}
+    return sorted(pattern.name for pattern in urlpatterns if pattern.name and pattern.name not in covered)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and benchmark every accounts URL: "
+        "latency percentiles, SQL queries and peak memory, compared to a baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--providers", type=int, default=50)
+        parser.add_argument("--patients", type=int, default=2000)
+        parser.add_argument("--appointments", type=int, default=50000)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=1, help="Untimed iterations before measuring")
+        parser.add_argument("--only", help="Run scenarios whose name contains this text")
+        parser.add_argument("--baseline", default="benchmarks/baseline.json")
+        parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+        parser.add_argument("--tolerance", type=float, default=0.25,
+                            help="Allowed relative slowdown of p95 latency / peak memory vs baseline")
+        parser.add_argument("--min-delta-ms", type=float, default=5.0,
+                            help="Ignore p95 slowdowns smaller than this, whatever the ratio")
+        parser.add_argument("--min-delta-kb", type=float, default=256.0,
+                            help="Ignore peak memory growth smaller than this, whatever the ratio")
+        parser.add_argument("--keepdb", action="store_true", help="Reuse the seeded test database between runs")
+
+    def handle(self, *args, **opts):
+        missing = missing_scenarios()
+        if missing:
+            raise CommandError(f"URLs without a benchmark scenario: {', '.join(missing)}")
+        # Checked before the slow part: a run with nothing to compare against
+        # must not pass
+        if not opts["save_baseline"] and not os.path.exists(opts["baseline"]):
+            raise CommandError(f"No baseline at {opts['baseline']}; run with --save-baseline to create one")
+
+        setup_test_environment()
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=opts["keepdb"])
+        try:
+            ctx = self.seed(opts)
+            # /metrics is only served with a token
+            with override_settings(METRICS={**settings.METRICS, "TOKEN": settings.METRICS["TOKEN"] or "benchmark"}):
+                results = self.run_all(ctx, opts)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=opts["keepdb"])
+            teardown_test_environment()
+
+        self.report(results)
+
+        if opts["save_baseline"]:
+            os.makedirs(os.path.dirname(opts["baseline"]) or ".", exist_ok=True)
+            with open(opts["baseline"], "w") as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {opts['baseline']}"))
+            return
+
+        self.compare(results, opts["baseline"], opts["tolerance"], opts["min_delta_ms"], opts["min_delta_kb"])
+
+    # ---------------------------
+    # Setup
+    # ---------------------------
+
+    def seed(self, opts):
+        if not User.objects.filter(username__startswith="bench_").exists():
+            call_command(
+                "seed_clinic",
+                providers=opts["providers"],
+                patients=opts["patients"],
+                appointments=opts["appointments"],
+                seed=opts["seed"],
+                prefix="bench",
+                stdout=self.stdout if opts["verbosity"] > 1 else io.StringIO(),
+            )
+
+        today = date.today()
+        provider = User.objects.filter(role="provider", username__startswith="bench_").annotate(
+            n=Count("appointments_received")
+        ).order_by("-n").first()
+        patient = User.objects.filter(role="patient", username__startswith="bench_").annotate(
+            n=Count("appointments_made")
+        ).order_by("-n").first()
+        upcoming = list(Appointment.objects.filter(patient=patient, date__gt=today).order_by("date", "start_time")[:2])
+        if len(upcoming) < 2:
+            raise CommandError("Seeded patient needs at least two upcoming appointments; seed more data")
+
+        admin, _ = User.objects.get_or_create(username="bench_admin", defaults={"role": "admin"})
+        spare, _ = User.objects.get_or_create(username="bench_spare_patient", defaults={"role": "patient"})
+        spare_2, _ = User.objects.get_or_create(username="bench_spare_patient_2", defaults={"role": "patient"})
+
+        return {
+            "admin": admin,
+            "provider": provider,
+            "patient": patient,
+            "patient_upcoming": upcoming[0],
+            "patient_other": upcoming[1],
+            "spare_patient": spare,
+            "spare_patient_2": spare_2,
+        }
+
+    def client_for(self, ctx, role):
+        client = Client()
+        if role == "logout":
+            client.force_login(ctx["patient"])
+        elif role:
+            client.force_login(ctx[role])
+        return client
+
+    # ---------------------------
+    # Measurement
+    # ---------------------------
+
+    def run_all(self, ctx, opts):
+        results = {}
+        for scenario in scenarios():
+            if opts["only"] and opts["only"] not in scenario.name:
+                continue
+            if opts["verbosity"] > 1:
+                self.stdout.write(f"  {scenario.name}")
+            results[scenario.name] = self.run(scenario, ctx, opts["iterations"], opts["warmup"])
+        return results
+
+    def request(self, scenario, ctx, i):
+        client = self.client_for(ctx, scenario.role)
+        method, path, data, *headers = scenario.prepare(ctx, i)
+
+        def send():
+            response = getattr(client, method)(path, data, headers=headers[0] if headers else None)
+            # Streaming bodies are only produced while being read
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+                response.close()
+            return response
+        return send
+
+    def run(self, scenario, ctx, iterations, warmup):
+        cache.clear()
+        latencies, query_counts, query_times = [], [], []
+
+        for i in range(-warmup, 0):
+            self.request(scenario, ctx, iterations + 1 - i)()
+
+        for i in range(iterations):
+            send = self.request(scenario, ctx, i)
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                started = time.perf_counter()
+                response = send()
+                latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                raise CommandError(f"{scenario.name} returned {response.status_code}")
+            query_counts.append(timer.count)
+            query_times.append(timer.elapsed * 1000)
+
+        # Memory in a separate untimed pass, tracemalloc skews latency
+        send = self.request(scenario, ctx, iterations)
+        tracemalloc.start()
+        try:
+            send()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries": max(query_counts),
+            "query_ms": round(percentile(query_times, 50), 3),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    # ---------------------------
+    # Reporting
+    # ---------------------------
+
+    def report(self, results):
+        header = f"{'view':<42}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'sql ms':>9}{'peak KB':>10}"
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+        for name, r in results.items():
+            self.stdout.write(
+                f"{name:<42}{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+                f"{r['queries']:>9}{r['query_ms']:>9.2f}{r['peak_kb']:>10.1f}"
+            )
+
+    def compare(self, results, path, tolerance, min_delta_ms, min_delta_kb):
+        with open(path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, r in results.items():
+            base = baseline.get(name)
+            if not base:
+                continue
+            if r["queries"] > base["queries"]:
+                regressions.append(f"{name}: {r['queries']} queries (baseline {base['queries']})")
+            if r["p95_ms"] > max(base["p95_ms"] * (1 + tolerance), base["p95_ms"] + min_delta_ms):
+                regressions.append(f"{name}: p95 {r['p95_ms']:.2f} ms (baseline {base['p95_ms']:.2f} ms)")
+            if r["peak_kb"] > max(base["peak_kb"] * (1 + tolerance), base["peak_kb"] + min_delta_kb):
+                regressions.append(f"{name}: peak {r['peak_kb']:.1f} KB (baseline {base['peak_kb']:.1f} KB)")
+
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} performance regression(s) against {path}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {path}"))
@@ -0,0 +1,98 @@
+from datetime import date, datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.http import QueryDict
+
+from accounts import api, exports
+from accounts.calendars import status_counts
+from accounts.models import Appointment
+from accounts.pagination import encode_cursor, page_query
+
+TABLE = Appointment._meta.db_table
+
+
+def _pages(view, section, queryset, descending=False):
+    # First page, and a later page (the keyset range after a cursor row)
+    row = {"date": date.today(), "start_time": time(10, 0), "id": 1}
+    cursor = QueryDict(mutable=True)
+    cursor["page"] = encode_cursor("n", row)
+    return [
+        (f"{view} ({section}, first page)", page_query(queryset, QueryDict(), "page", descending)[0]),
+        (f"{view} ({section}, next page)", page_query(queryset, cursor, "page", descending)[0]),
+    ]
+
+
+def hot_queries(user_id, today):
+    # One entry per Appointment query issued by accounts views, the API and
+    # the exports; lists are built with the same keyset pagination helpers
+    start = time(10, 0)
+    now = datetime.combine(today, start)
+    base = Appointment.objects
+    upcoming = models.Q(date__gt=today) | models.Q(date=today, end_time__gte=start)
+    past = models.Q(date__lt=today) | models.Q(date=today, end_time__lt=start)
+    patient_list = base.filter(patient_id=user_id).select_related("provider")
+    provider_list = base.filter(provider_id=user_id).select_related("patient")
+
+    return [
+        *_pages("appointment_list", "upcoming", patient_list.filter(upcoming)),
+        *_pages("appointment_list", "past", patient_list.filter(past), descending=True),
+        # Conflict checks read the occupancy bitmap; these are the per-day
+        # reads that keep it in sync after every write
+        ("appointment_add / reschedule (patient occupancy)", base.filter(patient_id=user_id, date=today)),
+        ("approve_appointment (provider occupancy)", base.filter(provider_id=user_id, date=today, status__in=["approved"])),
+        *_pages("provider_appointments", "upcoming", provider_list.filter(upcoming)),
+        *_pages("provider_appointments", "completed", provider_list.filter(past), descending=True),
+        ("provider_calendar", status_counts(user_id, today.replace(day=1), today.replace(day=28))),
+        ("provider_calendar_day", base.filter(provider_id=user_id, date=today).order_by("start_time")),
+
+        *_pages("api_patient_appointments", "upcoming", *api.section_rows(api.patient_rows(user_id), "upcoming", now)),
+        *_pages("api_patient_appointments", "past", *api.section_rows(api.patient_rows(user_id), "past", now)),
+        *_pages("api_provider_appointments", "upcoming", *api.section_rows(api.provider_rows(user_id), "upcoming", now)),
+        *_pages("api_provider_appointments", "completed", *api.section_rows(api.provider_rows(user_id), "completed", now)),
+        ("api_provider_month", status_counts(user_id, today.replace(day=1), today.replace(day=28))),
+
+        # An unfiltered admin export reads the whole table by design
+        ("provider_export_appointments", exports.export_queryset({"provider_id": user_id})),
+        ("admin_export_appointments (provider, dates)", exports.export_queryset({
+            "provider_id": user_id, "date__gte": today, "date__lte": today,
+        })),
+    ]
+
+
+def is_sequential_scan(plan):
+    if connection.vendor == "postgresql":
+        return f"Seq Scan on {TABLE}" in plan
+    if connection.vendor == "sqlite":
+        return any(
+            line.split("SCAN", 1)[1].split()[0] == TABLE
+            for line in plan.splitlines()
+            if "SCAN" in line
+        )
+    return False
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN every hot Appointment query and fail if any falls back to a sequential scan"
+
+    def handle(self, *args, **kwargs):
+        failures = []
+
+        with transaction.atomic():
+            if connection.vendor == "postgresql":
+                # Small tables make a seq scan look cheap; force the planner
+                # to show whether an index is usable at all
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+
+            for name, queryset in hot_queries(0, date.today()):
+                plan = queryset.explain()
+                if is_sequential_scan(plan):
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f"SEQ SCAN  {name}"))
+                    self.stdout.write(plan)
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"ok        {name}"))
+
+        if failures:
+            raise CommandError(f"Sequential scan on {TABLE} in: {', '.join(failures)}")
@@ -0,0 +1,258 @@
+import csv
+import json
+import os
+from bisect import bisect_left
+from collections import Counter
+from datetime import date, time
+from functools import reduce
+from itertools import accumulate, islice
+from operator import or_
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from accounts import occupancy
+from accounts.models import Appointment, User
+from accounts.schedule_cache import bump_schedule_version
+
+REQUIRED = ("patient", "provider", "date", "start_time", "end_time")
+STATUSES = dict(Appointment.STATUS_CHOICES)
+
+
+class Rejected(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Import appointments from a CSV or JSONL file (patient, provider, date, start_time, "
+        "end_time, reason, status). Overlapping rows are written to a reject file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--rejects", help="Reject file (default: <path>.rejects.<format>)")
+        parser.add_argument("--batch-size", type=int, default=5000, help="Rows per transaction")
+        parser.add_argument("--default-status", default="pending", choices=list(STATUSES))
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        rejects_path = opts["rejects"] or f"{path}.rejects.{fmt}"
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+
+        # username -> (id, role), built once instead of a lookup per row
+        self.users = {
+            username: (user_id, role)
+            for username, user_id, role in User.objects.values_list("username", "id", "role").iterator()
+        }
+        self.default_status = opts["default_status"]
+
+        imported, reasons = 0, Counter()
+        with open(path, newline="", encoding="utf-8") as source, \
+                open(rejects_path, "w", newline="", encoding="utf-8") as rejects:
+            rows, reject = self.open_format(fmt, source, rejects)
+            number = 0
+            while True:
+                chunk = list(islice(rows, opts["batch_size"]))
+                if not chunk:
+                    break
+                try:
+                    created, rejected = self.import_chunk(chunk)
+                except IntegrityError as e:
+                    raise CommandError(
+                        f"Rows {number + 1}-{number + len(chunk)} clashed with concurrent bookings and were "
+                        f"rolled back; {imported} rows before them were imported. ({e})"
+                    ) from e
+                for row, reason in rejected:
+                    reject(row, reason)
+                    reasons[reason] += 1
+                imported += created
+                number += len(chunk)
+                self.stdout.write(f"  {number} rows read, {imported} imported", ending="\r")
+        self.stdout.write("")
+
+        rejected = sum(reasons.values())
+        for reason, count in reasons.most_common():
+            self.stdout.write(f"  {count:>8}  {reason}")
+        if not rejected:
+            os.remove(rejects_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} appointments, rejected {rejected}"
+            + (f" (see {rejects_path})" if rejected else "")
+        ))
+
+    # ---------------------------
+    # Input / reject formats
+    # ---------------------------
+
+    def open_format(self, fmt, source, rejects):
+        if fmt == "jsonl":
+            def rows():
+                for line in source:
+                    if line.strip():
+                        try:
+                            row = json.loads(line)
+                        except ValueError:
+                            row = None
+                        if not isinstance(row, dict):
+                            row = {"raw": line.rstrip("\n"), "invalid": "invalid JSON object"}
+                        yield row
+
+            def reject(row, reason):
+                rejects.write(json.dumps({**row, "error": reason}, default=str) + "\n")
+
+            return rows(), reject
+
+        reader = csv.DictReader(source)
+        missing = set(REQUIRED) - set(reader.fieldnames or ())
+        if missing:
+            raise CommandError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+        writer = csv.DictWriter(rejects, fieldnames=[*reader.fieldnames, "error"], extrasaction="ignore")
+        writer.writeheader()
+
+        def reject(row, reason):
+            writer.writerow({**row, "error": reason})
+
+        return reader, reject
+
+    # ---------------------------
+    # Validation
+    # ---------------------------
+
+    def user_id(self, row, field):
+        user = self.users.get(str(row[field]).strip())
+        if user is None:
+            raise Rejected(f"unknown {field}")
+        if user[1] != field:
+            raise Rejected(f"{field} user has role {user[1]}")
+        return user[0]
+
+    def parse(self, row):
+        if "invalid" in row:
+            raise Rejected(row.pop("invalid"))
+        missing = [field for field in REQUIRED if not row.get(field)]
+        if missing:
+            raise Rejected(f"missing {', '.join(missing)}")
+        try:
+            day = date.fromisoformat(str(row["date"]).strip())
+            start_time = time.fromisoformat(str(row["start_time"]).strip())
+            end_time = time.fromisoformat(str(row["end_time"]).strip())
+        except ValueError:
+            raise Rejected("invalid date or time")
+        if end_time <= start_time:
+            raise Rejected("end time must be after start time")
+
+        status = str(row.get("status") or self.default_status).strip()
+        if status not in STATUSES:
+            raise Rejected("unknown status")
+
+        return Appointment(
+            patient_id=self.user_id(row, "patient"),
+            provider_id=self.user_id(row, "provider"),
+            date=day,
+            start_time=start_time,
+            end_time=end_time,
+            reason=str(row.get("reason") or ""),
+            status=status,
+        )
+
+    # ---------------------------
+    # Import
+    # ---------------------------
+
+    def schedule_keys(self, appointment):
+        # (user_id, kind, date) of the schedules the appointment takes time
+        # in: the patient's unless rejected, the provider's when approved
+        return [
+            (getattr(appointment, field), kind, appointment.date)
+            for kind, field in occupancy.KIND_FIELDS.items()
+            if appointment.status in occupancy.KIND_STATUSES[kind]
+        ]
+
+    def existing_schedules(self, keys):
+        """
+        {key: (starts, ends)} of the appointments already stored under each
+        schedule key, sorted by start; ends[i] is the latest end among the
+        first i + 1. One query per chunk.
+        """
+        by_day = {}
+        for user_id, kind, day in keys:
+            by_day.setdefault((kind, day), set()).add(user_id)
+        if not by_day:
+            return {}
+        query = reduce(or_, (
+            Q(date=day, status__in=occupancy.KIND_STATUSES[kind], **{f"{occupancy.KIND_FIELDS[kind]}__in": user_ids})
+            for (kind, day), user_ids in by_day.items()
+        ))
+
+        intervals = {}
+        for state in Appointment.objects.filter(query).values_list(*occupancy.STATE_FIELDS).iterator():
+            _, _, _, start_time, end_time, _ = state
+            for key in occupancy.occupied(state):
+                if key in keys:
+                    intervals.setdefault(key, []).append((start_time, end_time))
+
+        schedules = {}
+        for key, slots in intervals.items():
+            slots.sort()
+            starts = [start for start, _ in slots]
+            ends = list(accumulate((end for _, end in slots), max))
+            schedules[key] = (starts, ends)
+        return schedules
+
+    def import_chunk(self, chunk):
+        parsed, rejected = [], []
+        for index, row in enumerate(chunk):
+            try:
+                parsed.append((index, row, self.parse(row)))
+            except Rejected as e:
+                rejected.append((index, row, str(e)))
+
+        def overlaps_existing(key, start, end):
+            # Any stored slot starting before ``end`` and ending after ``start``
+            starts, ends = schedules.get(key, ((), ()))
+            before = bisect_left(starts, end)
+            return before > 0 and ends[before - 1] > start
+
+        with transaction.atomic():
+            # Same rules as appointment_add and approve_appointment, settled
+            # in memory: the stored schedules are loaded once, then the rows
+            # are swept per schedule in start order. A row is accepted if it
+            # starts after everything accepted before it in each of its
+            # schedules has ended.
+            schedules = self.existing_schedules({key for _, _, appt in parsed for key in self.schedule_keys(appt)})
+            busy_until = {}
+            accepted = []
+            for index, row, appointment in sorted(parsed, key=lambda p: (p[2].date, p[2].start_time, p[0])):
+                start, end = appointment.start_time, appointment.end_time
+                keys = self.schedule_keys(appointment)
+                clash = next((key[1] for key in keys if overlaps_existing(key, start, end)), None)
+                if clash:
+                    rejected.append((index, row, f"overlaps an existing {clash} appointment"))
+                    continue
+                clash = next((key[1] for key in keys if key in busy_until and start < busy_until[key]), None)
+                if clash:
+                    rejected.append((index, row, f"overlaps another {clash} appointment in the file"))
+                    continue
+                for key in keys:
+                    busy_until[key] = max(busy_until.get(key, end), end)
+                accepted.append((index, appointment))
+
+            accepted = [appointment for _, appointment in sorted(accepted, key=lambda a: a[0])]
+            Appointment.objects.bulk_create(accepted)
+
+            # bulk_create skips the signals that keep occupancy and
+            # schedule versions in sync
+            added = {}
+            for appointment in accepted:
+                for key in self.schedule_keys(appointment):
+                    added[key] = added.get(key, 0) | occupancy.slot_mask(appointment.start_time, appointment.end_time)
+            occupancy.update_masks({key: (0, bits) for key, bits in added.items()})
+            bump_schedule_version(*(user_id for appt in accepted for user_id in (appt.patient_id, appt.provider_id)))
+
+        # Rejects in file order
+        return len(accepted), [(row, reason) for _, row, reason in sorted(rejected, key=lambda r: r[0])]
@@ -0,0 +1,48 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.onboarding import BATCH_SIZE, FIELDS, Onboarding, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        f"Create healthcare providers in bulk from a CSV or JSONL file ({', '.join(FIELDS)}). "
+        "Rows that can't be created are listed in an error report."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension")
+        parser.add_argument("--report", help="Error report (default: <path>.errors.csv)")
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per insert")
+        parser.add_argument(
+            "--workers", type=int, default=os.cpu_count(),
+            help="Password hashing processes (1 hashes in this process)"
+        )
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        fmt = opts["format"] or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+        report_path = opts["report"] or f"{path}.errors.csv"
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+
+        def progress(run):
+            self.stdout.write(f"  {run.read} rows read, {run.created} created", ending="\r")
+
+        run = Onboarding(workers=opts["workers"], batch_size=opts["batch_size"], progress=progress)
+        with open(path, newline="", encoding="utf-8") as source:
+            try:
+                run.feed(read_rows(source, fmt))
+            except ValueError as e:
+                raise CommandError(str(e)) from e
+        self.stdout.write("")
+
+        if run.errors:
+            with open(report_path, "w", newline="", encoding="utf-8") as report:
+                report.write(run.error_report())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {run.created} providers, {len(run.errors)} errors"
+            + (f" (see {report_path})" if run.errors else "")
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.occupancy import rebuild
+
+
+class Command(BaseCommand):
+    help = "Regenerate the provider/patient occupancy bitmaps from the Appointment table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **kwargs):
+        created = rebuild(batch_size=kwargs["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} occupancy bitmaps"))
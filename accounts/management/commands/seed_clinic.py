@@ -0,0 +1,155 @@
+import random
+from array import array
+from datetime import date, time, timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import Appointment, User
+from accounts.occupancy import rebuild
+
+DESIGNATIONS = [
+    "General Physician", "Cardiologist", "Dermatologist", "Pediatrician",
+    "Orthopedist", "Neurologist", "Psychiatrist", "ENT Specialist",
+    "Gynecologist", "Ophthalmologist", "Dentist", "Physiotherapist",
+]
+FIRST_NAMES = [
+    "Aarav", "Priya", "Rohan", "Ananya", "Vikram", "Meera", "Arjun", "Kavya",
+    "James", "Emma", "Liam", "Olivia", "Noah", "Sophia", "Lucas", "Mia",
+]
+LAST_NAMES = [
+    "Sharma", "Patel", "Iyer", "Reddy", "Gupta", "Nair", "Singh", "Das",
+    "Smith", "Johnson", "Brown", "Garcia", "Miller", "Davis", "Wilson", "Moore",
+]
+REASONS = [
+    "Routine checkup", "Follow-up visit", "Fever and cough", "Back pain",
+    "Skin rash", "Blood pressure review", "Vaccination", "Lab results",
+]
+
+# Appointments sit on a fixed grid of 30-minute slots from 08:00 to 18:00.
+# Each (day, slot) cell uses every provider and patient at most once, so no
+# two appointments of the same provider or patient ever overlap.
+SLOTS = [(time(8 + i // 2, (i % 2) * 30), time(8 + (i + 1) // 2, ((i + 1) % 2) * 30)) for i in range(20)]
+
+PAST_STATUSES = (["approved"] * 70 + ["rejected"] * 15 + ["pending"] * 10 + ["reschedule_requested"] * 5)
+FUTURE_STATUSES = (["pending"] * 40 + ["approved"] * 45 + ["reschedule_requested"] * 10 + ["rejected"] * 5)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic synthetic clinic (providers, patients, appointments) for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--providers", type=int, default=50)
+        parser.add_argument("--patients", type=int, default=1000)
+        parser.add_argument("--appointments", type=int, default=10000)
+        parser.add_argument("--past-days", type=int, default=180)
+        parser.add_argument("--future-days", type=int, default=60)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--prefix", default="seed", help="Username prefix for generated users")
+        parser.add_argument("--password", default="password", help="Password for every generated user")
+        parser.add_argument("--skip-occupancy", action="store_true", help="Don't rebuild occupancy bitmaps")
+
+    def handle(self, *args, **opts):
+        rng = random.Random(opts["seed"])
+        prefix = opts["prefix"]
+        batch_size = opts["batch_size"]
+
+        if User.objects.filter(username__startswith=f"{prefix}_").exists():
+            raise CommandError(f"Users with prefix '{prefix}_' already exist; pick another --prefix")
+
+        days = opts["past_days"] + opts["future_days"] + 1
+        capacity = days * len(SLOTS) * min(opts["providers"], opts["patients"])
+        if opts["appointments"] > capacity:
+            raise CommandError(
+                f"{opts['appointments']} appointments don't fit without overlaps; "
+                f"at most {capacity} for this many providers/patients/days"
+            )
+
+        # One hash for everyone: PBKDF2 per user would dominate the run time
+        password = make_password(opts["password"])
+
+        provider_ids = self.create_users(rng, "provider", opts["providers"], password, prefix, batch_size)
+        patient_ids = self.create_users(rng, "patient", opts["patients"], password, prefix, batch_size)
+
+        start = date.today() - timedelta(days=opts["past_days"])
+        appointments = self.generate_appointments(
+            rng, provider_ids, patient_ids, start, days, opts["appointments"]
+        )
+
+        created = 0
+        for batch in batched(appointments, batch_size):
+            with transaction.atomic():
+                Appointment.objects.bulk_create(batch)
+            created += len(batch)
+            self.stdout.write(f"  {created} appointments", ending="\r")
+        self.stdout.write("")
+
+        if not opts["skip_occupancy"]:
+            rebuild()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(provider_ids)} providers, {len(patient_ids)} patients, {created} appointments"
+        ))
+
+    def create_users(self, rng, role, count, password, prefix, batch_size):
+        def users():
+            for i in range(count):
+                first_name = rng.choice(FIRST_NAMES)
+                last_name = rng.choice(LAST_NAMES)
+                yield User(
+                    username=f"{prefix}_{role}_{i:07d}",
+                    email=f"{prefix}_{role}_{i:07d}@example.com",
+                    first_name=first_name,
+                    last_name=last_name,
+                    password=password,
+                    role=role,
+                    designation=rng.choice(DESIGNATIONS) if role == "provider" else None,
+                )
+
+        for batch in batched(users(), batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+
+        # Compact int array instead of model instances
+        return array("q", User.objects.filter(
+            username__startswith=f"{prefix}_{role}_"
+        ).order_by("username").values_list("id", flat=True).iterator(chunk_size=batch_size))
+
+    def generate_appointments(self, rng, provider_ids, patient_ids, start, days, total):
+        today = date.today()
+        cells = days * len(SLOTS)
+
+        for cell in range(cells):
+            # Spread the total evenly over all cells
+            count = total * (cell + 1) // cells - total * cell // cells
+            if not count:
+                continue
+
+            day = start + timedelta(days=cell // len(SLOTS))
+            start_time, end_time = SLOTS[cell % len(SLOTS)]
+            statuses = PAST_STATUSES if day < today else FUTURE_STATUSES
+
+            providers = rng.sample(range(len(provider_ids)), count)
+            patients = rng.sample(range(len(patient_ids)), count)
+            for provider, patient in zip(providers, patients):
+                yield Appointment(
+                    patient_id=patient_ids[patient],
+                    provider_id=provider_ids[provider],
+                    date=day,
+                    start_time=start_time,
+                    end_time=end_time,
+                    reason=rng.choice(REASONS),
+                    status=rng.choice(statuses),
+                )
@@ -0,0 +1,63 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.instrumentation import log_files
+
+
+class Command(BaseCommand):
+    help = "Print the slowest request traces from the tracing file as span trees."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Default: TRACING['FILE'], read from every worker's file")
+        parser.add_argument("--view", help="Only traces of this view name")
+        parser.add_argument("--trace", help="Only this trace id (the X-Trace-Id header)")
+        parser.add_argument("--limit", type=int, default=5, help="Number of traces")
+
+    def handle(self, *args, **opts):
+        path = opts["file"] or settings.TRACING["FILE"]
+        # Every worker's file and the rotated ones next to them
+        names = log_files(path)
+        if not names:
+            raise CommandError(f"No trace files for {path}")
+        traces = {}
+        for name in names:
+            try:
+                source = open(name, encoding="utf-8")
+            except FileNotFoundError:
+                continue  # pruned or rotated away meanwhile
+            with source:
+                for line in source:
+                    try:
+                        span = json.loads(line)
+                    except ValueError:
+                        continue  # cut off by a rotation
+                    traces.setdefault(span["trace_id"], []).append(span)
+
+        roots = []
+        for trace_id, spans in traces.items():
+            root = next((s for s in spans if s["parent_id"] is None), None)
+            if root is None or (opts["trace"] and trace_id != opts["trace"]):
+                continue
+            if opts["view"] and root["attributes"].get("view") != opts["view"]:
+                continue
+            roots.append(root)
+        roots.sort(key=lambda s: s["duration_ms"], reverse=True)
+
+        for root in roots[:opts["limit"]]:
+            children = {}
+            for span in traces[root["trace_id"]]:
+                children.setdefault(span["parent_id"], []).append(span)
+            self.stdout.write(f"trace {root['trace_id']}")
+            self._write(root, children, 0)
+            self.stdout.write("")
+
+    def _write(self, span, children, depth):
+        attributes = span["attributes"]
+        detail = attributes.get("template") or attributes.get("sql") or attributes.get("role") or ""
+        if span["name"] == "request":
+            detail = f"{attributes.get('method')} {attributes.get('path')} -> {attributes.get('view')} {attributes.get('status', '')}"
+        self.stdout.write(f"{'  ' * depth}{span['duration_ms']:9.3f} ms  {span['name']}  {detail[:120]}")
+        for child in sorted(children.get(span["span_id"], ()), key=lambda s: s["start"]):
+            self._write(child, children, depth + 1)
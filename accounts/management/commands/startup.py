@@ -0,0 +1,58 @@
+import zlib
+from contextlib import contextmanager
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+# Fixed key for pg_advisory_lock, shared by every replica
+LOCK_KEY = zlib.crc32(b"clinic_appointment:startup")
+
+
+def pending_migrations(connection):
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+@contextmanager
+def advisory_lock(connection):
+    # Session-level lock held across the whole startup. Other databases
+    # run single-host, so there is nothing to coordinate.
+    if connection.vendor != "postgresql":
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", [LOCK_KEY])
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", [LOCK_KEY])
+
+
+class Command(BaseCommand):
+    help = (
+        "Container start: apply pending migrations (one replica at a time, never generating "
+        "new ones) and create the default superuser"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+        parser.add_argument("--skip-superuser", action="store_true")
+
+    def handle(self, *args, **opts):
+        connection = connections[opts["database"]]
+
+        # Uncontended this is one extra query; when replicas start together
+        # only one migrates and creates the superuser, the rest wait
+        with advisory_lock(connection):
+            plan = pending_migrations(connection)
+            if plan:
+                self.stdout.write(f"Applying {len(plan)} migrations")
+                call_command("migrate", database=opts["database"], interactive=False)
+            else:
+                self.stdout.write("No pending migrations")
+
+            if not opts["skip_superuser"]:
+                call_command("create_default_superuser")
@@ -0,0 +1,364 @@
+import bisect
+import contextvars
+import fcntl
+import glob
+import hmac
+import json
+import os
+import shutil
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.template.backends.django import Template as BackendTemplate
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import empty
+
+from clinic_appointment.db.pool import pool_stats
+from .instrumentation import add_query_wrapper, pid_alive
+from .throttle import login_throttle
+
+# Per-view request metrics (settings.METRICS), labelled by resolved URL
+# name and the user's role:
+#
+#   latency histogram, responses by status, SQL query count and time,
+#   template render time and response bytes.
+#
+# Each worker keeps its own totals and writes them to METRICS["DIR"]/<pid>.json
+# at most once a second; /metrics sums every worker's file into the
+# Prometheus text format, like prometheus_client's multiprocess mode.
+# When a worker exits (gunicorn child_exit, or found dead at scrape time)
+# its file is folded into aggregate.json and removed, so counters never go
+# backwards and the directory doesn't grow with recycled workers. The
+# directory is cleared when gunicorn starts. /metrics needs METRICS["TOKEN"].
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FLUSH_INTERVAL = 1.0
+AGGREGATE_FILE = "aggregate.json"
+
+COUNTERS = {
+    "http_responses": "Responses by status code.",
+    "db_queries": "SQL queries run while serving the view.",
+    "db_query_seconds": "Time spent in SQL queries.",
+    "template_render_seconds": "Time spent rendering templates (includes counted once).",
+    "http_response_bytes": "Response body bytes sent (after compression).",
+}
+
+# [queries, sql seconds, render seconds] of the request being served
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}  # (view, role) -> [count per bucket..., +Inf, sum]
+        self.counters = {}  # (name, labels) -> value
+        self._flushed_at = 0.0
+
+    def _add(self, name, labels, value):
+        key = (name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, view, role, status, elapsed, queries, sql_seconds, render_seconds):
+        labels = (view, role)
+        with self._lock:
+            buckets = self.latency.get(labels)
+            if buckets is None:
+                buckets = self.latency[labels] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            buckets[-1] += elapsed
+            self._add("http_responses", (view, role, str(status)), 1)
+            self._add("db_queries", labels, queries)
+            self._add("db_query_seconds", labels, sql_seconds)
+            self._add("template_render_seconds", labels, render_seconds)
+
+    def add_bytes(self, view, role, size):
+        with self._lock:
+            self._add("http_response_bytes", (view, role), size)
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "latency": [[list(labels), values] for labels, values in self.latency.items()],
+                "counters": [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+            }
+
+    def flush(self, directory, force=False):
+        now = time.monotonic()
+        if not force and now - self._flushed_at < FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        data = self.snapshot()
+
+        # Counters kept by other modules, per process as well
+        throttle = login_throttle.stats()
+        for key, value in throttle["rejected"].items():
+            data["counters"].append(["login_rejected", [key], value])
+        data["counters"].append(["login_allowed", [], throttle["allowed"]])
+        for alias, stats in pool_stats().items():
+            for name in ("checkouts", "timeouts", "connects"):
+                data["counters"].append([f"db_pool_{name}", [alias], stats[name]])
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(f"{path}.tmp", "w") as out:
+            json.dump(data, out)
+        os.replace(f"{path}.tmp", path)
+
+
+registry = Registry()
+
+
+def reset_directory():
+    # gunicorn on_starting: totals of a previous run don't carry over
+    shutil.rmtree(settings.METRICS["DIR"], ignore_errors=True)
+
+
+# ---------------------------
+# Instrumentation
+# ---------------------------
+
+def _time_query(execute, sql, params, many, context):
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current[0] += 1
+        current[1] += time.perf_counter() - started
+
+
+_render = BackendTemplate.render
+
+
+def _timed_render(self, context=None, request=None):
+    # The backend Template is what render()/render_to_string() call;
+    # {% include %} renders below it, so nested templates count once
+    current = _current.get()
+    if current is None:
+        return _render(self, context, request)
+    started = time.perf_counter()
+    try:
+        return _render(self, context, request)
+    finally:
+        current[2] += time.perf_counter() - started
+
+
+_installed = False
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    add_query_wrapper(_time_query)
+    BackendTemplate.render = _timed_render
+
+
+# ---------------------------
+# Middleware
+# ---------------------------
+
+def _labels(request):
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match else "unmatched"
+    # Only look at a user that was already loaded; never cost a query here
+    user = getattr(request, "user", None)
+    user = getattr(user, "_wrapped", user)
+    if user is None or user is empty or not user.is_authenticated:
+        return view, "anonymous"
+    return view, user.role
+
+
+def _counted(content, view, role):
+    size = 0
+    try:
+        for chunk in content:
+            size += len(chunk)
+            yield chunk
+    finally:
+        registry.add_bytes(view, role, size)
+
+
+def _record(request, response, started, current):
+    elapsed = time.perf_counter() - started
+    view, role = _labels(request)
+    queries, sql_seconds, render_seconds = current
+    registry.observe(view, role, response.status_code, elapsed, queries, sql_seconds, render_seconds)
+
+    if not response.streaming:
+        registry.add_bytes(view, role, len(response.content))
+    elif not getattr(response, "is_async", False):
+        response.streaming_content = _counted(response.streaming_content, view, role)
+
+    config = settings.METRICS
+    if config["SERVER_TIMING"]:
+        response["Server-Timing"] = (
+            f'app;dur={elapsed * 1000:.1f}, '
+            f'db;dur={sql_seconds * 1000:.1f};desc="{queries} queries", '
+            f'tpl;dur={render_seconds * 1000:.1f}'
+        )
+    registry.flush(config["DIR"])
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if not settings.METRICS["ENABLED"]:
+        raise MiddlewareNotUsed
+    install()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            current = [0, 0.0, 0.0]
+            token = _current.set(current)
+            started = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            _record(request, response, started, current)
+            return response
+    else:
+        def middleware(request):
+            current = [0, 0.0, 0.0]
+            token = _current.set(current)
+            started = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            _record(request, response, started, current)
+            return response
+
+    return middleware
+
+
+# ---------------------------
+# Exposition
+# ---------------------------
+
+def _merge(paths):
+    latency, counters = {}, {}
+    for path in paths:
+        try:
+            with open(path) as source:
+                data = json.load(source)
+        except (OSError, ValueError):
+            continue  # being replaced or removed
+        for labels, values in data["latency"]:
+            totals = latency.setdefault(tuple(labels), [0] * len(values))
+            for i, value in enumerate(values):
+                totals[i] += value
+        for name, labels, value in data["counters"]:
+            key = (name, tuple(labels))
+            counters[key] = counters.get(key, 0) + value
+    return latency, counters
+
+
+def fold_workers(directory, pids=None):
+    """Fold the files of exited workers (`pids`, or every dead pid) into AGGREGATE_FILE."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as lock:
+        # One folder at a time, across processes
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = []
+        for path in glob.glob(os.path.join(directory, "*.json")):
+            name = os.path.basename(path)[:-len(".json")]
+            if not name.isdigit():
+                continue
+            pid = int(name)
+            if (pid in pids) if pids is not None else not pid_alive(pid):
+                dead.append(path)
+        if not dead:
+            return
+
+        aggregate = os.path.join(directory, AGGREGATE_FILE)
+        latency, counters = _merge([aggregate, *dead])
+        data = {
+            "latency": [[list(labels), values] for labels, values in latency.items()],
+            "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        }
+        with open(f"{aggregate}.tmp", "w") as out:
+            json.dump(data, out)
+        os.replace(f"{aggregate}.tmp", aggregate)
+        for path in dead:
+            os.remove(path)
+
+
+def _collect(directory):
+    fold_workers(directory)
+    return _merge(glob.glob(os.path.join(directory, "*.json")))
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name, names, values, value):
+    labels = ",".join(f'{key}="{_escape(str(item))}"' for key, item in zip(names, values))
+    return f"clinic_{name}{{{labels}}} {value}" if labels else f"clinic_{name} {value}"
+
+
+def render_metrics():
+    directory = settings.METRICS["DIR"]
+    registry.flush(directory, force=True)
+    latency, counters = _collect(directory)
+
+    lines = [
+        "# HELP clinic_http_request_duration_seconds Request latency by view and role.",
+        "# TYPE clinic_http_request_duration_seconds histogram",
+    ]
+    for labels, values in sorted(latency.items()):
+        cumulative = 0
+        for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), values):
+            cumulative += count
+            lines.append(_series("http_request_duration_seconds_bucket", ("view", "role", "le"), (*labels, bound), cumulative))
+        lines.append(_series("http_request_duration_seconds_sum", ("view", "role"), labels, round(values[-1], 6)))
+        lines.append(_series("http_request_duration_seconds_count", ("view", "role"), labels, cumulative))
+
+    label_names = {
+        "http_responses": ("view", "role", "status"),
+        "login_rejected": ("reason",),
+        "db_pool_checkouts": ("alias",),
+        "db_pool_timeouts": ("alias",),
+        "db_pool_connects": ("alias",),
+    }
+    helps = {
+        **COUNTERS,
+        "login_allowed": "Login attempts let through to authenticate().",
+        "login_rejected": "Login attempts turned away by the throttle.",
+        "db_pool_checkouts": "Connections checked out of the pool.",
+        "db_pool_timeouts": "Pool checkouts that timed out.",
+        "db_pool_connects": "New database connections opened by the pool.",
+    }
+    for name, help_text in helps.items():
+        series = sorted((labels, value) for (counter, labels), value in counters.items() if counter == name)
+        if not series:
+            continue
+        lines.append(f"# HELP clinic_{name}_total {help_text}")
+        lines.append(f"# TYPE clinic_{name}_total counter")
+        for labels, value in series:
+            names = label_names.get(name, ("view", "role"))
+            lines.append(_series(f"{name}_total", names, labels, round(value, 6)))
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    token = settings.METRICS["TOKEN"]
+    if not token:
+        raise Http404
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {token}".encode()):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'date', 'start_time'], name='appt_patient_date_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['provider', 'date', 'status'], name='appt_provider_date_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['provider', 'date', 'start_time'], name='appt_provider_date_start_idx'),
+        ),
+    ]
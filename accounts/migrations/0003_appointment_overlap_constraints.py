@@ -0,0 +1,98 @@
+from django.db import migrations
+
+# Exclusion constraints are Postgres-only (GiST over a tsrange), so they are
+# created with raw SQL and skipped on other backends, where
+# accounts.booking falls back to row locking + an overlap query.
+#
+# Rejected appointments are left out of both constraints. Rows that already
+# overlap would make ADD CONSTRAINT fail, so they are resolved first by
+# rejecting all but one of them; nothing is deleted:
+#
+#   a patient's overlapping appointments: the approved one, else the
+#   earliest booked, is kept;
+#   a provider's overlapping approved appointments: the earliest approved
+#   is kept.
+
+SLOT = "tsrange(date + start_time, date + end_time, '[)')"
+
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""
+    ALTER TABLE accounts_appointment
+    ADD CONSTRAINT appointment_provider_no_overlap
+    EXCLUDE USING gist (provider_id WITH =, {SLOT} WITH &&)
+    WHERE (status = 'approved')
+    """,
+    f"""
+    ALTER TABLE accounts_appointment
+    ADD CONSTRAINT appointment_patient_no_overlap
+    EXCLUDE USING gist (patient_id WITH =, {SLOT} WITH &&)
+    WHERE (status <> 'rejected')
+    """,
+]
+
+DROP_SQL = [
+    "ALTER TABLE accounts_appointment DROP CONSTRAINT IF EXISTS appointment_patient_no_overlap",
+    "ALTER TABLE accounts_appointment DROP CONSTRAINT IF EXISTS appointment_provider_no_overlap",
+]
+
+
+def _losers(rows, rank):
+    # Rows overlapping a better-ranked row of the same owner and day
+    kept, losers = {}, []
+    for row in sorted(rows, key=rank):
+        slots = kept.setdefault((row["owner"], row["date"]), [])
+        if any(row["start_time"] < end and start < row["end_time"] for start, end in slots):
+            losers.append(row)
+        else:
+            slots.append((row["start_time"], row["end_time"]))
+    return losers
+
+
+def _rows(queryset, owner):
+    return [
+        {**row, "owner": row[owner]}
+        for row in queryset.values(
+            "id", "patient_id", "provider_id", "date", "start_time", "end_time", "status", "created_at"
+        ).iterator()
+    ]
+
+
+def resolve_overlaps(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Appointment = apps.get_model("accounts", "Appointment")
+    appointments = Appointment.objects.using(schema_editor.connection.alias)
+
+    losers = _losers(
+        _rows(appointments.exclude(status="rejected"), "patient_id"),
+        lambda row: (row["status"] != "approved", row["created_at"], row["id"]),
+    )
+    appointments.filter(id__in=[row["id"] for row in losers]).update(status="rejected")
+
+    losers = _losers(
+        _rows(appointments.filter(status="approved"), "provider_id"),
+        lambda row: (row["created_at"], row["id"]),
+    )
+    appointments.filter(id__in=[row["id"] for row in losers]).update(status="rejected")
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != "postgresql":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_appointment_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_overlaps, migrations.RunPython.noop),
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
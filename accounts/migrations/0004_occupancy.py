@@ -0,0 +1,35 @@
+# Generated by Django 4.2.27 on 2026-10-18 09:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_occupancy(apps, schema_editor):
+    from accounts.occupancy import rebuild
+    rebuild(apps.get_model('accounts', 'Appointment'), apps.get_model('accounts', 'Occupancy'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_appointment_overlap_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Occupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('provider', 'Provider'), ('patient', 'Patient')], max_length=10)),
+                ('date', models.DateField()),
+                ('minutes', models.BinaryField(max_length=180)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='occupancy',
+            constraint=models.UniqueConstraint(fields=('user', 'kind', 'date'), name='occupancy_user_kind_date_uniq'),
+        ),
+        migrations.RunPython(backfill_occupancy, migrations.RunPython.noop),
+    ]
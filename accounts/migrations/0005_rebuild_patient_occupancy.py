@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+def rebuild_occupancy(apps, schema_editor):
+    # Patient bitmaps no longer hold rejected appointments
+    from accounts.occupancy import rebuild
+    rebuild(apps.get_model('accounts', 'Appointment'), apps.get_model('accounts', 'Occupancy'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_occupancy'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_occupancy, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.27 on 2026-10-18 11:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_rebuild_patient_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduleVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='schedule_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('version', models.BigIntegerField()),
+            ],
+        ),
+    ]
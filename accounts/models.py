@@ -56,6 +56,13 @@ class User(AbstractUser):
     def is_admin(self):
         return self.role == "admin"
 
+    def get_session_auth_hash(self):
+        # Users rebuilt from the auth cache (accounts.backends) carry the
+        # hash instead of the password; after set_password() it's computed
+        if "password" not in self.__dict__ and "_session_auth_hash" in self.__dict__:
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
     def __str__(self):
         # show full name if available
         if self.first_name or self.last_name:
@@ -63,6 +70,20 @@ class User(AbstractUser):
         return self.username
 
 
+# -----------------------
+# Appointment QuerySet
+# -----------------------
+class AppointmentQuerySet(models.QuerySet):
+
+    def overlapping(self, day, start_time, end_time):
+        # Same-day rows whose [start, end) range intersects the given one
+        return self.filter(
+            date=day,
+            start_time__lt=end_time,
+            end_time__gt=start_time
+        )
+
+
 # -----------------------
 # Appointment Model
 # -----------------------
@@ -86,9 +107,62 @@ class Appointment(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = AppointmentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # patient conflict checks + patient appointment list
+            models.Index(fields=["patient", "date", "start_time"], name="appt_patient_date_start_idx"),
+            # provider conflict checks on approval + month calendar
+            models.Index(fields=["provider", "date", "status"], name="appt_provider_date_status_idx"),
+            # provider upcoming/completed lists + calendar day
+            models.Index(fields=["provider", "date", "start_time"], name="appt_provider_date_start_idx"),
+        ]
+
     def __str__(self):
         return (
             f"{self.patient.first_name} {self.patient.last_name} → "
             f"{self.provider.first_name} {self.provider.last_name} "
             f"on {self.date}"
         )
+
+
+# -----------------------
+# Occupancy Bitmap
+# -----------------------
+class Occupancy(models.Model):
+    # One 1440-bit minute bitmap per (user, kind, date), maintained by
+    # accounts.occupancy. Provider bitmaps hold approved appointments only,
+    # patient bitmaps every appointment the patient has made that isn't
+    # rejected.
+    KIND_CHOICES = (
+        ('provider', 'Provider'),
+        ('patient', 'Patient'),
+    )
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="occupancy")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    date = models.DateField()
+    minutes = models.BinaryField(max_length=180)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "kind", "date"], name="occupancy_user_kind_date_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.user_id} on {self.date}"
+
+
+# -----------------------
+# Schedule Version
+# -----------------------
+class ScheduleVersion(models.Model):
+    # Changes with every change to the user's appointments
+    # (accounts.schedule_cache); cached calendar fragments and API ETags
+    # embed it
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="schedule_version")
+    version = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.user_id} at {self.version}"
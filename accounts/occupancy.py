@@ -0,0 +1,223 @@
+from functools import reduce
+from itertools import groupby
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Appointment, Occupancy
+
+MINUTES_PER_DAY = 24 * 60
+BITMAP_BYTES = MINUTES_PER_DAY // 8
+
+# Which appointments occupy a bitmap of each kind, matching the exclusion
+# constraints of migration 0003: a patient's appointments unless rejected,
+# a provider's approved ones.
+KIND_STATUSES = {
+    "provider": ("approved",),
+    "patient": ("pending", "approved", "reschedule_requested"),
+}
+KIND_FIELDS = {
+    "provider": "provider_id",
+    "patient": "patient_id",
+}
+
+
+# ---------------------------
+# Bitmap helpers
+# ---------------------------
+
+def _minute(t, round_up=False):
+    minute = t.hour * 60 + t.minute
+    if round_up and (t.second or t.microsecond):
+        minute += 1
+    return minute
+
+
+def slot_mask(start_time, end_time):
+    # Bits [start, end) set, one per minute of the day
+    start = _minute(start_time)
+    end = _minute(end_time, round_up=True)
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def to_bytes(mask):
+    return mask.to_bytes(BITMAP_BYTES, "little")
+
+
+def from_bytes(data):
+    return int.from_bytes(bytes(data), "little") if data else 0
+
+
+# ---------------------------
+# Reads
+# ---------------------------
+
+def busy_mask(user_id, kind, day):
+    # One indexed row fetch on (user, kind, date)
+    data = Occupancy.objects.filter(
+        user_id=user_id, kind=kind, date=day
+    ).values_list("minutes", flat=True).first()
+    return from_bytes(data)
+
+
+async def abusy_mask(user_id, kind, day):
+    data = await Occupancy.objects.filter(
+        user_id=user_id, kind=kind, date=day
+    ).values_list("minutes", flat=True).afirst()
+    return from_bytes(data)
+
+
+def is_free(user_id, kind, day, start_time, end_time, ignore=None):
+    # ``ignore`` is a (date, start_time, end_time) slot whose minutes should
+    # not count, e.g. the appointment being rescheduled
+    mask = busy_mask(user_id, kind, day)
+    if ignore is not None and ignore[0] == day:
+        mask &= ~slot_mask(ignore[1], ignore[2])
+    return not (mask & slot_mask(start_time, end_time))
+
+
+def _keys_query(keys):
+    # One OR term per (kind, date), each with its user ids
+    by_day = {}
+    for user_id, kind, day in keys:
+        by_day.setdefault((kind, day), set()).add(user_id)
+    return reduce(or_, (
+        Q(kind=kind, date=day, user_id__in=user_ids)
+        for (kind, day), user_ids in by_day.items()
+    ))
+
+
+def load_masks(keys):
+    # {(user_id, kind, date): mask} for many bitmaps in one query
+    masks = dict.fromkeys(keys, 0)
+    if not masks:
+        return masks
+    for user_id, kind, day, minutes in Occupancy.objects.filter(_keys_query(masks)).values_list(
+        "user_id", "kind", "date", "minutes"
+    ):
+        masks[(user_id, kind, day)] = from_bytes(minutes)
+    return masks
+
+
+def _timeline(mask):
+    hour = (1 << 60) - 1
+    return [
+        {"hour": h, "busy": bool(mask & (hour << (h * 60)))}
+        for h in range(24)
+    ]
+
+
+def hourly_timeline(user_id, kind, day):
+    # Free/busy per hour for calendar shading
+    return _timeline(busy_mask(user_id, kind, day))
+
+
+async def ahourly_timeline(user_id, kind, day):
+    return _timeline(await abusy_mask(user_id, kind, day))
+
+
+# ---------------------------
+# Writes
+# ---------------------------
+
+# Appointment fields that decide which bitmaps it occupies
+STATE_FIELDS = ("patient_id", "provider_id", "date", "start_time", "end_time", "status")
+
+
+def occupied(state):
+    # {(user_id, kind, date): slot mask} for an appointment's STATE_FIELDS
+    # values; {} for None (not in the database)
+    if state is None:
+        return {}
+    values = dict(zip(STATE_FIELDS, state))
+    slot = slot_mask(values["start_time"], values["end_time"])
+    bitmaps = {}
+    for kind, field in KIND_FIELDS.items():
+        statuses = KIND_STATUSES[kind]
+        if slot and values[field] and (not statuses or values["status"] in statuses):
+            bitmaps[(values[field], kind, values["date"])] = slot
+    return bitmaps
+
+
+def move(old, new):
+    # Bit changes for an appointment going from state ``old`` to ``new``
+    changes = {}
+    for key, mask in occupied(old).items():
+        changes[key] = (mask, 0)
+    for key, mask in occupied(new).items():
+        cleared, _ = changes.get(key, (0, 0))
+        changes[key] = (cleared, mask)
+    update_masks(changes)
+
+
+def update_masks(changes):
+    """
+    Apply {(user_id, kind, date): (cleared, added)} to the stored bitmaps:
+    the cleared bits are unset, then the added ones set. The rows are read
+    FOR UPDATE, so concurrent writers to one bitmap keep each other's bits.
+    """
+    # Same bits out and in: already stored
+    changes = {key: change for key, change in changes.items() if change[0] != change[1]}
+    if not changes:
+        return
+
+    rows = {
+        (user_id, kind, day): (pk, from_bytes(minutes))
+        for pk, user_id, kind, day, minutes in Occupancy.objects.select_for_update().filter(
+            _keys_query(changes)
+        ).order_by("id").values_list("id", "user_id", "kind", "date", "minutes")
+    }
+    created, changed, emptied = [], [], []
+    for key, (cleared, added) in changes.items():
+        pk, mask = rows.get(key, (None, 0))
+        updated = (mask & ~cleared) | added
+        if pk is None:
+            if updated:
+                created.append(Occupancy(user_id=key[0], kind=key[1], date=key[2], minutes=to_bytes(updated)))
+        elif not updated:
+            emptied.append(pk)
+        elif updated != mask:
+            changed.append(Occupancy(id=pk, minutes=to_bytes(updated)))
+    if created:
+        Occupancy.objects.bulk_create(created)
+    if changed:
+        Occupancy.objects.bulk_update(changed, ["minutes"], batch_size=500)
+    if emptied:
+        Occupancy.objects.filter(id__in=emptied).delete()
+
+
+def rebuild(appointment_model=Appointment, occupancy_model=Occupancy, batch_size=2000):
+    # Regenerate every bitmap from the appointment table. Takes the models
+    # as arguments so migrations can call it with historical models.
+    def bitmaps(kind):
+        field = KIND_FIELDS[kind]
+        rows = appointment_model.objects.all()
+        if KIND_STATUSES[kind]:
+            rows = rows.filter(status__in=KIND_STATUSES[kind])
+        rows = rows.order_by(field, "date").values_list(
+            field, "date", "start_time", "end_time"
+        ).iterator(chunk_size=batch_size)
+
+        for (user_id, day), group in groupby(rows, key=lambda r: (r[0], r[1])):
+            mask = 0
+            for _, _, start_time, end_time in group:
+                mask |= slot_mask(start_time, end_time)
+            yield occupancy_model(user_id=user_id, kind=kind, date=day, minutes=to_bytes(mask))
+
+    created = 0
+    with transaction.atomic():
+        occupancy_model.objects.all().delete()
+        for kind in KIND_FIELDS:
+            batch = []
+            for bitmap in bitmaps(kind):
+                batch.append(bitmap)
+                if len(batch) >= batch_size:
+                    occupancy_model.objects.bulk_create(batch)
+                    created += len(batch)
+                    batch = []
+            occupancy_model.objects.bulk_create(batch)
+            created += len(batch)
+    return created
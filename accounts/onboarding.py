@@ -0,0 +1,190 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .directory import provider_directory
+from .hashing import hash_passwords, hashing_pool
+from .models import User
+
+# Bulk provider onboarding (admin upload and `onboard_providers` command).
+#
+# Password hashing is the expensive part: each make_password() is a full
+# PBKDF2 run. The command hashes across a process pool (accounts.hashing);
+# admin uploads are capped at settings.PROVIDER_UPLOAD_MAX_ROWS and hash in
+# the web worker, which doesn't pay for starting a pool. Rows are validated
+# against one prefetched set of usernames/emails and inserted with
+# bulk_create per batch.
+
+FIELDS = ("username", "first_name", "last_name", "email", "designation", "password")
+BATCH_SIZE = 500
+
+
+def read_rows(source, fmt="csv"):
+    """Yield (line number, row dict) from a CSV or JSONL text stream."""
+    if fmt == "jsonl":
+        for number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield number, row if isinstance(row, dict) else {"invalid": "invalid JSON object"}
+        return
+
+    reader = csv.DictReader(source)
+    missing = set(FIELDS) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV is missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        yield reader.line_num, row
+
+
+class Onboarding:
+    """
+    One onboarding run. feed() validates, hashes and inserts rows batch by
+    batch; the totals and per-row errors are on the instance afterwards.
+    """
+
+    def __init__(self, workers=1, batch_size=BATCH_SIZE, progress=None):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.progress = progress
+        self.read = 0
+        self.created = 0
+        self.errors = []  # (line, username, error)
+
+        # Existing usernames, and emails compared case-insensitively; rows
+        # accepted from the file are added as they go
+        self.usernames = set()
+        self.emails = set()
+        for username, email in User.objects.values_list("username", "email").iterator():
+            self.usernames.add(username)
+            if email:
+                self.emails.add(email.lower())
+
+    def feed(self, rows):
+        executor = hashing_pool(self.workers) if self.workers > 1 else None
+        try:
+            rows = iter(rows)
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                self._insert(self._hash(self._validate(batch), executor))
+                self.read += len(batch)
+                if self.progress:
+                    self.progress(self)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        self.errors.sort()
+        return self
+
+    def _reject(self, line, row, error):
+        self.errors.append((line, str(row.get("username") or ""), error))
+
+    def _validate(self, batch):
+        valid = []
+        for line, row in batch:
+            if "invalid" in row:
+                self._reject(line, row, row["invalid"])
+                continue
+            values = {field: str(row.get(field) or "").strip() for field in FIELDS}
+            missing = [field for field in FIELDS if not values[field]]
+            if missing:
+                self._reject(line, row, f"missing {', '.join(missing)}")
+                continue
+            values["email"] = User.objects.normalize_email(values["email"])
+            try:
+                validate_email(values["email"])
+            except ValidationError:
+                self._reject(line, row, "invalid email")
+                continue
+            if values["username"] in self.usernames:
+                self._reject(line, row, "username already taken")
+                continue
+            if values["email"].lower() in self.emails:
+                self._reject(line, row, "email already in use")
+                continue
+            self.usernames.add(values["username"])
+            self.emails.add(values["email"].lower())
+            valid.append((line, values))
+        return valid
+
+    def _hash(self, valid, executor):
+        hashes = hash_passwords([values["password"] for _, values in valid], executor, self.workers)
+        return [
+            (line, User(
+                username=values["username"],
+                first_name=values["first_name"],
+                last_name=values["last_name"],
+                email=values["email"],
+                designation=values["designation"],
+                password=password,
+                role="provider",
+                is_staff=False,
+                is_superuser=False,
+            ))
+            for (line, values), password in zip(valid, hashes)
+        ]
+
+    def _drop_taken(self, users):
+        # Usernames/emails taken since the prefetch: report those rows
+        taken_usernames, taken_emails = set(), set()
+        clashes = User.objects.annotate(email_lower=Lower("email")).filter(
+            Q(username__in=[user.username for _, user in users])
+            | Q(email_lower__in=[user.email.lower() for _, user in users])
+        ).values_list("username", "email_lower")
+        for username, email in clashes:
+            taken_usernames.add(username)
+            taken_emails.add(email)
+
+        kept = []
+        for line, user in users:
+            if user.username in taken_usernames:
+                self.errors.append((line, user.username, "username already taken"))
+            elif user.email.lower() in taken_emails:
+                self.errors.append((line, user.username, "email already in use"))
+            else:
+                kept.append((line, user))
+        return kept
+
+    def _insert(self, users):
+        users = self._drop_taken(users) if users else users
+        if not users:
+            return
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([user for _, user in users])
+        except IntegrityError:
+            # Lost a race with another insert: save row by row and report
+            # the rows that clash
+            inserted = []
+            for line, user in self._drop_taken(users):
+                try:
+                    with transaction.atomic():
+                        User.objects.bulk_create([user])
+                except IntegrityError:
+                    self.errors.append((line, user.username, "username or email already in use"))
+                else:
+                    inserted.append((line, user))
+            users = inserted
+        self.created += len(users)
+        # bulk_create skips the signal that refreshes the provider directory
+        transaction.on_commit(provider_directory.invalidate)
+
+    def error_report(self):
+        """The per-row errors as CSV text (no passwords)."""
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["line", "username", "error"])
+        writer.writerows(self.errors)
+        return out.getvalue()
@@ -0,0 +1,130 @@
+import base64
+from datetime import date, time
+
+from django.db.models import Q
+from django.http import QueryDict
+
+PAGE_SIZE = 25
+
+# Keyset pagination over (date, start_time, id). A cursor is the key of the
+# boundary row plus a direction: "n" = rows after it, "p" = rows before it,
+# both in the section's own display order. No OFFSET, so every page costs
+# one index range scan no matter how deep it is.
+
+
+def _row_key(row):
+    # Model instances or .values() dicts
+    if isinstance(row, dict):
+        return row["date"], row["start_time"], row["id"]
+    return row.date, row.start_time, row.id
+
+
+def encode_cursor(direction, row):
+    day, start, pk = _row_key(row)
+    raw = f"{direction}|{day.isoformat()}|{start.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        direction, day, start, pk = raw.split("|")
+        if direction not in ("n", "p"):
+            return None
+        return direction, date.fromisoformat(day), time.fromisoformat(start), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _beyond(key, greater):
+    day, start, pk = key
+    op = "gt" if greater else "lt"
+    return (
+        Q(**{f"date__{op}": day})
+        | Q(date=day, **{f"start_time__{op}": start})
+        | Q(date=day, start_time=start, **{f"id__{op}": pk})
+    )
+
+
+class KeysetPage:
+    def __init__(self, items, param, query, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.param = param
+        self.query = query
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _link(self, cursor):
+        query = self.query.copy()
+        query[self.param] = cursor
+        return "?" + query.urlencode()
+
+    @property
+    def next_link(self):
+        return self._link(self.next_cursor) if self.next_cursor else None
+
+    @property
+    def prev_link(self):
+        return self._link(self.prev_cursor) if self.prev_cursor else None
+
+
+def page_query(queryset, params, param, descending=False, page_size=PAGE_SIZE):
+    """The query of one page (page_size + 1 rows) and the cursor direction."""
+    cursor = decode_cursor(params.get(param, ""))
+    fields = ("date", "start_time", "id")
+    forward = [f"-{f}" for f in fields] if descending else list(fields)
+    backward = list(fields) if descending else [f"-{f}" for f in fields]
+
+    if cursor is None:
+        return queryset.order_by(*forward)[:page_size + 1], None
+    if cursor[0] == "n":
+        return queryset.filter(_beyond(cursor[1:], not descending)).order_by(*forward)[:page_size + 1], "n"
+    return queryset.filter(_beyond(cursor[1:], descending)).order_by(*backward)[:page_size + 1], "p"
+
+
+def _page(rows, direction, params, param, keep, page_size):
+    if direction == "p":
+        has_more, has_less = True, len(rows) > page_size
+        rows = rows[:page_size][::-1]
+    else:
+        has_more, has_less = len(rows) > page_size, direction == "n"
+        rows = rows[:page_size]
+
+    query = QueryDict(mutable=True)
+    for name in keep:
+        if params.get(name):
+            query[name] = params[name]
+
+    return KeysetPage(
+        rows,
+        param,
+        query,
+        next_cursor=encode_cursor("n", rows[-1]) if rows and has_more else None,
+        prev_cursor=encode_cursor("p", rows[0]) if rows and has_less else None,
+    )
+
+
+def paginate(queryset, params, param, descending=False, keep=(), page_size=PAGE_SIZE):
+    """
+    One page of ``queryset`` ordered by (date, start_time, id), ascending or
+    descending. ``params`` is request.GET; the cursor is read from ``param``
+    and the links keep the cursors named in ``keep`` (other sections on the
+    same page).
+    """
+    rows, direction = page_query(queryset, params, param, descending, page_size)
+    return _page(list(rows), direction, params, param, keep, page_size)
+
+
+async def apaginate(queryset, params, param, descending=False, keep=(), page_size=PAGE_SIZE):
+    # paginate() for async views
+    rows, direction = page_query(queryset, params, param, descending, page_size)
+    return _page([row async for row in rows], direction, params, param, keep, page_size)
@@ -0,0 +1,97 @@
+import secrets
+import threading
+
+from django.core.cache import cache
+
+from .models import ScheduleVersion
+
+# Rendered calendar fragments are cached under keys that embed the user's
+# schedule version. Every change to an appointment bumps the version of its
+# provider and patient (accounts.signals, accounts.booking), so old entries
+# are simply never read again and expire on their own; nothing is purged
+# explicitly. The version is a database row, written in the same
+# transaction as the change, so every worker sees it move at commit.
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _new_version():
+    # Random, not a counter: a bump is a blind upsert, and a reset database
+    # never hands out a version the cache has already seen
+    return secrets.randbits(63)
+
+
+def _seed(user_ids):
+    return [ScheduleVersion(user_id=user_id, version=_new_version()) for user_id in user_ids]
+
+
+def _versions(user_id):
+    return ScheduleVersion.objects.filter(user_id=user_id).values_list("version", flat=True)
+
+
+def schedule_version(user_id):
+    version = _versions(user_id).first()
+    if version is None:
+        ScheduleVersion.objects.bulk_create(_seed([user_id]), ignore_conflicts=True)
+        version = _versions(user_id).first()
+    return version
+
+
+async def aschedule_version(user_id):
+    version = await _versions(user_id).afirst()
+    if version is None:
+        await ScheduleVersion.objects.abulk_create(_seed([user_id]), ignore_conflicts=True)
+        version = await _versions(user_id).afirst()
+    return version
+
+
+def bump_schedule_version(*user_ids):
+    # Call inside the transaction that changes the schedule. Sorted so
+    # concurrent bumps lock the rows in the same order.
+    user_ids = sorted({user_id for user_id in user_ids if user_id})
+    if user_ids:
+        ScheduleVersion.objects.bulk_create(
+            _seed(user_ids), update_conflicts=True, unique_fields=["user"], update_fields=["version"]
+        )
+
+
+def cached_fragment(name, user_id, parts, render):
+    """
+    Return ``(html, hit)`` for the fragment ``name`` of ``user_id``.
+    ``parts`` are the other inputs the fragment depends on; ``render`` builds
+    the HTML on a miss.
+    """
+    key = ":".join(str(part) for part in ("fragment", name, user_id, schedule_version(user_id), *parts))
+    html = cache.get(key)
+    hit = html is not None
+
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+
+    if not hit:
+        html = render()
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return html, hit
+
+
+async def acached_fragment(name, user_id, parts, render):
+    # cached_fragment() for async views; ``render`` is a coroutine function
+    key = ":".join(str(part) for part in ("fragment", name, user_id, await aschedule_version(user_id), *parts))
+    html = await cache.aget(key)
+    hit = html is not None
+
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+
+    if not hit:
+        html = await render()
+        await cache.aset(key, html, FRAGMENT_TIMEOUT)
+    return html, hit
+
+
+def fragment_cache_stats():
+    with _stats_lock:
+        return dict(_stats)
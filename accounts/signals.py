@@ -0,0 +1,101 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import occupancy
+from .backends import invalidate_cached_user
+from .directory import provider_directory
+from .models import Appointment, User
+from .schedule_cache import bump_schedule_version
+
+
+def _bump_versions(*keys):
+    bump_schedule_version(*(user_id for key in keys for user_id in key[:2]))
+
+
+def _key(instance):
+    # Read from __dict__ so deferred fields are never loaded here
+    values = instance.__dict__
+    return (values.get("patient_id"), values.get("provider_id"), values.get("date"))
+
+
+def _state(instance):
+    values = instance.__dict__
+    return tuple(values.get(field) for field in occupancy.STATE_FIELDS)
+
+
+def _saved_state(instance):
+    # As written: the fields may still hold raw input such as "09:30"
+    values = instance.__dict__
+    return tuple(
+        Appointment._meta.get_field(field).to_python(values.get(field))
+        for field in occupancy.STATE_FIELDS
+    )
+
+
+def _stored_state(instance):
+    # The row as the database has it (None if there is none)
+    if instance.pk is None:
+        return None
+    return Appointment.objects.filter(pk=instance.pk).values_list(*occupancy.STATE_FIELDS).first()
+
+
+@receiver(post_init, sender=Appointment)
+def remember_occupancy_state(sender, instance, **kwargs):
+    # What the row holds, for the bitmap bits a save or delete moves
+    instance._occupancy_key = _key(instance)
+    instance._occupancy_state = _state(instance)
+
+
+@receiver(pre_save, sender=Appointment)
+@receiver(pre_delete, sender=Appointment)
+def load_occupancy_state(sender, instance, **kwargs):
+    # New rows occupy nothing yet; rows loaded with deferred fields are read
+    if instance._state.adding or None in instance._occupancy_state:
+        instance._occupancy_state = _stored_state(instance)
+
+
+@receiver(post_save, sender=Appointment)
+def sync_schedule_on_save(sender, instance, **kwargs):
+    # Clear the bits of where the appointment was, set those of where it is
+    state = _saved_state(instance)
+    occupancy.move(instance._occupancy_state, state)
+    _bump_versions(instance._occupancy_key, _key(instance))
+    instance._occupancy_key = _key(instance)
+    instance._occupancy_state = state
+
+
+@receiver(post_delete, sender=Appointment)
+def sync_schedule_on_delete(sender, instance, **kwargs):
+    occupancy.move(instance._occupancy_state, None)
+    _bump_versions(instance._occupancy_key, _key(instance))
+
+
+@receiver(post_init, sender=User)
+def remember_role(sender, instance, **kwargs):
+    instance._loaded_role = instance.__dict__.get("role")
+
+
+# What provider_directory() reads
+DIRECTORY_FIELDS = {"username", "first_name", "last_name", "designation", "role"}
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_provider_directory(sender, instance, update_fields=None, **kwargs):
+    # update_last_login() saves last_login alone on every login
+    if update_fields is not None and not DIRECTORY_FIELDS & set(update_fields):
+        return
+    if "provider" in (instance._loaded_role, instance.__dict__.get("role")):
+        transaction.on_commit(provider_directory.invalidate)
+    instance._loaded_role = instance.__dict__.get("role")
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_auth_cache(sender, instance, **kwargs):
+    # Covers password changes too: set_password() + save(). Dropped again
+    # after commit in case a concurrent request re-cached the old row.
+    user_id = instance.pk
+    invalidate_cached_user(user_id)
+    transaction.on_commit(lambda: invalidate_cached_user(user_id))
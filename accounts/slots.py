@@ -0,0 +1,116 @@
+from datetime import time, timedelta
+
+import numpy as np
+
+from .models import Appointment, Occupancy, User
+
+# Statuses that keep a provider busy for the slot search (rejected rows free it)
+BUSY_STATUSES = ("pending", "approved", "reschedule_requested")
+# Longest date window one search may cover, counting both ends
+MAX_WINDOW_DAYS = 31
+
+
+def _minutes(t):
+    return t.hour * 60 + t.minute
+
+
+def _clock(minute):
+    return time(minute // 60, minute % 60).strftime("%H:%M")
+
+
+def _patient_busy(patient_id, days, open_minute, close_minute):
+    # Patient busy minutes come straight from the occupancy bitmaps
+    busy = {}
+    bitmaps = Occupancy.objects.filter(
+        user_id=patient_id, kind="patient", date__in=days
+    ).values_list("date", "minutes")
+    for day, data in bitmaps:
+        minutes = np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8), bitorder="little")
+        busy[day] = minutes[open_minute:close_minute].astype(bool)
+    return busy
+
+
+def find_free_slots(patient, date_from, date_to, duration, designation=None, limit=10,
+                    open_time=time(9, 0), close_time=time(17, 0), step=15, now=None):
+    """
+    Earliest ``limit`` slots of ``duration`` minutes across every matching
+    provider between ``date_from`` and ``date_to`` (inclusive), ordered by
+    date, start time and provider. Each day is scanned for all providers at
+    once as a (providers x minutes) busy matrix.
+    """
+    providers = User.objects.filter(role='provider')
+    if designation:
+        providers = providers.filter(designation__iexact=designation)
+    providers = list(providers.order_by("id").values_list("id", "first_name", "last_name", "designation"))
+    if not providers:
+        return []
+
+    provider_ids = np.array([p[0] for p in providers])
+    open_minute, close_minute = _minutes(open_time), _minutes(close_time)
+    width = close_minute - open_minute
+    if duration <= 0 or duration > width:
+        return []
+
+    days = [date_from + timedelta(days=i) for i in range((date_to - date_from).days + 1)]
+
+    rows = Appointment.objects.filter(
+        provider__role='provider',
+        date__gte=date_from,
+        date__lte=date_to,
+        status__in=BUSY_STATUSES
+    )
+    if designation:
+        rows = rows.filter(provider__designation__iexact=designation)
+    rows = list(rows.values_list("provider_id", "date", "start_time", "end_time"))
+
+    patient_busy = _patient_busy(patient.id, days, open_minute, close_minute)
+    starts = np.arange(0, width - duration + 1, step)
+
+    # Group the busy intervals by day as index arrays
+    by_day = {}
+    for provider_id, day, start, end in rows:
+        by_day.setdefault(day, []).append((provider_id, _minutes(start), _minutes(end)))
+
+    slots = []
+    for day in days:
+        busy = np.zeros((len(providers), width + 1), dtype=np.int32)
+
+        intervals = by_day.get(day)
+        if intervals:
+            ids, s, e = (np.array(column) for column in zip(*intervals))
+            rows_idx = np.searchsorted(provider_ids, ids)
+            s = np.clip(s - open_minute, 0, width)
+            e = np.clip(e - open_minute, 0, width)
+            keep = s < e
+            np.add.at(busy, (rows_idx[keep], s[keep]), 1)
+            np.add.at(busy, (rows_idx[keep], e[keep]), -1)
+
+        taken = np.cumsum(busy, axis=1)[:, :width] > 0
+        if day in patient_busy:
+            taken |= patient_busy[day][np.newaxis, :]
+        if now is not None and day == now.date():
+            taken[:, :max(0, min(width, _minutes(now) + 1 - open_minute))] = True
+
+        # Busy minutes in [start, start + duration) via prefix sums
+        prefix = np.zeros((len(providers), width + 1), dtype=np.int32)
+        np.cumsum(taken, axis=1, out=prefix[:, 1:])
+        free = (prefix[:, starts + duration] - prefix[:, starts]) == 0
+
+        # Transpose so nonzero() walks start time first, then provider
+        start_idx, provider_idx = np.nonzero(free.T)
+        for si, pi in zip(start_idx[:limit - len(slots)], provider_idx[:limit - len(slots)]):
+            provider_id, first_name, last_name, provider_designation = providers[pi]
+            start_minute = open_minute + int(starts[si])
+            slots.append({
+                "provider_id": provider_id,
+                "provider": f"{first_name} {last_name}".strip(),
+                "designation": provider_designation,
+                "date": day.isoformat(),
+                "start_time": _clock(start_minute),
+                "end_time": _clock(start_minute + duration),
+            })
+
+        if len(slots) >= limit:
+            break
+
+    return slots
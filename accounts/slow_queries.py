@@ -0,0 +1,220 @@
+import contextvars
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from .instrumentation import ProcessLog, add_query_wrapper, log_files
+
+# Slow-query log (settings.SLOW_QUERIES). Queries from accounts views that
+# take longer than THRESHOLD_MS are written as JSON lines to a rotating
+# file per process (accounts.instrumentation.ProcessLog), with:
+#
+#   the normalised statement, the view and the accounts/ line that ran
+#   it, parameter types (values are redacted: they are patient data) and,
+#   for a sampled share of SELECTs, the plan: EXPLAIN (ANALYZE, BUFFERS) on
+#   PostgreSQL, EXPLAIN QUERY PLAN on SQLite.
+#
+# EXPLAIN ANALYZE runs the statement a second time, hence the sampling.
+# The log is browsable at admin-dashboard/slow-queries/.
+
+_log_file = ProcessLog(__name__)
+
+ACCOUNTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# Our own frames never count as the call site
+SKIP_FILES = {os.path.join(ACCOUNTS_DIR, name) for name in ("slow_queries.py", "metrics.py", "instrumentation.py")}
+
+_request = contextvars.ContextVar("slow_query_request", default=None)
+
+
+def _log(entry):
+    config = settings.SLOW_QUERIES
+    _log_file.write(json.dumps(entry, default=str), config["LOG_FILE"], config["MAX_BYTES"], config["BACKUP_COUNT"])
+
+
+# ---------------------------
+# Normalising and redacting
+# ---------------------------
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    # Placeholders already stand for the parameters; fold literals and
+    # IN lists too, so one statement shape groups together
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _LITERALS.sub("?", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def redact(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: redact([value])[0] for key, value in params.items()}
+    redacted = []
+    for value in params:
+        if value is None:
+            redacted.append(None)
+        elif isinstance(value, (str, bytes)):
+            redacted.append(f"<{type(value).__name__}:{len(value)}>")
+        else:
+            redacted.append(f"<{type(value).__name__}>")
+    return redacted
+
+
+# ---------------------------
+# Capture
+# ---------------------------
+
+def _call_site(view):
+    # Innermost frame in accounts/ that isn't this instrumentation
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(ACCOUNTS_DIR) and filename not in SKIP_FILES:
+            return f"{os.path.relpath(filename, os.path.dirname(ACCOUNTS_DIR))}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    # Async views await their queries from another thread (sync_to_async),
+    # so only the view itself is known
+    return f"{view.__module__}.{view.__name__}"
+
+
+def _explain(connection, sql, params):
+    if connection.vendor == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) "
+    elif connection.vendor == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+
+    # A raw backend cursor: no execute wrappers, so the EXPLAIN itself is
+    # neither timed nor logged. In a transaction a failing EXPLAIN must not
+    # abort it, hence the savepoint.
+    savepoint = connection.vendor == "postgresql" and not connection.get_autocommit()
+    cursor = connection.create_cursor()
+    try:
+        if savepoint:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+        except Exception as e:
+            if savepoint:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN failed: {e}"
+        if savepoint:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+    finally:
+        cursor.close()
+    # PostgreSQL: one line of text per row; SQLite: (id, parent, -, detail)
+    return "\n".join(str(row[-1]) for row in rows)
+
+
+def _log_slow_query(execute, sql, params, many, context):
+    request = _request.get()
+    match = getattr(request, "resolver_match", None)
+    if match is None or not match.func.__module__.startswith("accounts."):
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    config = settings.SLOW_QUERIES
+    if elapsed_ms >= config["THRESHOLD_MS"]:
+        connection = context["connection"]
+        plan = None
+        if (not many and sql.lstrip()[:6].upper() == "SELECT"
+                and random.random() < config["EXPLAIN_SAMPLE_RATE"]):
+            plan = _explain(connection, sql, params)
+        _log({
+            "time": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "ms": round(elapsed_ms, 2),
+            "view": match.view_name,
+            "path": request.path,
+            "call_site": _call_site(match.func),
+            "sql": normalize(sql),
+            "params": None if many else redact(params),
+            "many": many,
+            "plan": plan,
+            "vendor": connection.vendor,
+        })
+    return result
+
+
+@sync_and_async_middleware
+def slow_query_middleware(get_response):
+    # Makes the request (and so the view) visible to the query wrapper
+    if not settings.SLOW_QUERIES["ENABLED"]:
+        raise MiddlewareNotUsed
+    add_query_wrapper(_log_slow_query)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _request.set(request)
+            try:
+                return await get_response(request)
+            finally:
+                _request.reset(token)
+    else:
+        def middleware(request):
+            token = _request.set(request)
+            try:
+                return get_response(request)
+            finally:
+                _request.reset(token)
+
+    return middleware
+
+
+# ---------------------------
+# Reading the log
+# ---------------------------
+
+def recent_entries(limit=200, view=None):
+    """The newest entries first, across every process's file and backups."""
+    entries = []
+    for name in log_files(settings.SLOW_QUERIES["LOG_FILE"]):
+        try:
+            with open(name, encoding="utf-8") as source:
+                lines = deque(source, maxlen=limit * 4 if view else limit)
+        except FileNotFoundError:
+            continue  # pruned or rotated away meanwhile
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # cut off by a rotation
+            if view is None or entry["view"] == view:
+                entries.append(entry)
+    entries.sort(key=lambda entry: entry["time"], reverse=True)
+    return entries[:limit]
+
+
+def summarize(entries):
+    """Statements grouped by shape and view, slowest total first."""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault((entry["sql"], entry["view"]), {
+            "sql": entry["sql"], "view": entry["view"], "call_site": entry["call_site"],
+            "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+        })
+        group["count"] += 1
+        group["total_ms"] += entry["ms"]
+        group["max_ms"] = max(group["max_ms"], entry["ms"])
+    for group in groups.values():
+        group["avg_ms"] = round(group["total_ms"] / group["count"], 2)
+        group["total_ms"] = round(group["total_ms"], 2)
+    return sorted(groups.values(), key=lambda group: group["total_ms"], reverse=True)
@@ -0,0 +1,77 @@
+// Date/time checks shared by the book and reschedule forms. The slot
+// search endpoint comes from the results list's data-url attribute.
+
+function today() {
+    return new Date().toISOString().split("T")[0];
+}
+
+function setMinDate() {
+    document.getElementsByName("date")[0].setAttribute("min", today());
+}
+
+function adjustTimeRestrictions() {
+    let dateInput = document.getElementsByName("date")[0].value;
+    let startInput = document.getElementById("start_time");
+
+    let now = new Date();
+    let currentTime = now.toISOString().substring(11, 16); // local HH:MM
+
+    if (dateInput === today()) {
+        // If booking today → enforce min time = now
+        startInput.min = currentTime;
+    } else {
+        startInput.min = "00:00"; // no restrictions
+    }
+}
+
+function validateTime() {
+    let start = document.getElementById("start_time").value;
+    let end = document.getElementById("end_time").value;
+
+    if (start && end && end <= start) {
+        alert("❌ End time must be AFTER start time.");
+        document.getElementById("end_time").value = "";
+    }
+}
+
+function findSlots() {
+    let params = new URLSearchParams({
+        designation: document.getElementById("slot_designation").value,
+        duration: document.getElementById("slot_duration").value
+    });
+    let results = document.getElementById("slot_results");
+    results.innerHTML = "";
+
+    fetch(results.dataset.url + "?" + params)
+        .then(response => response.json())
+        .then(data => {
+            if (data.error) {
+                alert("❌ " + data.error);
+                return;
+            }
+            if (!data.slots.length) {
+                results.innerHTML = "<li>No free slots in the next 7 days.</li>";
+            }
+            data.slots.forEach(slot => {
+                let item = document.createElement("li");
+                let link = document.createElement("a");
+                link.href = "#";
+                link.textContent = slot.date + " " + slot.start_time + "–" + slot.end_time +
+                    " with " + slot.provider + " (" + slot.designation + ")";
+                link.onclick = function () {
+                    document.getElementsByName("provider")[0].value = slot.provider_id;
+                    document.getElementsByName("date")[0].value = slot.date;
+                    document.getElementById("start_time").value = slot.start_time;
+                    document.getElementById("end_time").value = slot.end_time;
+                    return false;
+                };
+                item.appendChild(link);
+                results.appendChild(item);
+            });
+        });
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+    setMinDate();
+    adjustTimeRestrictions();
+});
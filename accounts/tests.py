@@ -1,3 +1,1107 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time as clock
+import zipfile
+from datetime import date, time, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from clinic_appointment.db.pool import ConnectionPool, PoolTimeout
+
+from . import metrics, occupancy, slow_queries, tracing
+from .booking import (
+    PATIENT_OVERLAP, PROVIDER_OVERLAP, BookingConflict, _write, approve_appointment, book_appointment,
+    decide_appointments, reschedule_appointment,
+)
+from .directory import provider_directory
+from .instrumentation import process_path
+from .management.commands.benchmark_views import missing_scenarios
+from .onboarding import Onboarding
+from .schedule_cache import bump_schedule_version, schedule_version
+from .models import Appointment, Occupancy, User
+from .slots import MAX_WINDOW_DAYS, find_free_slots
+from .throttle import login_throttle
+from .tiered_cache import TieredCache
+
+
+class QueryBudgetTests(TestCase):
+    # Page query counts must not grow with the number of appointments.
+    # The session comes from the cache; the first page after login costs
+    # 1 query for the user row, later pages read it from the cache too.
+    # Cached calendar fragments cost 1 query for the schedule version.
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="pw", role="patient")
+        cls.provider = User.objects.create_user(
+            "provider", password="pw", role="provider",
+            first_name="Ada", last_name="Lovelace", designation="GP"
+        )
+        cls.today = date.today()
+
+        patients = [
+            User.objects.create_user(f"patient{i}", password="pw", role="patient", first_name=f"P{i}")
+            for i in range(5)
+        ]
+        patients.append(cls.patient)
+
+        appointments = []
+        for i in range(30):
+            appointments.append(Appointment(
+                patient=patients[i % len(patients)],
+                provider=cls.provider,
+                date=cls.today + timedelta(days=i - 15),
+                start_time=time(9 + i % 8, 0),
+                end_time=time(9 + i % 8, 30),
+                reason="Checkup",
+                status="approved" if i % 2 else "pending"
+            ))
+        # Several on the same day for the calendar day view
+        for i, patient in enumerate(patients):
+            appointments.append(Appointment(
+                patient=patient,
+                provider=cls.provider,
+                date=cls.today,
+                start_time=time(18, i * 5),
+                end_time=time(18, i * 5 + 5),
+                reason="Follow-up"
+            ))
+        Appointment.objects.bulk_create(appointments)
+        # bulk_create() skips the signals that bump the versions
+        bump_schedule_version(*(user.id for user in patients), cls.provider.id)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_appointment_list(self):
+        self.client.force_login(self.patient)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("appointment_list"))
+
+    def test_provider_appointments(self):
+        self.client.force_login(self.provider)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("provider_appointments"))
+
+    def test_provider_calendar(self):
+        self.client.force_login(self.provider)
+        with self.assertNumQueries(3):
+            self.client.get(reverse("provider_calendar"))
+        # Unchanged schedule: the grid comes from the fragment cache
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("provider_calendar"))
+        self.assertEqual(response["X-Fragment-Cache"], "hit")
+
+    def test_calendar_day_cache_follows_schedule_version(self):
+        self.client.force_login(self.provider)
+        url = reverse("provider_calendar_day", args=[self.today.year, self.today.month, self.today.day])
+        self.client.get(url)
+
+        appointment = Appointment.objects.filter(provider=self.provider, date=self.today).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+
+        response = self.client.get(url)
+        self.assertEqual(response["X-Fragment-Cache"], "miss")
+
+    def test_schedule_version_is_stored_with_the_schedule(self):
+        version = schedule_version(self.provider.id)
+        cache.clear()
+        self.assertEqual(schedule_version(self.provider.id), version)
+        # Bumped with the change and rolled back with it
+        with transaction.atomic():
+            Appointment.objects.filter(provider=self.provider).first().delete()
+            self.assertNotEqual(schedule_version(self.provider.id), version)
+            transaction.set_rollback(True)
+        self.assertEqual(schedule_version(self.provider.id), version)
+
+    def test_provider_calendar_day(self):
+        self.client.force_login(self.provider)
+        url = reverse("provider_calendar_day", args=[self.today.year, self.today.month, self.today.day])
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertContains(response, "P0")
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="pw", role="patient")
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+        start = date.today() - timedelta(days=60)
+        Appointment.objects.bulk_create([
+            Appointment(
+                patient=cls.patient,
+                provider=cls.provider,
+                date=start + timedelta(days=i // 2),
+                start_time=time(10, 0),
+                end_time=time(10, 30),
+                reason="Checkup",
+            )
+            for i in range(60)
+        ])
+
+    def test_pages_cover_history_once(self):
+        self.client.force_login(self.provider)
+        seen = []
+        url = reverse("provider_appointments")
+        while url:
+            response = self.client.get(url)
+            page = response.context["completed"]
+            seen.extend(a.id for a in page)
+            url = page.next_link and reverse("provider_appointments") + page.next_link
+
+        self.assertEqual(len(seen), 60)
+        self.assertEqual(len(set(seen)), 60)
+
+    def test_previous_link_returns_same_page(self):
+        self.client.force_login(self.provider)
+        url = reverse("provider_appointments")
+        first = self.client.get(url).context["completed"]
+        second = self.client.get(url + first.next_link).context["completed"]
+        back = self.client.get(url + second.prev_link).context["completed"]
+
+        self.assertEqual([a.id for a in back], [a.id for a in first])
+        self.assertIsNone(back.prev_link)
+
+
+class ConditionalApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="pw", role="patient")
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.provider)
+        self.url = reverse("api_provider_appointments")
+
+    def book(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Appointment.objects.create(
+                patient=self.patient, provider=self.provider, date=date.today() + timedelta(days=1),
+                start_time=time(10, 0), end_time=time(10, 30), reason="Checkup"
+            )
+
+    def test_unchanged_schedule_is_not_modified(self):
+        self.book()
+        etag = self.client.get(self.url)["ETag"]
+        # Just the schedule version
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_survives_a_cache_reset(self):
+        # As seen from another worker, whose cache never saw the first request
+        self.book()
+        etag = self.client.get(self.url)["ETag"]
+        cache.clear()
+        self.client.force_login(self.provider)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_appointment_changes_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()["results"], [])
+
+        self.book()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+
+class BookingConflictTests(TestCase):
+    # The same rules on both backends: Postgres through the exclusion
+    # constraints, others through the lock + bitmap check
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="pw", role="patient")
+        cls.other = User.objects.create_user("other", password="pw", role="patient")
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+        cls.day = date.today() + timedelta(days=2)
+
+    def book(self, patient, start, end):
+        return book_appointment(patient, self.provider, self.day, start, end, "Checkup")
+
+    def test_patient_overlap_is_a_conflict_unless_rejected(self):
+        first = self.book(self.patient, time(9, 0), time(9, 30))
+        with self.assertRaises(BookingConflict) as raised:
+            self.book(self.patient, time(9, 15), time(9, 45))
+        self.assertEqual(raised.exception.constraint, PATIENT_OVERLAP)
+
+        first.status = "rejected"
+        first.save()
+        self.book(self.patient, time(9, 15), time(9, 45))
+
+    def test_provider_overlap_is_a_conflict_on_approval(self):
+        approve_appointment(self.book(self.patient, time(9, 0), time(9, 30)))
+        second = self.book(self.other, time(9, 15), time(9, 45))
+        with self.assertRaises(BookingConflict) as raised:
+            approve_appointment(second)
+        self.assertEqual(raised.exception.constraint, PROVIDER_OVERLAP)
+        second.refresh_from_db()
+        self.assertEqual(second.status, "pending")
+
+    def test_exclusion_violation_maps_to_conflict(self):
+        def violation(constraint):
+            # Django's IntegrityError wraps the driver's, which names the constraint
+            cause = Exception("conflicting key value violates exclusion constraint")
+            cause.diag = mock.Mock(constraint_name=constraint)
+            error = IntegrityError(*cause.args)
+            error.__cause__ = cause
+            return mock.Mock(side_effect=error)
+
+        with mock.patch("accounts.booking.has_exclusion_constraints", return_value=True):
+            with self.assertRaises(BookingConflict) as raised:
+                _write(violation(PATIENT_OVERLAP), self.patient.id, PATIENT_OVERLAP, None)
+            self.assertEqual(raised.exception.constraint, PATIENT_OVERLAP)
+            # Any other integrity error is not a booking conflict
+            with self.assertRaises(IntegrityError):
+                _write(violation("accounts_appointment_pkey"), self.patient.id, PATIENT_OVERLAP, None)
+
+    @skipUnless(connection.vendor == "postgresql", "exclusion constraints are Postgres-only")
+    def test_constraints_reject_direct_inserts(self):
+        def create(patient, status):
+            return Appointment.objects.create(
+                patient=patient, provider=self.provider, date=self.day,
+                start_time=time(9, 0), end_time=time(9, 30), reason="Checkup", status=status
+            )
+
+        create(self.patient, "approved")
+        create(self.patient, "rejected")
+        for patient, status in ((self.patient, "pending"), (self.other, "approved")):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                create(patient, status)
+
+
+class BulkDecisionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+        cls.day = date.today() + timedelta(days=3)
+        # 09:00, 09:10, 09:20, 09:30, each 15 minutes: neighbours overlap
+        cls.appointments = [
+            Appointment.objects.create(
+                patient=User.objects.create_user(f"patient{i}", password="pw", role="patient"),
+                provider=cls.provider, date=cls.day,
+                start_time=time(9, 10 * i), end_time=time(9, 10 * i + 15), reason="Checkup"
+            )
+            for i in range(4)
+        ]
+
+    def test_earliest_created_wins_and_occupancy_follows(self):
+        self.client.force_login(self.provider)
+        response = self.client.post(reverse("provider_bulk_decide"), {
+            "action": "approve", "ids": [a.id for a in self.appointments],
+        })
+
+        outcomes = [outcome for _, outcome in response.context["results"]]
+        self.assertEqual(outcomes, ["approved", "clash", "approved", "clash"])
+        self.assertEqual(
+            list(Appointment.objects.filter(provider=self.provider).order_by("start_time").values_list("status", flat=True)),
+            ["approved", "pending", "approved", "pending"]
+        )
+        self.assertFalse(occupancy.is_free(self.provider.id, "provider", self.day, time(9, 25), time(9, 30)))
+        self.assertTrue(occupancy.is_free(self.provider.id, "provider", self.day, time(9, 15), time(9, 20)))
+
+    def test_bits_stored_after_the_read_are_kept(self):
+        load_masks = occupancy.load_masks
+        elsewhere = occupancy.slot_mask(time(12, 0), time(12, 30))
+
+        def load_then_concurrent_approval(keys):
+            masks = load_masks(keys)
+            # Another approval the same day lands between read and write
+            occupancy.update_masks({(self.provider.id, "provider", self.day): (0, elsewhere)})
+            return masks
+
+        with mock.patch.object(occupancy, "load_masks", load_then_concurrent_approval):
+            decide_appointments(self.provider, "approve", ids=[self.appointments[0].id])
+
+        self.assertFalse(occupancy.is_free(self.provider.id, "provider", self.day, time(9, 0), time(9, 15)))
+        self.assertFalse(occupancy.is_free(self.provider.id, "provider", self.day, time(12, 0), time(12, 30)))
+
+
+class OccupancySyncTests(TestCase):
+    # Saves and deletes move bitmap bits in place; the result must match a
+    # rebuild from the appointment rows
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="pw", role="patient")
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+        cls.day = date.today() + timedelta(days=2)
+
+    def stored(self):
+        return {
+            (o.user_id, o.kind, o.date): occupancy.from_bytes(o.minutes)
+            for o in Occupancy.objects.all()
+        }
+
+    def assertInSync(self):
+        stored = self.stored()
+        occupancy.rebuild()
+        self.assertEqual(stored, self.stored())
+
+    def test_raw_field_values_are_converted(self):
+        appointment = Appointment.objects.create(
+            patient=self.patient, provider=self.provider, date=self.day.isoformat(),
+            start_time="09:00", end_time="09:30", reason="Checkup",
+        )
+        self.assertFalse(occupancy.is_free(self.patient.id, "patient", self.day, time(9, 0), time(9, 30)))
+        appointment.start_time, appointment.end_time = "10:00", "10:15"
+        appointment.save()
+        self.assertTrue(occupancy.is_free(self.patient.id, "patient", self.day, time(9, 0), time(9, 30)))
+        self.assertInSync()
+
+    def test_bitmaps_follow_booking_reschedule_reject_and_delete(self):
+        first = book_appointment(self.patient, self.provider, self.day, time(9, 0), time(9, 30), "Checkup")
+        second = book_appointment(self.patient, self.provider, self.day, time(10, 0), time(10, 30), "Checkup")
+        approve_appointment(first)
+        approve_appointment(second)
+        self.assertInSync()
+
+        reschedule_appointment(first, self.day + timedelta(days=1), time(11, 0), time(11, 45))
+        self.assertFalse(occupancy.is_free(self.patient.id, "patient", self.day + timedelta(days=1), time(11, 30), time(12, 0)))
+        self.assertTrue(occupancy.is_free(self.provider.id, "provider", self.day, time(9, 0), time(9, 30)))
+        self.assertInSync()
+
+        second.status = "rejected"
+        second.save()
+        self.assertTrue(occupancy.is_free(self.provider.id, "provider", self.day, time(10, 0), time(10, 30)))
+        self.assertInSync()
+
+        # Loaded with deferred fields: the stored row is read before the move
+        Appointment.objects.only("id").get(id=first.id).delete()
+        second.delete()
+        self.assertEqual(self.stored(), {})
+
+    def test_bulk_rejection_frees_the_patients(self):
+        appointment = book_appointment(self.patient, self.provider, self.day, time(9, 0), time(9, 30), "Checkup")
+        decide_appointments(self.provider, "reject", ids=[appointment.id])
+        self.assertTrue(occupancy.is_free(self.patient.id, "patient", self.day, time(9, 0), time(9, 30)))
+        self.assertInSync()
+
+    def test_approval_writes_only_the_provider_bitmap(self):
+        appointment = book_appointment(self.patient, self.provider, self.day, time(9, 0), time(9, 30), "Checkup")
+        # The patient bits stay; one locked read and one insert for the provider's
+        with self.assertNumQueries(2):
+            occupancy.move(
+                (appointment.patient_id, appointment.provider_id, self.day, time(9, 0), time(9, 30), "pending"),
+                (appointment.patient_id, appointment.provider_id, self.day, time(9, 0), time(9, 30), "approved"),
+            )
+
+
+class ImportAppointmentsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("alice", "bob"):
+            User.objects.create_user(name, password="pw", role="patient")
+        cls.provider = User.objects.create_user("drlee", password="pw", role="provider")
+        cls.day = date.today() + timedelta(days=7)
+        Appointment.objects.create(
+            patient=User.objects.get(username="bob"), provider=cls.provider, date=cls.day,
+            start_time=time(8, 0), end_time=time(8, 30), reason="Stored", status="approved"
+        )
+
+    def run_import(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, "w", encoding="utf-8") as out:
+            out.write(content)
+        call_command("import_appointments", path, stdout=io.StringIO())
+        rejects = f"{path}.rejects.{name.rsplit('.', 1)[1]}"
+        if not os.path.exists(rejects):
+            return []
+        with open(rejects, encoding="utf-8") as source:
+            return source.read().splitlines()
+
+    def test_rows_are_imported_or_rejected_with_a_reason(self):
+        day = self.day.isoformat()
+        rejects = self.run_import("old.csv", "\n".join([
+            "patient,provider,date,start_time,end_time,reason,status",
+            f"alice,drlee,{day},09:00,09:30,First,approved",
+            # Starts earlier, so the sweep accepts it and rejects the 09:00 row
+            f"alice,drlee,{day},08:45,09:15,Earlier,pending",
+            f"bob,drlee,{day},09:10,09:40,Second,approved",
+            f"bob,drlee,{day},09:30,10:00,Rejected rows take no time,rejected",
+            f"bob,drlee,{day},08:15,08:45,Stored clash,pending",
+            f"carol,drlee,{day},11:00,11:30,Who,pending",
+            f"alice,bob,{day},12:00,12:30,Role,pending",
+            f"alice,drlee,{day},13:30,13:00,Backwards,pending",
+            "",
+        ]))
+
+        self.assertEqual(rejects, [
+            "patient,provider,date,start_time,end_time,reason,status,error",
+            f"alice,drlee,{day},09:00,09:30,First,approved,overlaps another patient appointment in the file",
+            f"bob,drlee,{day},08:15,08:45,Stored clash,pending,overlaps an existing patient appointment",
+            f"carol,drlee,{day},11:00,11:30,Who,pending,unknown patient",
+            f"alice,bob,{day},12:00,12:30,Role,pending,provider user has role patient",
+            f"alice,drlee,{day},13:30,13:00,Backwards,pending,end time must be after start time",
+        ])
+        self.assertEqual(
+            sorted(Appointment.objects.exclude(reason="Stored").values_list("reason", flat=True)),
+            ["Earlier", "Rejected rows take no time", "Second"],
+        )
+        self.assertTrue(occupancy.is_free(self.provider.id, "provider", self.day, time(8, 45), time(9, 10)))
+        self.assertFalse(occupancy.is_free(self.provider.id, "provider", self.day, time(9, 30), time(9, 40)))
+
+    def test_provider_overlaps_within_the_file_are_rejected(self):
+        day = self.day.isoformat()
+        rejects = self.run_import("old.jsonl", "\n".join(json.dumps(row) for row in [
+            {"patient": "alice", "provider": "drlee", "date": day, "start_time": "10:00", "end_time": "10:30", "status": "approved"},
+            {"patient": "bob", "provider": "drlee", "date": day, "start_time": "10:15", "end_time": "10:45", "status": "approved"},
+            {"patient": "bob", "provider": "drlee", "date": day, "start_time": "10:15", "end_time": "10:45", "status": "pending"},
+        ]) + "\nnot json\n")
+
+        self.assertEqual([json.loads(line)["error"] for line in rejects], [
+            "overlaps another provider appointment in the file",
+            "invalid JSON object",
+        ])
+        self.assertEqual(json.loads(rejects[0])["patient"], "bob")
+        self.assertEqual(Appointment.objects.filter(date=self.day).count(), 3)
+
+
+class SeedClinicTests(TestCase):
+
+    def seed(self, prefix, seed=7):
+        call_command(
+            "seed_clinic", providers=4, patients=6, appointments=400, past_days=3, future_days=3,
+            seed=seed, prefix=prefix, stdout=io.StringIO(),
+        )
+        rows = Appointment.objects.filter(patient__username__startswith=f"{prefix}_").values_list(
+            "patient__username", "provider__username", "provider__designation",
+            "date", "start_time", "end_time", "status", "reason",
+        )
+        return sorted(
+            (patient.split("_", 1)[1], provider.split("_", 1)[1], *rest)
+            for patient, provider, *rest in rows
+        )
+
+    def test_same_seed_same_clinic(self):
+        first = self.seed("a")
+        self.assertEqual(len(first), 400)
+        self.assertEqual(self.seed("b"), first)
+        self.assertNotEqual(self.seed("c", seed=8), first)
+
+    def test_no_overlaps_per_provider_or_patient(self):
+        rows = self.seed("a")
+        for owner in (0, 1):
+            slots = sorted((row[owner], row[3], row[4], row[5]) for row in rows)
+            for earlier, later in zip(slots, slots[1:]):
+                if earlier[:2] == later[:2]:
+                    self.assertLessEqual(earlier[3], later[2], earlier)
+
+
+class HealthProbeTests(TestCase):
+
+    def test_probes_skip_session_and_report_ready(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("liveness"))
+        self.assertEqual(response.json(), {"status": "alive"})
+
+        response = self.client.get(reverse("readiness"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+
+class CachedUserTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user("patient", password="old-Secret-1", role="patient")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_after_the_first_skip_session_and_user_queries(self):
+        self.client.force_login(self.patient)
+        self.client.get(reverse("patient_dashboard"))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("patient_dashboard"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_change_logs_out_other_sessions(self):
+        other = self.client_class()
+        other.force_login(self.patient)
+        other.get(reverse("patient_dashboard"))
+
+        self.client.force_login(self.patient)
+        self.client.post(reverse("patient_change_password"), {
+            "old_password": "old-Secret-1",
+            "new_password1": "new-Secret-2",
+            "new_password2": "new-Secret-2",
+        })
+
+        self.assertEqual(self.client.get(reverse("patient_dashboard")).status_code, 200)
+        self.assertEqual(other.get(reverse("patient_dashboard")).status_code, 302)
+
+
+class ProviderOnboardingTests(TestCase):
+    HEADER = "username,first_name,last_name,email,designation,password\n"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", password="pw", role="admin")
+        User.objects.create_user("taken", email="taken@example.com", password="pw", role="provider")
+
+    def test_upload_creates_valid_rows_and_reports_the_rest(self):
+        self.client.force_login(self.admin)
+        data = self.HEADER + (
+            "ada,Ada,Lovelace,ada@example.com,GP,Secret-1\n"
+            "taken,Dup,User,dup@example.com,GP,Secret-2\n"
+            "bob,Bob,Smith,TAKEN@example.com,GP,Secret-3\n"
+            "ada,Ada,Again,ada2@example.com,GP,Secret-4\n"
+            "eve,,Adams,eve@example.com,GP,Secret-5\n"
+        )
+        response = self.client.post(reverse("provider_bulk_add"), {
+            "file": SimpleUploadedFile("providers.csv", data.encode()),
+        })
+
+        run = response.context["run"]
+        self.assertEqual(run.created, 1)
+        self.assertEqual(run.errors, [
+            (3, "taken", "username already taken"),
+            (4, "bob", "email already in use"),
+            (5, "ada", "username already taken"),
+            (6, "eve", "missing first_name"),
+        ])
+        ada = User.objects.get(username="ada")
+        self.assertEqual(ada.role, "provider")
+        self.assertTrue(ada.check_password("Secret-1"))
+
+    @override_settings(PROVIDER_UPLOAD_MAX_ROWS=2)
+    def test_large_uploads_are_sent_to_the_command(self):
+        self.client.force_login(self.admin)
+        data = self.HEADER + "".join(f"doc{i},Doc,{i},doc{i}@example.com,GP,Secret-{i}\n" for i in range(3))
+        response = self.client.post(reverse("provider_bulk_add"), {
+            "file": SimpleUploadedFile("providers.csv", data.encode()),
+        })
+        self.assertIn("onboard_providers", response.context["error"])
+        self.assertFalse(User.objects.filter(username__startswith="doc").exists())
+
+        # Small files are hashed in the web worker, without a process pool
+        with mock.patch("accounts.onboarding.hashing_pool") as pool:
+            response = self.client.post(reverse("provider_bulk_add"), {
+                "file": SimpleUploadedFile("providers.csv", "".join(data.splitlines(True)[:3]).encode()),
+            })
+        self.assertEqual(response.context["run"].created, 2)
+        pool.assert_not_called()
+
+    def test_passwords_hashed_across_worker_processes(self):
+        rows = [
+            (line, {"username": f"doc{line}", "first_name": "Doc", "last_name": str(line),
+                    "email": f"doc{line}@example.com", "designation": "GP", "password": f"Secret-{line}"})
+            for line in range(2, 5)
+        ]
+        run = Onboarding(workers=2, batch_size=2).feed(rows)
+
+        self.assertEqual((run.read, run.created, run.errors), (3, 3, []))
+        self.assertTrue(User.objects.get(username="doc3").check_password("Secret-3"))
+
+    def test_rows_taken_since_the_prefetch_are_row_errors(self):
+        run = Onboarding(workers=1)
+        # Another upload creates these in the meantime
+        User.objects.create_user("ada", email="other@example.com", role="provider")
+        User.objects.create_user("other", email="BOB@example.com", role="provider")
+        run.feed([
+            (2, {"username": "ada", "first_name": "Ada", "last_name": "L", "email": "ada@example.com",
+                 "designation": "GP", "password": "Secret-1"}),
+            (3, {"username": "bob", "first_name": "Bob", "last_name": "S", "email": "bob@example.com",
+                 "designation": "GP", "password": "Secret-2"}),
+        ])
+
+        self.assertEqual(run.created, 0)
+        self.assertEqual(run.errors, [(2, "ada", "username already taken"), (3, "bob", "email already in use")])
+
+
+class ProviderDirectoryTests(TestCase):
+
+    def test_login_keeps_directory_cached(self):
+        provider = User.objects.create_user("provider", password="pw", role="provider")
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(reverse("login"), {"username": "provider", "password": "pw"})
+        self.assertNotIn(provider_directory.invalidate, callbacks)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            provider.designation = "GP"
+            provider.save(update_fields=["designation"])
+        self.assertIn(provider_directory.invalidate, callbacks)
+
+
+class SlotSearchValidationTests(TestCase):
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user("patient", password="pw", role="patient"))
+
+    def search(self, **params):
+        return self.client.get(reverse("appointment_slots"), params)
+
+    def test_each_bad_parameter_gets_its_own_error(self):
+        today = timezone.localdate()
+        self.assertEqual(self.search(limit=0).json(), {"error": "Limit must be at least 1."})
+        self.assertEqual(self.search(duration=1).json(), {"error": "Duration must be at least 5 minutes."})
+
+        last = today + timedelta(days=30)
+        self.assertEqual(self.search(date_from=today, date_to=last).status_code, 200)
+        response = self.search(date_from=today, date_to=last + timedelta(days=1))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("1 to 31 days", response.json()["error"])
+
+
+class SlotSearchTests(TestCase):
+
+    def setUp(self):
+        self.patient = User.objects.create_user("patient", password="pw", role="patient")
+        self.ada = User.objects.create_user("ada", password="pw", role="provider", first_name="Ada")
+        self.bob = User.objects.create_user("bob", password="pw", role="provider", first_name="Bob")
+        self.day = date.today() + timedelta(days=1)
+
+    def book(self, patient, provider, start, end, status="pending", day=None):
+        Appointment.objects.create(
+            patient=patient, provider=provider, date=day or self.day,
+            start_time=start, end_time=end, reason="r", status=status,
+        )
+
+    def starts(self, duration=30, **kwargs):
+        kwargs.setdefault("limit", 100)
+        slots = find_free_slots(self.patient, self.day, self.day, duration, **kwargs)
+        return [(slot["provider"], slot["start_time"]) for slot in slots]
+
+    def test_provider_busy_minutes_block_only_that_provider(self):
+        other = User.objects.create_user("other", password="pw", role="patient")
+        self.book(other, self.ada, time(9, 0), time(9, 50))
+        starts = self.starts(open_time=time(9, 0), close_time=time(10, 30))
+        self.assertEqual(starts, [
+            ("Bob", "09:00"), ("Bob", "09:15"), ("Bob", "09:30"), ("Bob", "09:45"),
+            ("Ada", "10:00"), ("Bob", "10:00"),
+        ])
+
+    def test_patient_busy_minutes_block_every_provider(self):
+        self.book(self.patient, self.ada, time(9, 10), time(9, 20))
+        starts = self.starts(open_time=time(9, 0), close_time=time(10, 0))
+        self.assertEqual(starts, [("Ada", "09:30"), ("Bob", "09:30")])
+
+    def test_rejected_appointments_do_not_block(self):
+        other = User.objects.create_user("other", password="pw", role="patient")
+        self.book(other, self.ada, time(9, 0), time(10, 0), status="rejected")
+        self.book(self.patient, self.bob, time(9, 0), time(10, 0), status="rejected")
+        starts = self.starts(duration=60, open_time=time(9, 0), close_time=time(10, 0))
+        self.assertEqual(starts, [("Ada", "09:00"), ("Bob", "09:00")])
+
+    def test_slots_stay_inside_opening_hours(self):
+        # The last start still ends by closing time
+        starts = self.starts(duration=45, open_time=time(8, 0), close_time=time(9, 0))
+        self.assertEqual(starts, [("Ada", "08:00"), ("Bob", "08:00"), ("Ada", "08:15"), ("Bob", "08:15")])
+        # Appointments outside the opening hours don't leak into them
+        other = User.objects.create_user("other", password="pw", role="patient")
+        self.book(other, self.ada, time(7, 0), time(8, 0))
+        self.book(other, self.bob, time(9, 0), time(10, 0))
+        self.assertEqual(self.starts(duration=60, open_time=time(8, 0), close_time=time(9, 0)),
+                         [("Ada", "08:00"), ("Bob", "08:00")])
+        self.assertEqual(self.starts(duration=61, open_time=time(8, 0), close_time=time(9, 0)), [])
+
+    def test_full_window_reaches_its_last_day(self):
+        # Both providers are booked all day until the last day of the window
+        last = self.day + timedelta(days=MAX_WINDOW_DAYS - 1)
+        others = [User.objects.create_user(f"other{i}", password="pw", role="patient") for i in range(2)]
+        Appointment.objects.bulk_create(
+            Appointment(patient=other, provider=provider, date=self.day + timedelta(days=i),
+                        start_time=time(9, 0), end_time=time(17, 0), reason="r")
+            for other, provider in zip(others, (self.ada, self.bob)) for i in range(MAX_WINDOW_DAYS - 1)
+        )
+        slots = find_free_slots(self.patient, self.day, last, 60, limit=1)
+        self.assertEqual([(s["date"], s["start_time"]) for s in slots], [(last.isoformat(), "09:00")])
+
+
+class AppointmentExportTests(TestCase):
+
+    def test_formula_like_values_are_exported_as_text(self):
+        admin = User.objects.create_user("admin", password="pw", role="admin")
+        patient = User.objects.create_user("patient", password="pw", role="patient", first_name="=HYPERLINK(1)")
+        provider = User.objects.create_user("provider", password="pw", role="provider", last_name="-Smith")
+        Appointment.objects.create(
+            patient=patient, provider=provider, date=date.today(),
+            start_time=time(9, 0), end_time=time(9, 30), reason="@SUM(A1)",
+        )
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse("admin_export_appointments"))
+        text = b"".join(response.streaming_content).decode()
+        self.assertIn("'=HYPERLINK(1),", text)
+        self.assertIn("'-Smith,", text)
+        self.assertIn("'@SUM(A1),", text)
+
+        response = self.client.get(reverse("admin_export_appointments"), {"format": "xlsx"})
+        book = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        sheet = book.read("xl/worksheets/sheet1.xml").decode()
+        self.assertIn('<t xml:space="preserve">\'=HYPERLINK(1)</t>', sheet)
+        self.assertNotIn("<f>", sheet)
+
+
+class LoginThrottleTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        login_throttle.reset()
+        self.patient = User.objects.create_user("patient", password="pw", role="patient")
+
+    def attempt(self, password="wrong"):
+        return self.client.post(reverse("login"), {"username": "Patient ", "password": password})
+
+    @override_settings(LOGIN_THROTTLE={
+        "ENABLED": True, "SHARED": False, "CLIENT_IP_HEADER": "", "TRUSTED_PROXIES": 1,
+        "IP": {"ENABLED": True, "BURST": 100, "PER_MINUTE": 60}, "USERNAME": {"BURST": 3, "PER_MINUTE": 1},
+    })
+    def test_username_over_limit_is_rejected_before_hashing(self):
+        # Successful logins don't use up the allowance
+        for _ in range(5):
+            response = self.client.post(reverse("login"), {"username": "patient", "password": "pw"})
+            self.assertEqual(response.status_code, 302)
+            self.client.logout()
+        for _ in range(3):
+            self.assertEqual(self.attempt().status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.attempt(password="pw")
+        self.assertEqual(response.status_code, 429)
+        # A minute per token, less what refilled while the hashes ran
+        self.assertIn(int(response["Retry-After"]), range(55, 61))
+        self.assertEqual(login_throttle.stats()["rejected"]["username_local"], 1)
+
+    @override_settings(LOGIN_THROTTLE={
+        "ENABLED": True, "SHARED": True, "CLIENT_IP_HEADER": "", "TRUSTED_PROXIES": 1,
+        "IP": {"ENABLED": True, "BURST": 2, "PER_MINUTE": 60}, "USERNAME": {"BURST": 100, "PER_MINUTE": 60},
+    })
+    def test_shared_tier_limits_across_workers(self):
+        for _ in range(2):
+            self.attempt()
+            login_throttle.local.clear()  # the next attempt lands on a fresh worker
+
+        self.assertEqual(self.attempt().status_code, 429)
+        self.assertEqual(login_throttle.stats()["rejected"]["ip_shared"], 1)
+
+    @override_settings(LOGIN_THROTTLE={
+        "ENABLED": True, "SHARED": True, "CLIENT_IP_HEADER": "", "TRUSTED_PROXIES": 1,
+        "IP": {"ENABLED": True, "BURST": 100, "PER_MINUTE": 60}, "USERNAME": {"BURST": 3, "PER_MINUTE": 1},
+    })
+    def test_attempts_in_flight_hold_their_tokens(self):
+        # A parallel burst: every check() runs before any failure is reported
+        request = RequestFactory().post(reverse("login"))
+        self.assertEqual([login_throttle.check(request, "patient") for _ in range(4)], [0, 0, 0, 60])
+        self.assertEqual(cache.get("login-throttle:username:patient"), 3)
+
+        # A successful login hands its tokens back, in both tiers
+        login_throttle.succeeded(request, "patient")
+        self.assertEqual(cache.get("login-throttle:username:patient"), 2)
+        self.assertEqual(cache.get("login-throttle:ip:127.0.0.1"), 2)
+        self.assertEqual(login_throttle.check(request, "patient"), 0)
+        self.assertEqual(login_throttle.check(request, "patient"), 60)
+
+    @override_settings(LOGIN_THROTTLE={
+        "ENABLED": True, "SHARED": False, "CLIENT_IP_HEADER": "HTTP_X_FORWARDED_FOR", "TRUSTED_PROXIES": 1,
+        "IP": {"ENABLED": True, "BURST": 2, "PER_MINUTE": 1}, "USERNAME": {"BURST": 100, "PER_MINUTE": 60},
+    })
+    def test_ip_limit_uses_client_address_behind_proxy(self):
+        # Every request arrives from the balancer; it appends the client address
+        def attempt(client_ip, password="wrong", spoofed=""):
+            return self.client.post(
+                reverse("login"), {"username": "patient", "password": password},
+                REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR=f"{spoofed}{client_ip}",
+            )
+
+        for _ in range(2):
+            attempt("203.0.113.5")
+        self.assertEqual(attempt("203.0.113.5", spoofed="198.51.100.1, ").status_code, 429)
+        # Another patient behind the same balancer still gets in
+        self.assertEqual(attempt("203.0.113.9", password="pw").status_code, 302)
+
+
+class MetricsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(METRICS={
+            "ENABLED": True, "DIR": directory.name, "TOKEN": "secret", "SERVER_TIMING": True,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        metrics.registry.reset()
+
+    def test_view_metrics_are_exposed_and_timed(self):
+        self.client.force_login(self.provider)
+        response = self.client.get(reverse("provider_appointments"))
+        self.assertRegex(response["Server-Timing"], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", tpl;dur=')
+
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 403)
+        text = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        labels = 'view="provider_appointments",role="provider"'
+        self.assertIn(f"clinic_http_request_duration_seconds_count{{{labels}}} 1", text)
+        self.assertIn(f'clinic_http_responses_total{{{labels},status="200"}} 1', text)
+        self.assertRegex(text, rf"clinic_db_queries_total{{{labels}}} [1-9]")
+        self.assertIn(f"clinic_http_response_bytes_total{{{labels}}} {len(response.content)}", text)
+        self.assertEqual(self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secreT").status_code, 403)
+
+        with override_settings(METRICS={**settings.METRICS, "TOKEN": ""}):
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, 404)
+
+    def test_exited_workers_are_folded_into_aggregate(self):
+        directory = settings.METRICS["DIR"]
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        with open(os.path.join(directory, f"{exited.pid}.json"), "w") as out:
+            json.dump({"latency": [], "counters": [["db_queries", ["old_view", "patient"], 7]]}, out)
+
+        for _ in range(2):
+            text = metrics.render_metrics()
+            self.assertIn('clinic_db_queries_total{view="old_view",role="patient"} 7', text)
+        self.assertEqual(sorted(os.listdir(directory)), [".lock", f"{os.getpid()}.json", "aggregate.json"])
+
+
+class SlowQueryLogTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", password="pw", role="admin")
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log_file = os.path.join(directory.name, "logs", "slow.jsonl")
+        settings_override = override_settings(SLOW_QUERIES={
+            "ENABLED": True, "THRESHOLD_MS": 0, "EXPLAIN_SAMPLE_RATE": 1.0,
+            "LOG_FILE": self.log_file, "MAX_BYTES": 1024 * 1024, "BACKUP_COUNT": 1,
+        })
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_queries_are_logged_with_view_call_site_and_plan(self):
+        login_throttle.reset()
+        self.client.post(reverse("login"), {"username": "lovelace", "password": "wrong"})
+        self.client.force_login(self.provider)
+        self.client.get(reverse("provider_appointments"))
+
+        with open(process_path(self.log_file)) as source:
+            entries = [json.loads(line) for line in source]
+        entry = next(e for e in entries if "accounts_appointment" in e["sql"])
+        self.assertEqual(entry["view"], "provider_appointments")
+        self.assertTrue(entry["call_site"].startswith("accounts"))
+        self.assertTrue(entry["plan"])
+        # Parameter values never reach the log, only their types
+        login = next(e for e in entries if e["view"] == "login")
+        self.assertEqual(login["params"][0], "<str:8>")
+        self.assertNotIn("lovelace", json.dumps(entries))
+
+        self.assertEqual(slow_queries.normalize("SELECT 'a' FROM t WHERE id IN (%s, %s, %s) AND n = 10"),
+                         "SELECT ? FROM t WHERE id IN (...) AND n = ?")
+
+        self.client.force_login(self.admin)
+        page = self.client.get(reverse("admin_slow_queries"), {"view": "provider_appointments"})
+        self.assertContains(page, "Top statements")
+        self.assertContains(page, "accounts_appointment")
+
+    def test_each_process_writes_its_own_file(self):
+        def entry(second, view):
+            return json.dumps({"time": f"2026-01-01T00:00:0{second}+00:00", "view": view, "sql": "SELECT ?"})
+
+        # Another worker's file and its backup
+        os.makedirs(os.path.dirname(self.log_file))
+        other = process_path(self.log_file, pid=os.getpid() + 1)
+        with open(other, "w") as out:
+            out.write(entry(3, "a") + "\n")
+        with open(f"{other}.1", "w") as out:
+            out.write(entry(1, "b") + "\n")
+        slow_queries._log(json.loads(entry(2, "c")))
+
+        self.assertTrue(os.path.exists(process_path(self.log_file)))
+        self.assertEqual([e["view"] for e in slow_queries.recent_entries()], ["a", "c", "b"])
+        self.assertEqual([e["view"] for e in slow_queries.recent_entries(limit=2)], ["a", "c"])
+
+    def test_files_of_exited_processes_are_pruned(self):
+        # Pids above the kernel's maximum: never alive
+        os.makedirs(os.path.dirname(self.log_file))
+        exited = [process_path(self.log_file, pid=2 ** 22 + n) for n in range(1, 5)]
+        for age, name in enumerate(exited):
+            with open(name, "w"):
+                pass
+            os.utime(name, (clock.time() - age, clock.time() - age))
+        slow_queries._log({"time": "2026-01-01T00:00:00+00:00", "view": "a"})
+
+        # BACKUP_COUNT + 1 of them are kept, the newest
+        self.assertEqual([os.path.exists(name) for name in exited], [True, True, False, False])
+
+
+@override_settings(TRACING={
+    "ENABLED": True, "SAMPLE_RATE": 1.0, "EXPORTER": "accounts.tracing.InMemoryExporter",
+    "FILE": "", "MAX_BYTES": 0, "BACKUP_COUNT": 0, "MAX_SPANS": 2000,
+})
+class TracingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.provider = User.objects.create_user("provider", password="pw", role="provider")
+
+    def setUp(self):
+        tracing.get_exporter().clear()
+
+    def test_request_spans_nest_checks_queries_and_templates(self):
+        self.client.force_login(self.provider)
+        response = self.client.get(reverse("provider_appointments"))
+
+        spans = tracing.get_exporter().spans
+        self.assertEqual({s.trace_id for s in spans}, {response["X-Trace-Id"]})
+        by_id = {s.span_id: s for s in spans}
+        root = next(s for s in spans if s.parent_id is None)
+        self.assertEqual(root.attributes["view"], "provider_appointments")
+        self.assertTrue(all(s.parent_id in by_id for s in spans if s is not root))
+
+        names = [s.name for s in spans]
+        self.assertIn("role_required", names)
+        self.assertIn("db.query", names)
+        # The included header renders inside the page template
+        header = next(s for s in spans if s.attributes.get("template") == "accounts/provider_header.html")
+        self.assertEqual(by_id[header.parent_id].attributes["template"], "accounts/provider_appointment_list.html")
+        self.assertLessEqual(header.duration_ms, root.duration_ms)
+
+    def test_json_lines_file_is_rotated(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "traces.jsonl")
+        with override_settings(TRACING={**settings.TRACING, "FILE": path, "MAX_BYTES": 2000, "BACKUP_COUNT": 1}):
+            exporter = tracing.JsonLinesExporter()
+            for _ in range(50):
+                root = tracing.Span([], "t" * 32, None, "request", {"path": "/x/"})
+                root.finish()
+                exporter.export(root.trace)
+
+        own = os.path.basename(process_path(path))
+        self.assertEqual(sorted(os.listdir(directory.name)), [own, f"{own}.1"])
+        self.assertLessEqual(os.path.getsize(process_path(path)), 2000)
+
+    def test_show_traces_reads_every_process_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "traces.jsonl")
+        for pid, (trace_id, view) in enumerate([("a" * 32, "first_view"), ("b" * 32, "second_view")], 1):
+            root = tracing.Span([], trace_id, None, "request", {"method": "GET", "path": "/x/", "view": view})
+            root.finish()
+            with open(process_path(path, pid=pid), "w") as out:
+                out.write(json.dumps(root.to_dict()) + "\n")
+
+        out = io.StringIO()
+        call_command("show_traces", file=path, stdout=out)
+        self.assertIn("first_view", out.getvalue())
+        self.assertIn("second_view", out.getvalue())
+
+
+class BenchmarkCoverageTests(SimpleTestCase):
+
+    def test_every_named_url_has_a_scenario(self):
+        self.assertEqual(missing_scenarios(), [])
+
+    def test_missing_baseline_fails(self):
+        with self.assertRaisesMessage(CommandError, "No baseline at missing.json"):
+            call_command("benchmark_views", baseline="missing.json")
+
+
+class StaticAssetTests(TestCase):
+
+    def test_pages_link_shared_css_and_html_is_compressed(self):
+        plain = self.client.get(reverse("login"))
+        self.assertContains(plain, "/static/accounts/css/auth")
+        self.assertNotContains(plain, "<style>")
+
+        response = self.client.get(reverse("login"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn(b"accounts/css/auth", gzip.decompress(response.content))
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def make_pool(self, **kwargs):
+        return ConnectionPool(lambda: sqlite3.connect(":memory:", check_same_thread=False), **kwargs)
+
+    def test_returned_connection_is_reused(self):
+        pool = self.make_pool()
+        first = pool.getconn()
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+        self.assertEqual(pool.stats()["connects"], 1)
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_exhausted_pool_times_out(self):
+        pool = self.make_pool(max_size=1, timeout=0.05)
+        pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()["timeouts"], 1)
+
+    def test_waiter_gets_released_connection(self):
+        pool = self.make_pool(max_size=1, timeout=5)
+        held = pool.getconn()
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+        waiter.start()
+        while pool.stats()["waiting"] == 0:
+            clock.sleep(0.001)
+        pool.putconn(held)
+        waiter.join()
+        self.assertIs(got[0], held)
+        self.assertGreater(pool.stats()["checkout_ms_max"], 0)
+
+    def test_dead_idle_connection_is_replaced(self):
+        pool = self.make_pool(check_idle=0)
+        dead = pool.getconn()
+        pool.putconn(dead)
+        dead.close()
+        self.assertIsNot(pool.getconn(), dead)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tier = TieredCache(prefix="test", local_ttl=0)
+
+    def test_fresh_value_is_computed_once(self):
+        calls = []
+        for _ in range(3):
+            value = self.tier.get_or_set("k", lambda: calls.append(1) or len(calls), ttl=60)
+        self.assertEqual((value, len(calls)), (1, 1))
+
+    def test_stale_value_served_while_another_worker_revalidates(self):
+        self.tier.get_or_set("k", lambda: "old", ttl=-1, stale_ttl=60)
+        # Another worker holds the revalidation lock
+        cache.add("test-lock:k", "other", 30)
+
+        self.assertEqual(self.tier.get_or_set("k", lambda: "new", ttl=60, stale_ttl=60), "old")
+
+        cache.delete("test-lock:k")
+        self.assertEqual(self.tier.get_or_set("k", lambda: "new", ttl=60, stale_ttl=60), "new")
@@ -0,0 +1,197 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Login throttle. Every failed login costs a full password hash, so a
+# credential-stuffing burst can eat all worker CPU; attempts over the limit
+# are turned away before authenticate() runs.
+#
+# Failed logins are charged to a token bucket per username and, with
+# IP["ENABLED"], one per client IP (settings.LOGIN_THROTTLE); successful
+# logins cost nothing. Each attempt takes a token from its buckets before
+# authenticate() runs and a successful login hands them back, so a burst
+# of parallel attempts can't all pass before the first failure is counted.
+# The in-process tier answers without leaving the worker. With SHARED on,
+# tokens are also taken in the Django cache so the limit holds across
+# workers: there a bucket is a counter per refill window (atomic incr),
+# i.e. a bucket that refills all at once.
+#
+# Behind a load balancer REMOTE_ADDR is the balancer's; CLIENT_IP_HEADER
+# names the header it puts the client address in.
+
+
+class LocalBuckets:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def _refill(self, key, burst, per_second, now):
+        tokens, updated_at = self._buckets.pop(key, (burst, now))
+        return min(burst, tokens + (now - updated_at) * per_second)
+
+    def _store(self, key, tokens, now):
+        # Least recently used buckets go first; they are the fullest
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+
+    def take(self, key, burst, per_second):
+        """Take a token and return 0, or return the seconds until there is one."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = self._refill(key, burst, per_second, now)
+            if tokens >= 1:
+                self._store(key, tokens - 1, now)
+                return 0
+            self._store(key, tokens, now)
+        return (1 - tokens) / per_second
+
+    def give(self, key, burst, per_second):
+        """Hand back a token taken by take()."""
+        now = time.monotonic()
+        with self._lock:
+            self._store(key, min(burst, self._refill(key, burst, per_second, now) + 1), now)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def _window(burst, per_second):
+    return math.ceil(burst / per_second)
+
+
+def _shared_key(key):
+    return f"login-throttle:{key}"
+
+
+def _shared_take(key, burst, per_second):
+    window = _window(burst, per_second)
+    cache.add(_shared_key(key), 0, window)
+    try:
+        count = cache.incr(_shared_key(key))
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(_shared_key(key), 1, window)
+        count = 1
+    if count <= burst:
+        return 0
+    # Over the limit: the attempt is turned away and takes nothing
+    _shared_give(key)
+    return window
+
+
+def _shared_give(key):
+    try:
+        # Not below zero if the window expired and a new one started
+        if cache.get(_shared_key(key), 0) > 0:
+            cache.decr(_shared_key(key))
+    except ValueError:
+        pass
+
+
+def client_ip(request):
+    config = settings.LOGIN_THROTTLE
+    header = config["CLIENT_IP_HEADER"]
+    if header:
+        # X-Forwarded-For style: "client, proxy1, ...". The last
+        # TRUSTED_PROXIES entries were added by our own proxies; anything
+        # before them is whatever the client sent.
+        addresses = [address.strip() for address in request.META.get(header, "").split(",") if address.strip()]
+        if addresses:
+            return addresses[max(len(addresses) - config["TRUSTED_PROXIES"], 0)]
+    return request.META.get("REMOTE_ADDR", "")
+
+
+class LoginThrottle:
+    def __init__(self):
+        self.local = LocalBuckets()
+        self._counters = Counter()
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _buckets(self, request, username, config):
+        scopes = [("username", username.strip().lower()[:150])]
+        if config["IP"]["ENABLED"]:
+            scopes.insert(0, ("ip", client_ip(request)))
+        for scope, value in scopes:
+            limits = config[scope.upper()]
+            yield scope, f"{scope}:{value}", limits["BURST"], limits["PER_MINUTE"] / 60
+
+    def check(self, request, username):
+        """
+        Returns 0 if the attempt may go to authenticate(), else Retry-After
+        seconds. An allowed attempt holds a token of each of its buckets
+        until succeeded() hands them back; failed() keeps them spent.
+        """
+        config = settings.LOGIN_THROTTLE
+        if not config["ENABLED"]:
+            return 0
+
+        taken = []
+        for scope, key, burst, per_second in self._buckets(request, username, config):
+            wait = self.local.take(key, burst, per_second)
+            tier = "local"
+            if not wait and config["SHARED"]:
+                wait = _shared_take(key, burst, per_second)
+                tier = "shared"
+                if wait:
+                    self.local.give(key, burst, per_second)
+            if wait:
+                self._give(taken, config)
+                self._count(f"rejected_{scope}_{tier}")
+                return math.ceil(wait)
+            taken.append((key, burst, per_second))
+
+        self._count("allowed")
+        return 0
+
+    def _give(self, buckets, config):
+        for key, burst, per_second in buckets:
+            self.local.give(key, burst, per_second)
+            if config["SHARED"]:
+                _shared_give(key)
+
+    def succeeded(self, request, username):
+        """Hand back the tokens check() took for a successful login."""
+        config = settings.LOGIN_THROTTLE
+        if not config["ENABLED"]:
+            return
+        self._give([bucket for _, *bucket in self._buckets(request, username, config)], config)
+
+    def failed(self, request, username):
+        """A failed authenticate(): the tokens check() took stay spent."""
+        if settings.LOGIN_THROTTLE["ENABLED"]:
+            self._count("failed")
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "allowed": counters.get("allowed", 0),
+            "failed": counters.get("failed", 0),
+            "rejected": {
+                f"{scope}_{tier}": counters.get(f"rejected_{scope}_{tier}", 0)
+                for scope in ("ip", "username") for tier in ("local", "shared")
+            },
+            "tracked_buckets": len(self.local),
+        }
+
+    def reset(self):
+        self.local.clear()
+        with self._lock:
+            self._counters.clear()
+
+
+login_throttle = LoginThrottle()
@@ -0,0 +1,169 @@
+import functools
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+# Two-tier cache for hot, shared data (provider directory, dashboards):
+#
+#   1. a bounded in-process LRU with a short TTL, so repeated reads inside
+#      one worker never leave the process;
+#   2. the shared Django cache backend (settings.CACHES), where values are
+#      stored with a "fresh until" stamp and kept a little longer so they
+#      can be served stale while one worker recomputes them.
+#
+# Only the worker that wins the shared lock recomputes an expired key
+# (single-flight); everyone else gets the stale value, or waits briefly for
+# the winner when there is nothing to serve yet.
+
+_MISSING = object()
+
+
+class LocalLRU:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    def __init__(self, alias="default", prefix="tiered", local_entries=1024, local_ttl=5,
+                 lock_timeout=30, wait_timeout=2.0, poll_interval=0.05):
+        self.alias = alias
+        self.prefix = prefix
+        self.local = LocalLRU(local_entries)
+        self.local_ttl = local_ttl
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        return f"{self.prefix}:{key}"
+
+    def _lock_key(self, key):
+        return f"{self.prefix}-lock:{key}"
+
+    def _store(self, key, value, ttl, stale_ttl):
+        self.shared.set(
+            self._key(key),
+            {"value": value, "fresh_until": time.time() + ttl},
+            ttl + stale_ttl
+        )
+        self.local.set(key, value, min(self.local_ttl, ttl))
+
+    def _acquire(self, key):
+        token = uuid.uuid4().hex
+        if self.shared.add(self._lock_key(key), token, self.lock_timeout):
+            return token
+        return None
+
+    def _release(self, key, token):
+        # Don't drop a lock that timed out and was taken by someone else
+        if self.shared.get(self._lock_key(key)) == token:
+            self.shared.delete(self._lock_key(key))
+
+    def _recompute(self, key, compute, ttl, stale_ttl, token):
+        try:
+            value = compute()
+            self._store(key, value, ttl, stale_ttl)
+            return value
+        finally:
+            self._release(key, token)
+
+    def get_or_set(self, key, compute, ttl, stale_ttl=0):
+        value = self.local.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        envelope = self.shared.get(self._key(key))
+        if envelope is not None:
+            remaining = envelope["fresh_until"] - time.time()
+            if remaining > 0:
+                self.local.set(key, envelope["value"], min(self.local_ttl, remaining))
+                return envelope["value"]
+
+            # Stale: one worker revalidates, the rest keep serving it
+            token = self._acquire(key)
+            if token is None:
+                return envelope["value"]
+            return self._recompute(key, compute, ttl, stale_ttl, token)
+
+        token = self._acquire(key)
+        if token is not None:
+            return self._recompute(key, compute, ttl, stale_ttl, token)
+
+        # Someone else is computing a cold key; wait for their result
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            envelope = self.shared.get(self._key(key))
+            if envelope is not None:
+                return envelope["value"]
+        return compute()
+
+    def delete(self, key):
+        # Other workers' local tiers catch up within local_ttl seconds
+        self.local.delete(key)
+        self.shared.delete(self._key(key))
+
+
+default_cache = TieredCache()
+
+
+def cached(key, ttl, stale_ttl=0, tier=None):
+    """
+    Cache a function's result in the tiered cache. ``key`` is a string or a
+    callable taking the function's arguments. The wrapper gets an
+    ``invalidate(*args, **kwargs)`` attribute.
+    """
+    tier = tier or default_cache
+
+    def decorator(func):
+        def make_key(*args, **kwargs):
+            return key(*args, **kwargs) if callable(key) else key
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return tier.get_or_set(
+                make_key(*args, **kwargs),
+                lambda: func(*args, **kwargs),
+                ttl,
+                stale_ttl
+            )
+
+        wrapper.invalidate = lambda *args, **kwargs: tier.delete(make_key(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,215 @@
+import contextvars
+import json
+import random
+import secrets
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.base import Template
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.module_loading import import_string
+
+from .instrumentation import ProcessLog, add_query_wrapper
+
+# Request tracing (settings.TRACING). A sampled request to an accounts view
+# gets a trace: a root "request" span with child spans for
+#
+#   role checks (accounts.decorators), every SQL query and every template
+#   render, {% include %}d ones too, nested under the template that
+#   included them.
+#
+# Spans carry their parent's id, a start time and a duration. The current
+# span is a contextvar, so queries run through sync_to_async() still find
+# their parent. When the request span ends, the whole trace is handed to the
+# EXPORTER (JsonLinesExporter or InMemoryExporter, or any class with an
+# export(spans) method). `manage.py show_traces` prints a file as trees.
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+
+class Span:
+    __slots__ = ("trace", "trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration_ms", "_started")
+
+    def __init__(self, trace, trace_id, parent_id, name, attributes):
+        self.trace = trace  # finished spans of the trace, shared with the root
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        if len(self.trace) < settings.TRACING["MAX_SPANS"]:
+            self.trace.append(self)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """A child of the current span; does nothing outside a traced request."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, parent.trace_id, parent.span_id, name, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        _current.reset(token)
+        child.finish()
+
+
+# ---------------------------
+# Exporters
+# ---------------------------
+
+class JsonLinesExporter:
+    """
+    One JSON object per span, to this process's file for TRACING["FILE"]
+    (accounts.instrumentation.ProcessLog), rotated at MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.log = ProcessLog(f"{__name__}.export")
+
+    def export(self, spans):
+        config = settings.TRACING
+        for span in spans:
+            line = json.dumps(span.to_dict(), default=str)
+            self.log.write(line, config["FILE"], config["MAX_BYTES"], config["BACKUP_COUNT"])
+
+
+class InMemoryExporter:
+    """Keeps exported spans in .spans, for tests."""
+
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+    def clear(self):
+        self.spans.clear()
+
+
+_exporters = {}
+
+
+def get_exporter():
+    path = settings.TRACING["EXPORTER"]
+    exporter = _exporters.get(path)
+    if exporter is None:
+        exporter = _exporters[path] = import_string(path)()
+    return exporter
+
+
+# ---------------------------
+# Instrumentation
+# ---------------------------
+
+def _trace_query(execute, sql, params, many, context):
+    if _current.get() is None:
+        return execute(sql, params, many, context)
+    # Placeholders only; parameter values are patient data
+    with span("db.query", sql=sql[:500], many=many, alias=context["connection"].alias):
+        return execute(sql, params, many, context)
+
+
+_render = Template.render
+
+
+def _traced_render(self, context):
+    # The engine-level Template: render() and {% include %} both end here
+    if _current.get() is None:
+        return _render(self, context)
+    with span("template.render", template=self.origin.template_name or self.name):
+        return _render(self, context)
+
+
+_installed = False
+
+
+def install():
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    add_query_wrapper(_trace_query)
+    Template.render = _traced_render
+
+
+# ---------------------------
+# Middleware
+# ---------------------------
+
+def _start(request):
+    if random.random() >= settings.TRACING["SAMPLE_RATE"]:
+        return None, None
+    root = Span([], secrets.token_hex(16), None, "request", {"method": request.method, "path": request.path})
+    return root, _current.set(root)
+
+
+def _finish(request, response, root):
+    match = getattr(request, "resolver_match", None)
+    if match is None or not match.func.__module__.startswith("accounts."):
+        return  # not an accounts view: dropped
+    root.attributes["view"] = match.view_name
+    if response is not None:
+        root.attributes["status"] = response.status_code
+        response["X-Trace-Id"] = root.trace_id
+    root.finish()
+    if root not in root.trace:
+        root.trace.append(root)
+    get_exporter().export(root.trace)
+
+
+@sync_and_async_middleware
+def tracing_middleware(get_response):
+    if not settings.TRACING["ENABLED"]:
+        raise MiddlewareNotUsed
+    install()
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            root, token = _start(request)
+            if root is None:
+                return await get_response(request)
+            response = None
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+                _finish(request, response, root)
+            return response
+    else:
+        def middleware(request):
+            root, token = _start(request)
+            if root is None:
+                return get_response(request)
+            response = None
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+                _finish(request, response, root)
+            return response
+
+    return middleware
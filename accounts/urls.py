@@ -1,7 +1,11 @@
 from django.urls import path
-from . import views
+from . import api, health, metrics, views
 
 urlpatterns = [
+    path('healthz/', health.liveness, name='liveness'),
+    path('readyz/', health.readiness, name='readiness'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+
     path('signup/', views.patient_signup, name='signup'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -12,16 +16,20 @@ urlpatterns = [
 
     path('providers/', views.provider_list, name='provider_list'),
     path('providers/add/', views.provider_add, name='provider_add'),
+    path('providers/bulk-add/', views.provider_bulk_add, name='provider_bulk_add'),
     path('providers/update/<int:user_id>/', views.provider_update, name='provider_update'),
     path('providers/delete/<int:user_id>/', views.provider_delete, name='provider_delete'),
 
     # Patient Appointment URLs
     path('appointments/', views.appointment_list, name='appointment_list'),
     path('appointments/add/', views.appointment_add, name='appointment_add'),
+    path('appointments/slots/', views.appointment_slots, name='appointment_slots'),
     path('appointments/reschedule/<int:appointment_id>/', views.appointment_reschedule, name='appointment_reschedule'),
     path('appointments/delete/<int:appointment_id>/', views.appointment_delete, name='appointment_delete'),
 
     path('provider/appointments/', views.provider_appointments, name='provider_appointments'),
+    path('provider/appointments/export/', views.provider_export_appointments, name='provider_export_appointments'),
+    path('provider/appointments/bulk/', views.provider_bulk_decide, name='provider_bulk_decide'),
 
     path('provider/appointment/<int:appt_id>/approve/', views.approve_appointment, name='approve_appointment'),
 
@@ -37,6 +45,15 @@ urlpatterns = [
 
     path("admin-dashboard/profile/", views.admin_profile, name="admin_profile"),
     path("admin-dashboard/change-password/", views.admin_change_password, name="admin_change_password"),
+    path("admin-dashboard/db-pool/", views.admin_db_pool, name="admin_db_pool"),
+    path("admin-dashboard/login-throttle/", views.admin_login_throttle, name="admin_login_throttle"),
+    path("admin-dashboard/slow-queries/", views.admin_slow_queries, name="admin_slow_queries"),
+    path("admin-dashboard/appointments/export/", views.admin_export_appointments, name="admin_export_appointments"),
+
+    # JSON API (polled by kiosk/mobile clients)
+    path("api/appointments/", api.patient_appointments, name="api_patient_appointments"),
+    path("api/provider/appointments/", api.provider_appointments, name="api_provider_appointments"),
+    path("api/provider/calendar/<int:year>/<int:month>/", api.provider_month, name="api_provider_month"),
 
 
 
@@ -4,21 +4,41 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.contrib.auth.hashers import make_password
-from django.db import models
-
+from asgiref.sync import sync_to_async
+from django.db import connections, models
+from django.conf import settings
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from . import occupancy, slots
 from .forms import PatientSignupForm
-from .decorators import role_required
+from .pagination import apaginate
+from .schedule_cache import acached_fragment
+from .directory import provider_directory
+from .calendars import abuild_months, shift_month
+from . import exports, onboarding, slow_queries
+from clinic_appointment.db.pool import pool_stats
+from .throttle import login_throttle
+from .booking import (
+    BookingConflict, book_appointment, reschedule_appointment, decide_appointments,
+    approve_appointment as approve_booking
+)
+from .decorators import async_role_required, role_required
 from .models import User, Appointment
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from django.utils import timezone
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from django.utils import timezone
 from datetime import datetime, date as dt_date
 from .models import Appointment, User
 from django.contrib import messages
 from .decorators import role_required
 import calendar
+import io
+from collections import Counter
+from itertools import islice
 from datetime import date, datetime
 from django.urls import reverse
 
@@ -62,9 +82,20 @@ def login_view(request):
         username = request.POST['username']
         password = request.POST['password']
 
+        # Before authenticate(): each attempt costs a full password hash.
+        # Every attempt takes from the allowance; successes give it back.
+        retry_after = login_throttle.check(request, username)
+        if retry_after:
+            response = render(request, 'accounts/login.html', {
+                'error': f'Too many login attempts. Try again in {retry_after} seconds.'
+            }, status=429)
+            response['Retry-After'] = str(retry_after)
+            return response
+
         user = authenticate(request, username=username, password=password)
 
         if user:
+            login_throttle.succeeded(request, username)
             login(request, user)
 
             # Redirect based on role
@@ -74,6 +105,8 @@ def login_view(request):
                 return redirect('provider_dashboard')
             elif user.role == 'patient':
                 return redirect('patient_dashboard')
+        else:
+            login_throttle.failed(request, username)
 
         return render(request, 'accounts/login.html', {'error': 'Invalid credentials'})
 
@@ -89,18 +122,21 @@ def logout_view(request):
 # Dashboard Views
 # ---------------------------
 
-@role_required('admin')
-def admin_dashboard(request):
-    return render(request, 'accounts/admin_home.html')
+@async_role_required('admin')
+async def admin_dashboard(request):
+    return render(request, 'accounts/admin_home.html', {
+        'providers': await sync_to_async(provider_directory)(),
+        'statuses': Appointment.STATUS_CHOICES,
+    })
 
 
-@role_required('patient')
-def patient_dashboard(request):
+@async_role_required('patient')
+async def patient_dashboard(request):
     return render(request, 'accounts/patient_home.html')
 
 
-@role_required('provider')
-def provider_dashboard(request):
+@async_role_required('provider')
+async def provider_dashboard(request):
     return render(request, 'accounts/provider_home.html')
 
 
@@ -110,7 +146,7 @@ def provider_dashboard(request):
 
 @role_required('admin')
 def provider_list(request):
-    providers = User.objects.filter(role='provider')
+    providers = provider_directory()
     return render(request, 'accounts/provider_list.html', {'providers': providers})
 
 
@@ -142,6 +178,35 @@ def provider_add(request):
     return render(request, 'accounts/provider_add.html')
 
 
+@role_required('admin')
+def provider_bulk_add(request):
+    limit = settings.PROVIDER_UPLOAD_MAX_ROWS
+    context = {"fields": onboarding.FIELDS, "max_rows": limit}
+
+    if request.method == 'POST':
+        upload = request.FILES.get("file")
+        if upload is None:
+            context["error"] = "Choose a CSV or JSONL file to upload."
+        else:
+            fmt = "jsonl" if upload.name.endswith((".jsonl", ".ndjson")) else "csv"
+            source = io.TextIOWrapper(upload.file, encoding="utf-8", newline="")
+            try:
+                rows = list(islice(onboarding.read_rows(source, fmt), limit + 1))
+                if len(rows) > limit:
+                    context["error"] = (
+                        f"Upload at most {limit} providers at a time; "
+                        "import larger files with `manage.py onboard_providers`."
+                    )
+                else:
+                    # Hashed in this worker: a file this small isn't worth a process pool
+                    context["run"] = onboarding.Onboarding().feed(rows)
+            except ValueError as e:
+                # Missing CSV columns or a file that isn't UTF-8 text
+                context["error"] = str(e)
+
+    return render(request, 'accounts/provider_bulk_add.html', context)
+
+
 @role_required('admin')
 def provider_update(request, user_id):
     provider = User.objects.get(id=user_id, role='provider')
@@ -177,18 +242,44 @@ def provider_delete(request, user_id):
 # Patient — Appointment System
 # ---------------------------
 
-@role_required('patient')
-def appointment_list(request):
+@async_role_required('patient')
+async def appointment_list(request):
+    now = timezone.localtime()
+    today = now.date()
+    current_time = now.time()
+
     appointments = Appointment.objects.filter(
         patient=request.user
-    ).order_by("date", "start_time")
+    ).select_related("provider").only(
+        "date", "start_time", "end_time", "reason", "status",
+        "provider__first_name", "provider__last_name", "provider__designation"
+    )
+
+    # Upcoming (soonest first) and past (latest first), each paginated by cursor
+    upcoming = await apaginate(
+        appointments.filter(
+            models.Q(date__gt=today) |
+            models.Q(date=today, end_time__gte=current_time)
+        ),
+        request.GET, "upcoming", keep=("past",)
+    )
+    past = await apaginate(
+        appointments.filter(
+            models.Q(date__lt=today) |
+            models.Q(date=today, end_time__lt=current_time)
+        ),
+        request.GET, "past", descending=True, keep=("upcoming",)
+    )
 
-    return render(request, 'accounts/appointment_list.html', {"appointments": appointments})
+    return render(request, 'accounts/appointment_list.html', {
+        "upcoming": upcoming,
+        "past": past,
+    })
 
 
 @role_required('patient')
 def appointment_add(request):
-    providers = User.objects.filter(role='provider')
+    providers = provider_directory()
 
     if request.method == 'POST':
         provider_id = request.POST['provider']
@@ -242,36 +333,20 @@ def appointment_add(request):
                 "popup": "❌ End time must be AFTER start time."
             })
 
+        provider = User.objects.get(id=provider_id)
+
         # -----------------------------
-        # Check for patient conflict
+        # Create appointment (patient conflicts rejected atomically)
         # -----------------------------
-        conflict = Appointment.objects.filter(
-            patient=request.user,
-            date=appt_date,
-            start_time__lt=end_time_obj,
-            end_time__gt=start_time_obj
-        ).exists()
-
-        if conflict:
+        try:
+            book_appointment(request.user, provider, appt_date, start_time_obj, end_time_obj, reason)
+        except BookingConflict:
             return render(request, 'accounts/appointment_add.html', {
                 "providers": providers,
                 "today": today.isoformat(),
                 "popup": "❌ You already have an appointment during this time range."
             })
 
-        provider = User.objects.get(id=provider_id)
-
-        # Create appointment
-        Appointment.objects.create(
-            patient=request.user,
-            provider=provider,
-            date=appt_date,
-            start_time=start_time_obj,
-            end_time=end_time_obj,
-            reason=reason,
-            status='pending'
-        )
-
         # SUCCESS POPUP — then redirect
         return render(request, 'accounts/appointment_add.html', {
             "providers": providers,
@@ -286,6 +361,43 @@ def appointment_add(request):
     })
 
 
+@role_required('patient')
+def appointment_slots(request):
+    # JSON: earliest free slots across providers, used by appointment_add
+    today = timezone.localtime().date()
+
+    try:
+        date_from = datetime.strptime(request.GET.get("date_from", today.isoformat()), "%Y-%m-%d").date()
+        date_to = datetime.strptime(
+            request.GET.get("date_to", (max(date_from, today) + timedelta(days=6)).isoformat()), "%Y-%m-%d"
+        ).date()
+        duration = int(request.GET.get("duration", 30))
+        limit = min(int(request.GET.get("limit", 10)), 50)
+    except ValueError:
+        return JsonResponse({"error": "Invalid date, duration or limit."}, status=400)
+
+    date_from = max(date_from, today)
+    if not 1 <= (date_to - date_from).days + 1 <= slots.MAX_WINDOW_DAYS:
+        return JsonResponse({
+            "error": f"Date window must be 1 to {slots.MAX_WINDOW_DAYS} days, starting today or later."
+        }, status=400)
+    if duration < 5:
+        return JsonResponse({"error": "Duration must be at least 5 minutes."}, status=400)
+    if limit < 1:
+        return JsonResponse({"error": "Limit must be at least 1."}, status=400)
+
+    found = slots.find_free_slots(
+        request.user,
+        date_from,
+        date_to,
+        duration,
+        designation=request.GET.get("designation") or None,
+        limit=limit,
+        now=timezone.localtime()
+    )
+    return JsonResponse({"slots": found})
+
+
 @role_required('patient')
 def appointment_reschedule(request, appointment_id):
     appointment = Appointment.objects.get(id=appointment_id, patient=request.user)
@@ -325,24 +437,13 @@ def appointment_reschedule(request, appointment_id):
             context["error"] = "endbeforestart"
             return render(request, 'accounts/appointment_update.html', context)
 
-        conflict = Appointment.objects.filter(
-            patient=request.user,
-            date=new_date,
-            start_time__lt=new_end,
-            end_time__gt=new_start
-        ).exclude(id=appointment.id).exists()
-
-        if conflict:
+        # Save reschedule request (patient conflicts rejected atomically)
+        try:
+            reschedule_appointment(appointment, new_date, new_start, new_end)
+        except BookingConflict:
             context["error"] = "conflict"
             return render(request, 'accounts/appointment_update.html', context)
 
-        # Save reschedule request
-        appointment.date = new_date
-        appointment.start_time = new_start
-        appointment.end_time = new_end
-        appointment.status = "reschedule_requested"
-        appointment.save()
-
         context["success"] = True
         return render(request, 'accounts/appointment_update.html', context)
 
@@ -367,56 +468,103 @@ def patient_change_password(request):
 
     return render(request, "accounts/patient_change_password.html", {"form": form})
 
-@role_required('provider')
-def provider_appointments(request):
+@async_role_required('provider')
+async def provider_appointments(request):
     now = timezone.localtime()
     today = now.date()
     current_time = now.time()
 
-    # UPCOMING: future OR ongoing today
-    upcoming = Appointment.objects.filter(
+    # Only the columns the template renders, patient joined in
+    appointments = Appointment.objects.filter(
         provider=request.user
-    ).filter(
-        models.Q(date__gt=today) |
-        models.Q(date=today, end_time__gte=current_time)
-    ).order_by("date", "start_time")
+    ).select_related("patient").only(
+        "date", "start_time", "end_time", "reason", "status",
+        "patient__first_name", "patient__last_name"
+    )
 
-    # COMPLETED: past OR already finished today
-    completed = Appointment.objects.filter(
-        provider=request.user
-    ).filter(
-        models.Q(date__lt=today) |
-        models.Q(date=today, end_time__lt=current_time)
-    ).order_by("-date", "-start_time")
+    # UPCOMING: future OR ongoing today (soonest first)
+    upcoming = await apaginate(
+        appointments.filter(
+            models.Q(date__gt=today) |
+            models.Q(date=today, end_time__gte=current_time)
+        ),
+        request.GET, "upcoming", keep=("completed",)
+    )
+
+    # COMPLETED: past OR already finished today (latest first)
+    completed = await apaginate(
+        appointments.filter(
+            models.Q(date__lt=today) |
+            models.Q(date=today, end_time__lt=current_time)
+        ),
+        request.GET, "completed", descending=True, keep=("upcoming",)
+    )
 
     return render(request, "accounts/provider_appointment_list.html", {
         "upcoming": upcoming,
         "completed": completed,
+        "statuses": Appointment.STATUS_CHOICES,
     })
 
 @role_required('provider')
 def approve_appointment(request, appt_id):
     appt = Appointment.objects.get(id=appt_id, provider=request.user)
 
-    # Check provider time conflict
-    conflict = Appointment.objects.filter(
-        provider=request.user,
-        date=appt.date,
-        start_time__lt=appt.end_time,
-        end_time__gt=appt.start_time,
-        status="approved"
-    ).exclude(id=appt.id).exists()
-
-    if conflict:
+    # Approve, unless it clashes with another approved appointment
+    try:
+        approve_booking(appt)
+    except BookingConflict:
         # Redirect with query parameter (NOT Django messages)
         return redirect('/provider/appointments/?clash=1')
 
-    # If no conflict → approve
-    appt.status = "approved"
-    appt.save()
-
     return redirect('/provider/appointments/?approved=1')
 
+BULK_OUTCOMES = {
+    "approved": "approved",
+    "rejected": "rejected",
+    "clash": "clashed",
+    "skipped": "already decided",
+    "not_found": "not found",
+}
+
+
+@role_required('provider')
+def provider_bulk_decide(request):
+    if request.method != "POST":
+        return redirect('provider_appointments')
+
+    action = request.POST.get("action")
+    if action not in ("approve", "reject"):
+        return HttpResponseBadRequest("Unknown action")
+
+    error = None
+    results = []
+    try:
+        if request.POST.get("scope") == "range":
+            date_from = datetime.strptime(request.POST["date_from"], "%Y-%m-%d").date()
+            date_to = datetime.strptime(request.POST["date_to"], "%Y-%m-%d").date()
+            results = decide_appointments(request.user, action, date_from=date_from, date_to=date_to)
+        else:
+            ids = [int(pk) for pk in request.POST.getlist("ids") if pk.isdigit()]
+            if ids:
+                results = decide_appointments(request.user, action, ids=ids)
+            else:
+                error = "Select at least one appointment."
+    except (KeyError, ValueError):
+        error = "Enter a valid date range."
+    except BookingConflict:
+        error = "Your schedule changed while approving. Nothing was saved, please try again."
+
+    return render(request, "accounts/provider_bulk_result.html", {
+        "action": action,
+        "results": results,
+        "summary": [
+            (outcome, total, BULK_OUTCOMES[outcome])
+            for outcome, total in Counter(outcome for _, outcome in results).items()
+        ],
+        "error": error,
+    })
+
 @role_required('provider')
 def reject_appointment(request, appt_id):
     appt = Appointment.objects.get(id=appt_id, provider=request.user)
@@ -461,63 +609,77 @@ def provider_change_password(request):
         "form": form
     })
 
-@role_required('provider')
-def provider_calendar(request):
+@async_role_required('provider')
+async def provider_calendar(request):
     today = date.today()
 
-    # Selected year/month from query params
+    # Selected year/month from query params; months=3 or 12 shows a range
     year = int(request.GET.get("year", today.year))
     month = int(request.GET.get("month", today.month))
+    months = int(request.GET.get("months", 1))
+    if months not in (1, 3, 12):
+        months = 1
 
     # Handle month overflow/underflow
-    if month < 1:
-        month = 12
-        year -= 1
-    elif month > 12:
-        month = 1
-        year += 1
+    year, month = shift_month(year, month, 0)
 
-    cal = calendar.Calendar()
-
-    # Get provider's appointments for that month
-    appointments = Appointment.objects.filter(
-        provider=request.user,
-        date__year=year,
-        date__month=month
-    )
+    prev_year, prev_month = shift_month(year, month, -months)
+    next_year, next_month = shift_month(year, month, months)
 
-    # Dictionary: "day" -> [appointments]
-    appointment_map = {}
-    for appt in appointments:
-        key = str(appt.date.day)  # string key for template
-        appointment_map.setdefault(key, []).append(appt)
+    # Month grid is cached per schedule version; only a miss hits the DB
+    async def render_grid():
+        return render_to_string("accounts/provider_calendar_grid.html", {
+            "months": months,
+            "calendar_months": await abuild_months(request.user, year, month, months, today),
+        })
 
-    # Calendar grid
-    month_days = cal.monthdayscalendar(year, month)
+    grid, hit = await acached_fragment("calendar", request.user.id, (year, month, months, today), render_grid)
 
-    return render(request, "accounts/provider_calendar.html", {
+    response = render(request, "accounts/provider_calendar.html", {
         "year": year,
         "month": month,
+        "months": months,
         "month_name": calendar.month_name[month],
-        "month_days": month_days,
-        "appointment_map": appointment_map,
+        "grid": mark_safe(grid),
+        "prev_year": prev_year,
+        "prev_month": prev_month,
+        "next_year": next_year,
+        "next_month": next_month,
         "today": today
     })
+    response["X-Fragment-Cache"] = "hit" if hit else "miss"
+    return response
+
+
+@async_role_required('provider')
+async def provider_calendar_day(request, year, month, day):
+    selected = date(year, month, day)
+
+    async def render_table():
+        appts = Appointment.objects.filter(
+            provider=request.user,
+            date=selected
+        ).select_related("patient").only(
+            "start_time", "end_time", "reason", "status",
+            "patient__username", "patient__first_name", "patient__last_name"
+        ).order_by("start_time")
+
+        return render_to_string("accounts/provider_calendar_day_table.html", {
+            "appts": [appt async for appt in appts],
+            # Free/busy shading straight from the occupancy bitmap
+            "timeline": await occupancy.ahourly_timeline(request.user.id, "provider", selected),
+        })
 
+    day_table, hit = await acached_fragment("calendar-day", request.user.id, (selected,), render_table)
 
-@role_required('provider')
-def provider_calendar_day(request, year, month, day):
-    appts = Appointment.objects.filter(
-        provider=request.user,
-        date=date(year, month, day)
-    ).order_by("start_time")
-
-    return render(request, "accounts/provider_calendar_day.html", {
-        "appts": appts,
+    response = render(request, "accounts/provider_calendar_day.html", {
+        "day_table": mark_safe(day_table),
         "day": day,
         "month": calendar.month_name[month],
         "year": year
     })
+    response["X-Fragment-Cache"] = "hit" if hit else "miss"
+    return response
 @role_required('patient')
 def patient_profile(request):
     patient = request.user
@@ -554,6 +716,37 @@ def admin_profile(request):
     })
 
 
+@role_required('admin')
+def admin_db_pool(request):
+    # Pool metrics of this worker process; null unless DB_POOL is on
+    stats = pool_stats()
+    return JsonResponse({
+        alias: {
+            "conn_max_age": connections[alias].settings_dict["CONN_MAX_AGE"],
+            "pool": stats.get(alias),
+        }
+        for alias in connections
+    })
+
+
+@role_required('admin')
+def admin_login_throttle(request):
+    # Allowed/rejected login attempts seen by this worker process
+    return JsonResponse(login_throttle.stats())
+
+
+@role_required('admin')
+def admin_slow_queries(request):
+    view = request.GET.get("view") or None
+    entries = slow_queries.recent_entries(view=view)
+    return render(request, "accounts/admin_slow_queries.html", {
+        "entries": entries,
+        "top": slow_queries.summarize(entries)[:10],
+        "view": view,
+        "config": settings.SLOW_QUERIES,
+    })
+
+
 @role_required('admin')
 def admin_change_password(request):
     if request.method == "POST":
@@ -569,3 +762,34 @@ def admin_change_password(request):
     return render(request, "accounts/admin_change_password.html", {
         "form": form
     })
+
+
+# ---------------------------
+# Appointment Export
+# ---------------------------
+
+def _export_appointments(request, filters, filename):
+    rows = exports.export_rows(filters)
+    if request.GET.get("format") == "xlsx":
+        return exports.xlsx_response(rows, filename)
+    return exports.csv_response(rows, filename)
+
+
+@role_required('admin')
+def admin_export_appointments(request):
+    try:
+        filters = exports.parse_filters(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid export filters")
+    return _export_appointments(request, filters, f"appointments-{dt_date.today():%Y%m%d}")
+
+
+@role_required('provider')
+def provider_export_appointments(request):
+    try:
+        filters = exports.parse_filters(request.GET)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid export filters")
+    # Providers only ever export their own schedule
+    filters["provider_id"] = request.user.id
+    return _export_appointments(request, filters, f"my-appointments-{dt_date.today():%Y%m%d}")
@@ -0,0 +1,63 @@
+import logging
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.template import engines
+from django.template.loader import get_template
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+# Per-process warm-up: the first request a fresh worker serves otherwise
+# pays for importing every view module, building the URL resolver,
+# compiling templates and opening the cache and database clients. Run from
+# gunicorn's post_worker_init hook (gunicorn.conf.py); the readiness
+# endpoint runs it itself under servers without that hook.
+
+_state = {"warm": False}
+
+
+def is_warm():
+    return _state["warm"]
+
+
+def _template_names():
+    dirs = [Path(d) for engine in engines.all() for d in getattr(engine, "template_dirs", ())]
+    dirs += [Path(app.path) / "templates" for app in apps.get_app_configs()]
+    for directory in dirs:
+        if directory.is_dir():
+            for path in directory.rglob("*.html"):
+                yield path.relative_to(directory).as_posix()
+
+
+def ping_database():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+def warm_up():
+    started = time.perf_counter()
+
+    # URL patterns (imports every view module) and the reverse lookup table
+    resolver = get_resolver()
+    resolver.reverse_dict
+
+    # Compiled into the cached template loader
+    compiled = 0
+    for name in set(_template_names()):
+        try:
+            get_template(name)
+            compiled += 1
+        except Exception:
+            logger.warning("Template %s failed to compile during warm-up", name, exc_info=True)
+
+    cache.get("warmup")
+    ping_database()
+    # Opened in this thread only; requests open their own
+    connection.close()
+
+    _state["warm"] = True
+    logger.info("Warm-up done in %.0f ms (%d templates)", (time.perf_counter() - started) * 1000, compiled)
@@ -0,0 +1,271 @@
+import os
+import threading
+import time
+from collections import deque
+
+# In-process connection pool shared by every DatabaseWrapper (thread) of a
+# worker. Django's own CONN_MAX_AGE keeps one connection per thread; with
+# the pool, a request hands its connection back when it finishes and the
+# next request, on any thread, checks out a warm one instead of connecting.
+#
+# Backends: clinic_appointment.db.postgresql (production) and
+# clinic_appointment.db.sqlite3 (local stand-in for tests).
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=0, max_size=10, timeout=5.0, check_idle=30.0):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (connection, returned_at), most recent last
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "discarded": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+        }
+
+    def _open(self):
+        connection = self._connect()
+        with self._cond:
+            self._stats["connects"] += 1
+        return connection
+
+    def _usable(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1")
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _drop(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def fill(self):
+        # Open up to min_size connections ahead of demand
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._open()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+
+    def getconn(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            connection = None
+            with self._cond:
+                while True:
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s "
+                            f"({self._size} open, all in use)"
+                        )
+                    self._waiting += 1
+                    self._cond.wait(remaining)
+                    self._waiting -= 1
+                self._in_use += 1
+
+            if connection is None:
+                try:
+                    connection = self._open()
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif time.monotonic() - returned_at > self.check_idle and not self._usable(connection):
+                # Idle long enough for the server or a proxy to drop it
+                self._drop(connection)
+                self._release_slot(discarded=True)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_total"] += waited
+                self._stats["wait_max"] = max(self._stats["wait_max"], waited)
+            return connection
+
+    def _release_slot(self, discarded=False):
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            if discarded:
+                self._stats["discarded"] += 1
+            self._cond.notify()
+
+    def putconn(self, connection, discard=False):
+        if discard:
+            self._drop(connection)
+            self._release_slot(discarded=True)
+            return
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for connection in idle:
+            self._drop(connection)
+
+    def stats(self):
+        with self._cond:
+            checkouts = self._stats["checkouts"]
+            return {
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waiting": self._waiting,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "checkouts": checkouts,
+                "timeouts": self._stats["timeouts"],
+                "connects": self._stats["connects"],
+                "discarded": self._stats["discarded"],
+                "checkout_ms_avg": round(self._stats["wait_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+                "checkout_ms_max": round(self._stats["wait_max"] * 1000, 3),
+            }
+
+
+# ---------------------------
+# Registry
+# ---------------------------
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def get_pool(key, factory):
+    global _pid
+    with _pools_lock:
+        if os.getpid() != _pid:
+            # Forked: connections belong to the parent, start over
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+    return pool
+
+
+def close_pools(alias=None):
+    with _pools_lock:
+        pools = [pool for (pool_alias, _), pool in _pools.items() if alias in (None, pool_alias)]
+    for pool in pools:
+        pool.close()
+
+
+def pool_stats():
+    # {alias: stats}, summed over the pools of an alias (one per database
+    # name, e.g. the test database)
+    with _pools_lock:
+        items = list(_pools.items())
+    stats = {}
+    for (alias, _), pool in items:
+        current = pool.stats()
+        if alias in stats:
+            for name, value in current.items():
+                if name == "checkout_ms_max":
+                    stats[alias][name] = max(stats[alias][name], value)
+                elif name != "checkout_ms_avg":
+                    stats[alias][name] += value
+        else:
+            stats[alias] = current
+    return stats
+
+
+# ---------------------------
+# Backend mixins
+# ---------------------------
+
+class PooledDatabaseWrapperMixin:
+    """
+    Mixed into a backend's DatabaseWrapper: new connections come from the
+    pool and close() gives them back. Settings come from the database's
+    "POOL" dict (MIN_SIZE, MAX_SIZE, TIMEOUT, CHECK_IDLE).
+    """
+
+    _pool = None
+
+    def _get_pool(self, conn_params):
+        options = self.settings_dict.get("POOL", {})
+        key = (self.alias, repr(sorted(conn_params.items(), key=lambda item: item[0])))
+        connect = super().get_new_connection
+
+        def factory():
+            pool = ConnectionPool(
+                lambda: connect(conn_params),
+                min_size=options.get("MIN_SIZE", 0),
+                max_size=options.get("MAX_SIZE", 10),
+                timeout=options.get("TIMEOUT", 5.0),
+                check_idle=options.get("CHECK_IDLE", 30.0),
+            )
+            pool.fill()
+            return pool
+
+        return get_pool(key, factory)
+
+    def get_new_connection(self, conn_params):
+        self._pool = self._get_pool(conn_params)
+        try:
+            return self._pool.getconn()
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Don't hand on an open transaction or a broken connection
+        try:
+            self.connection.rollback()
+            broken = False
+        except Exception:
+            broken = True
+        self._pool.putconn(self.connection, discard=broken)
+
+
+class PooledDatabaseCreationMixin:
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use
+        close_pools(self.connection.alias)
+        return super()._destroy_test_db(test_database_name, verbosity)
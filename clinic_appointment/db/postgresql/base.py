@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import base, creation
+
+from ..pool import PooledDatabaseCreationMixin, PooledDatabaseWrapperMixin
+
+
+class DatabaseCreation(PooledDatabaseCreationMixin, creation.DatabaseCreation):
+    pass
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    creation_class = DatabaseCreation
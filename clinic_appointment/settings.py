@@ -12,10 +12,15 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
+def env_flag(name, default="false"):
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
@@ -23,7 +28,8 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY =os.getenv("DJANGO_SECRET_KEY")
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+# Set DJANGO_DEBUG=false there; hashed static URLs are only used then.
+DEBUG = env_flag("DJANGO_DEBUG", "true")
 
 ALLOWED_HOSTS = ["*"]
 
@@ -42,6 +48,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Static files are answered here, before sessions/auth, from files
+    # compressed at collectstatic time
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # Outside GZip so response sizes are the compressed ones
+    'accounts.metrics.metrics_middleware',
+    'accounts.tracing.tracing_middleware',
+    'django.middleware.gzip.GZipMiddleware',
+    'accounts.slow_queries.slow_query_middleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,18 +93,131 @@ import os
 
 load_dotenv()
 
+# With DB_POOL (on in the Docker image) a request hands its connection back
+# to an in-process pool (clinic_appointment.db) when it finishes. Without
+# it every request opens and closes its own: under ASGI a request's
+# connection belongs to whichever thread ran it, so one kept open with
+# DB_CONN_MAX_AGE is seldom reused and only counts against max_connections.
+# Health checks test a kept connection before reuse.
+DB_POOL = env_flag("DB_POOL")
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'clinic_appointment.db.postgresql' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': os.getenv("DB_NAME"),
         'USER': os.getenv("DB_USER"),
         'PASSWORD': os.getenv("DB_PASSWORD"),
         'HOST': os.getenv("DB_HOST"),
         'PORT': os.getenv("DB_PORT"),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", 0)),
+        'CONN_HEALTH_CHECKS': env_flag("DB_CONN_HEALTH_CHECKS", "true"),
+        'POOL': {
+            'MIN_SIZE': int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+            'MAX_SIZE': int(os.getenv("DB_POOL_MAX_SIZE", 10)),
+            # Seconds to wait for a free connection before failing the request
+            'TIMEOUT': float(os.getenv("DB_POOL_TIMEOUT", 5)),
+            # Ping connections that sat idle longer than this before reuse
+            'CHECK_IDLE': float(os.getenv("DB_POOL_CHECK_IDLE", 30)),
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# locmem by default, which only suits a single process: sessions and the
+# auth cache below live here, and a logout or password change must reach
+# every worker. Point CACHE_BACKEND/CACHE_LOCATION at a shared backend
+# (Redis, Memcached, or FileBasedCache on one host) when running several
+# workers; gunicorn.conf.py refuses to start them on locmem, and the Docker
+# image uses Redis.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("CACHE_LOCATION", 'clinic-appointment'),
+        'TIMEOUT': 300,
     }
 }
 
+# Sessions are read from the cache and written through to the database;
+# request.user comes from a slim cached record (accounts.backends), so an
+# authenticated page normally costs no queries for either.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+AUTHENTICATION_BACKENDS = [
+    'accounts.backends.CachedModelBackend',
+]
+
+# Rows accepted per bulk provider upload (accounts.onboarding). Uploads
+# hash passwords in the web worker, about a third of a second each, so
+# larger files go through the onboard_providers command, which hashes
+# across a process pool.
+PROVIDER_UPLOAD_MAX_ROWS = int(os.getenv("PROVIDER_UPLOAD_MAX_ROWS", 50))
+
+# Failed logins allowed per username (and per client IP, when IP is
+# enabled) before login_view answers 429 without hashing the password
+# (accounts.throttle). Buckets live in each worker; LOGIN_THROTTLE_SHARED
+# also counts them in the cache so the limits hold across workers (needs a
+# shared CACHE_BACKEND). Behind a load balancer, set CLIENT_IP_HEADER (e.g.
+# HTTP_X_FORWARDED_FOR) and the number of proxies that append to it before
+# enabling the IP limit; otherwise every patient shares the balancer's IP.
+LOGIN_THROTTLE = {
+    'ENABLED': env_flag("LOGIN_THROTTLE", "true"),
+    'SHARED': env_flag("LOGIN_THROTTLE_SHARED"),
+    'CLIENT_IP_HEADER': os.getenv("LOGIN_THROTTLE_CLIENT_IP_HEADER", ""),
+    'TRUSTED_PROXIES': int(os.getenv("LOGIN_THROTTLE_TRUSTED_PROXIES", 1)),
+    'IP': {
+        'ENABLED': env_flag("LOGIN_THROTTLE_IP"),
+        'BURST': int(os.getenv("LOGIN_THROTTLE_IP_BURST", 30)),
+        'PER_MINUTE': float(os.getenv("LOGIN_THROTTLE_IP_PER_MINUTE", 30)),
+    },
+    'USERNAME': {
+        'BURST': int(os.getenv("LOGIN_THROTTLE_USERNAME_BURST", 5)),
+        'PER_MINUTE': float(os.getenv("LOGIN_THROTTLE_USERNAME_PER_MINUTE", 2)),
+    },
+}
+
+# Per-view metrics (accounts.metrics), served in Prometheus text format at
+# /metrics. Each worker writes its totals to DIR, which must be shared by
+# the workers of one instance. /metrics answers 404 until METRICS_TOKEN is
+# set, then requires it as a bearer token; METRICS_SERVER_TIMING adds a
+# Server-Timing header.
+METRICS = {
+    'ENABLED': env_flag("METRICS", "true"),
+    'DIR': os.getenv("METRICS_DIR", os.path.join(tempfile.gettempdir(), "clinic-metrics")),
+    'TOKEN': os.getenv("METRICS_TOKEN", ""),
+    'SERVER_TIMING': env_flag("METRICS_SERVER_TIMING"),
+}
+
+# Slow-query log (accounts.slow_queries): queries of accounts views slower
+# than THRESHOLD_MS are written as JSON lines, with a query plan for
+# EXPLAIN_SAMPLE_RATE of the SELECTs. Each worker writes its own file next
+# to LOG_FILE (slow_queries.<pid>.jsonl), rotated at MAX_BYTES with
+# BACKUP_COUNT old files kept. Browsable at /admin-dashboard/slow-queries/.
+SLOW_QUERIES = {
+    'ENABLED': env_flag("SLOW_QUERIES", "true"),
+    'THRESHOLD_MS': float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100)),
+    'EXPLAIN_SAMPLE_RATE': float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE_RATE", 0.1)),
+    'LOG_FILE': os.getenv("SLOW_QUERY_LOG_FILE", str(BASE_DIR / "logs" / "slow_queries.jsonl")),
+    'MAX_BYTES': int(os.getenv("SLOW_QUERY_LOG_MAX_BYTES", 10 * 1024 * 1024)),
+    'BACKUP_COUNT': int(os.getenv("SLOW_QUERY_LOG_BACKUP_COUNT", 3)),
+}
 
+# Request tracing (accounts.tracing): spans for the request, role checks,
+# SQL queries and template renders of SAMPLE_RATE of the accounts requests.
+# The default exporter writes them next to FILE, one file per worker
+# (traces.<pid>.jsonl), rotated at MAX_BYTES with BACKUP_COUNT old files
+# kept; `manage.py show_traces` reads them all.
+TRACING = {
+    'ENABLED': env_flag("TRACING"),
+    'SAMPLE_RATE': float(os.getenv("TRACING_SAMPLE_RATE", 1.0)),
+    'EXPORTER': os.getenv("TRACING_EXPORTER", "accounts.tracing.JsonLinesExporter"),
+    'FILE': os.getenv("TRACING_FILE", str(BASE_DIR / "logs" / "traces.jsonl")),
+    'MAX_BYTES': int(os.getenv("TRACING_MAX_BYTES", 50 * 1024 * 1024)),
+    'BACKUP_COUNT': int(os.getenv("TRACING_BACKUP_COUNT", 3)),
+    'MAX_SPANS': int(os.getenv("TRACING_MAX_SPANS", 2000)),
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -127,6 +254,19 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/4.2/howto/static-files/
 
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# collectstatic writes content-hashed copies plus .gz/.br variants;
+# WhiteNoise serves the hashed names with a far-future, immutable
+# Cache-Control and picks the variant the client accepts.
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "clinic_appointment.storage.StaticFilesStorage",
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
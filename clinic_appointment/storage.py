@@ -0,0 +1,14 @@
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Hashed, pre-compressed static files. Until collectstatic has written a
+    manifest (tests, a fresh checkout) URLs fall back to the plain names
+    instead of failing the page render.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
@@ -0,0 +1,69 @@
+# Gunicorn serving clinic_appointment.asgi with uvicorn workers:
+#
+#   gunicorn clinic_appointment.asgi:application -c gunicorn.conf.py
+#
+# Each worker runs one event loop. The async read views (appointment lists,
+# calendars, dashboards) wait on the database without holding a thread, so
+# one worker serves many slow clients at once. Sync views still work: Django
+# runs them in the worker's sync thread, one at a time per worker, which is
+# why there is more than one worker.
+
+import multiprocessing
+import os
+import sys
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn_worker.UvicornWorker"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+
+# Import Django and the project once in the master; workers fork from it
+preload_app = True
+
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 2000))
+max_requests_jitter = 200
+
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    # Sessions and cached users must be shared by the workers: on locmem a
+    # logout or password change would only reach the worker that handled it
+    from django.conf import settings
+    if server.cfg.workers > 1 and settings.CACHES["default"]["BACKEND"].endswith(".LocMemCache"):
+        sys.exit(
+            f"{server.cfg.workers} workers can't share LocMemCache; set CACHE_BACKEND and "
+            "CACHE_LOCATION to a shared cache (e.g. Redis) or WEB_CONCURRENCY=1"
+        )
+
+    # Per-worker metric files from the previous run
+    from accounts.metrics import reset_directory
+    reset_directory()
+
+
+def post_worker_init(worker):
+    # Warm up before the worker accepts connections, so /readyz/ and the
+    # first real requests are served by a ready process
+    from accounts.warmup import warm_up
+    warm_up()
+
+
+def worker_exit(server, worker):
+    # Last totals of a recycled worker, before the master folds its file
+    from django.conf import settings
+    from accounts.metrics import registry
+    if settings.METRICS["ENABLED"]:
+        registry.flush(settings.METRICS["DIR"], force=True)
+
+
+def child_exit(server, worker):
+    from django.conf import settings
+    from accounts.metrics import fold_workers
+    if settings.METRICS["ENABLED"]:
+        fold_workers(settings.METRICS["DIR"], {worker.pid})